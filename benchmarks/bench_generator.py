@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+"""
+*Module* ``benchmarks.bench_generator``
+
+This module measures the performance of :mod:`project.generator` on synthetic
+item sets: :meth:`DataGenerator.generate_items`, :meth:`DataGenerator.generate_tuples`,
+:meth:`DataGenerator.generate_batches`, :meth:`ScoreGenerator.scoring` and, if NumPy
+is installed, :func:`numpy_scoring`.
+
+For each step it reports the wall time and the peak memory traced by
+:mod:`tracemalloc`, for the tuples also the quality of the design: the standard
+deviation of pair frequencies and the spread of item frequencies. Results can
+be saved as JSON baseline and compared against later runs.
+
+Examples:
+        Run from the root of the repository::
+
+                python -m benchmarks.bench_generator --sizes 10 100 1000 --save baseline.json
+                python -m benchmarks.bench_generator --sizes 10 100 1000 --compare baseline.json
+
+Note:
+        Tracing memory slows down the measured code, times are only comparable
+        between runs with the same options. Memory of worker processes is not traced.
+
+"""
+
+import sys
+import json
+import time
+import argparse
+import platform
+import tracemalloc
+from io import BytesIO
+from random import Random
+from itertools import chain
+from collections import Counter
+from project.generator import DataGenerator, ScoreGenerator, PairBalance, numpy_scoring, np
+
+DEFAULT_SIZES = [10, 100, 1000, 10000, 100000]
+
+# number of simulated annotations of each tuple to benchmark the scoring
+N_ANNOTATIONS = 5
+
+
+def measure(func, memory=True):
+    """
+    Run a function and measure its wall time and peak memory.
+
+    Args:
+            func (callable): function without arguments
+            memory (bool, optional): whether to trace the peak memory, *default:* ``True``
+
+    Returns:
+            tuple(object, dict): result of the function and the measures
+            ``{'time': seconds, 'peak_memory': bytes}``
+    """
+    if memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+
+    peak = None
+    if memory:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return result, {"time": elapsed, "peak_memory": peak}
+
+
+def design_quality(tuples):
+    """
+    Measure how well balanced a design is.
+
+    Args:
+            tuples (list(list)): tuples of items
+
+    Returns:
+            dict: standard deviation of pair frequencies ``pair_stdev`` and difference between
+            the highest and the lowest item frequency ``item_frequency_spread``
+    """
+    ids = {item: i for i, item in enumerate(set(chain(*tuples)))}
+    balance = PairBalance(len(ids))
+    for tuple_ in tuples:
+        balance.add([ids[item] for item in tuple_])
+
+    frequencies = Counter(chain(*tuples)).values()
+    return {"pair_stdev": balance.stdev, "item_frequency_spread": max(frequencies) - min(frequencies)}
+
+
+def bench_size(n_items, engine="python", num_iter=5, seed=0, memory=True):
+    """
+    Benchmark all steps for a synthetic set of items.
+
+    Args:
+            n_items (int): number of items, at least 5
+            engine (str, optional): engine to generate tuples, *default:* ``python``
+            num_iter (int, optional): number of iterations to generate tuples, *default:* ``5``
+            seed (int, optional): seed for designs and annotations, *default:* ``0``
+            memory (bool, optional): whether to trace the peak memory, *default:* ``True``
+
+    Returns:
+            dict: measures of each step
+    """
+    upload = "\n".join("item %d" % i for i in range(n_items)).encode("utf-8")
+    data = DataGenerator(engine=engine, num_iter=num_iter, seed=seed)
+    results = {}
+
+    _, results["generate_items"] = measure(lambda: data.generate_items(BytesIO(upload)), memory)
+
+    _, results["generate_tuples"] = measure(data.generate_tuples, memory)
+    results["generate_tuples"].update(design_quality(data.tuples))
+
+    _, results["generate_batches"] = measure(data.generate_batches, memory)
+
+    # simulate annotations with random answers on item ids, as they are stored in the database
+    rng = Random(seed)
+    ids = {item: i for i, item in enumerate(sorted(data.items))}
+    tuples = [[ids[item] for item in tuple_] for tuple_ in data.tuples] * N_ANNOTATIONS
+    answers = [rng.sample(tuple_, 2) for tuple_ in tuples]
+    best, worst = [answer[0] for answer in answers], [answer[1] for answer in answers]
+
+    _, results["scoring"] = measure(lambda: ScoreGenerator(tuples, best, worst).scoring(), memory)
+    if np is not None:
+        _, results["scoring_numpy"] = measure(lambda: numpy_scoring(tuples, best, worst), memory)
+
+    return results
+
+
+def run(sizes=DEFAULT_SIZES, engine="python", num_iter=5, seed=0, memory=True):
+    """
+    Benchmark all steps for every size of item sets.
+
+    Args:
+            sizes (list(int), optional): numbers of items, *default:* :data:`DEFAULT_SIZES`
+            engine (str, optional): engine to generate tuples, *default:* ``python``
+            num_iter (int, optional): number of iterations to generate tuples, *default:* ``5``
+            seed (int, optional): seed for designs and annotations, *default:* ``0``
+            memory (bool, optional): whether to trace the peak memory, *default:* ``True``
+
+    Returns:
+            dict: information about the run ``meta`` and the measures of each size ``results``
+    """
+    return {
+        "meta": {
+            "engine": engine,
+            "num_iter": num_iter,
+            "seed": seed,
+            "python": platform.python_version(),
+            "numpy": np.__version__ if np is not None else None,
+            "machine": platform.machine(),
+        },
+        "results": {str(n_items): bench_size(n_items, engine, num_iter, seed, memory) for n_items in sizes},
+    }
+
+
+def compare(current, baseline, tolerance=0.2):
+    """
+    Compare the results of a run against a baseline.
+
+    A measure regresses if it is more than ``tolerance`` (relative) higher than in
+    the baseline. Lower is better for every measure. Sizes or measures missing in
+    one of both runs are skipped.
+
+    Args:
+            current (dict): results of :func:`run`
+            baseline (dict): results of :func:`run` saved before
+            tolerance (float, optional): accepted relative increase, *default:* ``0.2``
+
+    Returns:
+            list(tuple(str, str, str, float, float)): regressions as
+            ``(size, step, measure, baseline value, current value)``
+    """
+    regressions = []
+    for size, steps in current["results"].items():
+        for step, measures in steps.items():
+            base_measures = baseline["results"].get(size, {}).get(step, {})
+            for name, value in measures.items():
+                base = base_measures.get(name)
+                if value is None or base is None:
+                    continue
+                if value > base * (1 + tolerance) and value - base > 1e-9:
+                    regressions.append((size, step, name, base, value))
+    return regressions
+
+
+def format_results(report):
+    """
+    Format the results of a run as a table.
+
+    Args:
+            report (dict): results of :func:`run`
+
+    Returns:
+            str: table with one line per size and step
+    """
+    out = ["%8s  %-17s %10s %12s %11s %7s" % ("items", "step", "time (s)", "memory (KB)", "pair stdev", "spread")]
+    for size, steps in report["results"].items():
+        for step, measures in steps.items():
+            memory = measures["peak_memory"]
+            out.append(
+                "%8s  %-17s %10.4f %12s %11s %7s"
+                % (
+                    size,
+                    step,
+                    measures["time"],
+                    "-" if memory is None else "%d" % (memory // 1024),
+                    "%.4f" % measures["pair_stdev"] if "pair_stdev" in measures else "",
+                    measures.get("item_frequency_spread", ""),
+                )
+            )
+    return "\n".join(out)
+
+
+def main(argv=None):
+    """
+    Run the benchmarks from the command line.
+
+    Args:
+            argv (list(str), optional): command line arguments, *default:* ``sys.argv[1:]``
+
+    Returns:
+            int: exit code, ``1`` if there are regressions against the baseline
+    """
+    parser = argparse.ArgumentParser(description="Benchmark project.generator")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="numbers of items")
+    parser.add_argument("--engine", default="numpy" if np is not None else "python", help="engine for tuples")
+    parser.add_argument("--num-iter", type=int, default=5, help="iterations to generate tuples")
+    parser.add_argument("--seed", type=int, default=0, help="seed for designs and annotations")
+    parser.add_argument("--no-memory", action="store_true", help="do not trace memory (faster, exact times)")
+    parser.add_argument("--save", metavar="JSON", help="save the results as baseline")
+    parser.add_argument("--compare", metavar="JSON", help="compare the results against a baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="accepted relative increase")
+    args = parser.parse_args(argv)
+
+    report = run(args.sizes, args.engine, args.num_iter, args.seed, memory=not args.no_memory)
+    print(format_results(report))
+
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump(report, file, indent=2)
+
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = compare(report, json.load(file), args.tolerance)
+
+        for size, step, name, base, value in regressions:
+            print("REGRESSION %s items, %s, %s: %.6g -> %.6g" % (size, step, name, base, value))
+        if regressions:
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -24,9 +24,44 @@ class Config:
             SQLALCHEMY_DATABASE_URI (str): directory of the local SQL database,
                                                                                     *default:* ``SQLite database``
             MTURK_URL (str): endpoint of Amazon Crowdsourcing Platform, *default:* ``None``
+            AWS_ACCESS_KEY_ID (str): IAM AWS credentials - key id, *default:* ``None`` (given by user)
+            AWS_SECRET_ACCESS_KEY (str): IAM AWS credentials - secret access key, *default:* ``None`` (given by user)
+            MTURK_WORKERS (int): maximum number of concurrent calls to create HITs, *default:* ``8``
+            MTURK_RETRIES (int): maximum number of retries of a throttled call to MTurk, *default:* ``5``
+            MTURK_BACKOFF (float): maximum delay in seconds before the first retry of a throttled call,
+                                                            doubled for each further retry, *default:* ``0.5``
+            MTURK_POOL_SIZE (int): maximum number of connections of an MTurk client, *default:* ``10``
+            MTURK_CONNECT_TIMEOUT (float): seconds to connect to MTurk, *default:* ``5``
+            MTURK_READ_TIMEOUT (float): seconds to wait for a response of MTurk, *default:* ``30``
+            MTURK_CLIENT_TTL (float): seconds an unused MTurk client is kept, *default:* ``3600``
             MTURK_SHOW_UP_URL (str): link to where the project is uploaded
                                                             (mainly in production environment),
                                                             *default:* `real page <https://requester.mturk.com/>`__
+            GENERATOR_OPTIONS (dict): keyword arguments for :class:`project.generator.DataGenerator`
+                                                            when a project is uploaded, e.g. ``engine``, ``workers``,
+                                                            ``patience``, ``target_score``, ``time_budget``, ``refine_steps``
+                                                            or ``balanced_batches``,
+                                                            *default:* ``{'engine': 'python', 'workers': 1}``
+            DESIGN_CACHE_DIR (str): directory to cache designs of tuples between uploads,
+                                                            *default:* ``None`` (no cache)
+            DESIGN_CACHE_SIZE (int): maximum size of the design cache in bytes, *default:* ``104857600``
+            RESULT_CACHE (str): backend to cache the outputs of projects, ``'memory'``, ``'filesystem'``,
+                                                            ``'redis'`` or ``None`` (no cache), *default:* ``'memory'``
+            RESULT_CACHE_SIZE (int): maximum number of cached outputs in memory or on the filesystem,
+                                                            *default:* ``128``
+            RESULT_CACHE_DIR (str): directory of the ``'filesystem'`` cache, *default:* ``None``
+            RESULT_CACHE_URL (str): URL of the server of the ``'redis'`` cache, *default:* ``None``
+            RESULT_CACHE_TTL (int): seconds to keep an output in the ``'redis'`` cache, *default:* ``86400``
+            FRAGMENT_CACHE_SIZE (int): maximum number of rendered batches (questions) kept in memory,
+                                                            ``0`` to render every page, *default:* ``256``
+            FRAGMENT_CACHE_METRICS (callable): function called with each event of the fragment cache
+                                                            (``'hit'``, ``'miss'``, ``'evict'``) and its key, *default:* ``None``
+            JOB_WORKERS (int): number of threads running background jobs, e.g. building uploaded projects,
+                                                            *default:* ``2``
+            JOB_EAGER (bool): whether to run background jobs at once in the request instead,
+                                                            *default:* ``False``
+            JOB_LEASE (int): seconds after the last heartbeat of a running job until it counts as
+                                                            interrupted and may be claimed again, *default:* ``600``
 
     Methods:
             init_app(app) : Application initialization
@@ -37,7 +72,29 @@ class Config:
     BASE_DIR = basedir
     SQLALCHEMY_DATABASE_URI = "sqlite:///%s" % (os.path.join(basedir, "database.db"))
     MTURK_URL = None
+    AWS_ACCESS_KEY_ID = None
+    AWS_SECRET_ACCESS_KEY = None
+    MTURK_WORKERS = 8
+    MTURK_RETRIES = 5
+    MTURK_BACKOFF = 0.5
+    MTURK_POOL_SIZE = 10
+    MTURK_CONNECT_TIMEOUT = 5
+    MTURK_READ_TIMEOUT = 30
+    MTURK_CLIENT_TTL = 3600
     MTURK_SHOW_UP_URL = "https://requester.mturk.com/"
+    GENERATOR_OPTIONS = {"engine": "python", "workers": 1}
+    DESIGN_CACHE_DIR = None
+    DESIGN_CACHE_SIZE = 100 * 2**20
+    RESULT_CACHE = "memory"
+    RESULT_CACHE_SIZE = 128
+    RESULT_CACHE_DIR = None
+    RESULT_CACHE_URL = os.environ.get("RESULT_CACHE_URL")
+    RESULT_CACHE_TTL = 86400
+    FRAGMENT_CACHE_SIZE = 256
+    FRAGMENT_CACHE_METRICS = None
+    JOB_WORKERS = 2
+    JOB_EAGER = False
+    JOB_LEASE = 600
 
     @staticmethod
     def init_app(app):
@@ -81,6 +138,7 @@ class TestingConfig(Config):
             SQLALCHEMY_DATABASE_URI (str): SQL database used for testing
             WTF_CSRF_ENABLED (bool): whether to enable CSRF Token for different input forms in HTML,
                                                     *default:* ``False``
+            JOB_EAGER (bool): whether to run background jobs at once in the request, *default:* ``True``
     """
 
     DEBUG = False
@@ -89,6 +147,7 @@ class TestingConfig(Config):
         os.path.join(basedir, "database-test.db")
     )
     WTF_CSRF_ENABLED = False
+    JOB_EAGER = True
 
 
 config = {"development": DevelopmentConfig, "testing": TestingConfig, "default": DevelopmentConfig}
@@ -233,6 +233,7 @@ extlinks = {
     "field": ("https://wtforms.readthedocs.io/en/latest/fields.html#%s", ""),
     "dat-struct": ("http://werkzeug.palletsprojects.com/en/1.0.x/datastructures/#%s", ""),
     "reader": ("https://docs.python.org/3/library/io.html#%s", ""),
+    "futures": ("https://docs.python.org/3/library/concurrent.futures.html#%s", ""),
     "db": ("https://flask-sqlalchemy.palletsprojects.com/en/2.x/api/#%s", ""),
     "login": ("https://flask-login.readthedocs.io/en/latest/#%s", ""),
     "security": ("http://werkzeug.palletsprojects.com/en/1.0.x/utils/#werkzeug.security.%s", ""),
@@ -1,4 +1,5 @@
-from project import create_app, db
+from project import create_app
+from project.upgrade import upgrade_database
 from config import config
 
 app = create_app(config["default"])
@@ -6,6 +7,8 @@ app = create_app(config["default"])
 with app.app_context():
     from project.models import *
 
-    db.create_all()
+    # create the tables, or upgrade the ones of an earlier version
+    upgrade_database()
 
-app.run()
+if __name__ == "__main__":
+    app.run()
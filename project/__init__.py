@@ -6,10 +6,14 @@ This package defines the application.
 
 """
 
+import click
 from flask import Flask, request, render_template
 from flask_sqlalchemy import SQLAlchemy
 from flask_bootstrap3 import Bootstrap
 from flask_login import LoginManager
+from .cache import FragmentCache, ResultCache
+from .jobs import JobQueue
+from .mturk import MTurkClients
 
 # Create the instances of Flask extensions in global scope.
 # These are not attached to the application yet.
@@ -18,6 +22,10 @@ db = SQLAlchemy()
 login_manager = LoginManager()
 login_manager.blueprint_login_views = {"user": "user.login", "annotator": "annotator.login"}
 bootstrap = Bootstrap()
+result_cache = ResultCache()
+fragment_cache = FragmentCache()
+job_queue = JobQueue()
+mturk_clients = MTurkClients()
 
 
 def create_app(config_env):
@@ -42,6 +50,7 @@ def create_app(config_env):
 
     init_extensions(app)
     register_blueprints(app)
+    register_commands(app)
 
     return app
 
@@ -63,6 +72,10 @@ def init_extensions(app):
     db.init_app(app)
     login_manager.init_app(app)
     bootstrap.init_app(app)
+    result_cache.init_app(app)
+    fragment_cache.init_app(app)
+    job_queue.init_app(app)
+    mturk_clients.init_app(app)
 
     """
 	Flask-Login configuration
@@ -100,3 +113,96 @@ def register_blueprints(app):
     from .annotator import hit_app as mturk
 
     app.register_blueprint(mturk)
+
+
+def register_commands(app):
+    """
+    Register the command line commands with the Flask application instance,
+    run as ``flask --app main <command>``.
+
+    Args:
+            app (:flask:`Flask <flask.Flask>`): application
+    """
+
+    from . import assignments  # noqa: F401 (registers the task "sync_assignments" of the jobs)
+    from .jobs import claimable, run_job
+    from .models import Job, Project
+    from .scores import rebuild_scores
+    from .upgrade import upgrade_database
+
+    @app.cli.command("rebuild-scores")
+    @click.argument("p_name", required=False)
+    def rebuild_scores_command(p_name):
+        """
+        Recount the score counts of a project, or of all projects if no project name
+        is given, from the annotations in the database.
+        """
+        query = Project.query.order_by(Project.id)
+        if p_name:
+            query = query.filter_by(p_name=p_name)
+
+        projects = query.all()
+        if not projects:
+            raise click.ClickException(f"No project '{p_name}' found.")
+
+        for project in projects:
+            n_items = rebuild_scores(project)
+            click.echo(f"{project.p_name}: {n_items} items")
+        db.session.commit()
+
+    @app.cli.command("upgrade-db")
+    def upgrade_db_command():
+        """
+        Upgrade the database of an earlier version of the application, see :mod:`project.upgrade`.
+        """
+        for step in upgrade_database() or ["nothing to upgrade"]:
+            click.echo(step)
+
+    @app.cli.command("run-jobs")
+    @click.option("--failed", is_flag=True, help="Retry the failed builds of projects too.")
+    def run_jobs_command(failed):
+        """
+        Run the background jobs that are queued or were interrupted, e.g. by a restart,
+        and whose lease expired. Credentials given at upload are not saved, the configured ones are used instead.
+        """
+        condition = claimable()
+        if failed:
+            condition = condition | ((Job.status == "failed") & (Job.kind == "build_project"))
+        job_ids = db.session.scalars(db.select(Job.id).where(condition).order_by(Job.id)).all()
+
+        for job_id in job_ids:
+            job = run_job(job_id, retry_failed=failed)
+            if job is None:
+                click.echo(f"Job {job_id}: claimed by another worker")
+            else:
+                click.echo(f"Job {job.id} ({job.kind}): {job.status}")
+
+    @app.cli.command("sync-assignments")
+    @click.argument("p_name", required=False)
+    def sync_assignments_command(p_name):
+        """
+        List the new assignments of the HITs of a project on Mechanical Turk, or of all
+        projects on Mechanical Turk if no project name is given, and approve or reject them
+        with the configured credentials.
+        """
+        query = Project.query.filter_by(mturk=True, status="ready").order_by(Project.id)
+        if p_name:
+            query = query.filter_by(p_name=p_name)
+
+        projects = query.all()
+        if not projects:
+            raise click.ClickException(f"No project '{p_name}' on Mechanical Turk found.")
+
+        for project in projects:
+            job = Job(kind="sync_assignments", payload={}, project=project)
+            db.session.add(job)
+            db.session.commit()
+
+            job = run_job(job.id)
+            if job.status == "done":
+                click.echo(
+                    f"{project.p_name}: {job.payload['listed']} new, "
+                    f"{job.payload['approved']} approved, {job.payload['rejected']} rejected"
+                )
+            else:
+                click.echo(f"{project.p_name}: {job.error}")
@@ -19,4 +19,4 @@ from flask import Blueprint
 annotator_app = Blueprint("annotator", __name__, url_prefix="/annotator")
 hit_app = Blueprint("mturk", __name__, url_prefix="/mturk")
 
-from . import account, views, annotation
+from . import account, views, annotation, api
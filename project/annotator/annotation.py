@@ -12,9 +12,18 @@ This module defines routes to manage the annotations.
 from flask_login import login_required, current_user
 from flask import render_template, redirect, url_for, flash, request
 from . import annotator_app, hit_app
-from .forms import TupleForm
+from .helpers import (
+    batch_query,
+    fill_questions,
+    question_fragments,
+    render_questions,
+    save_annotations,
+    saved_data,
+    submit_annotations,
+    tuple_forms,
+)
 from .. import db
-from ..models import Project, Data, Batch
+from ..models import Project, Batch
 
 
 # Annotator - A batch of the project
@@ -45,8 +54,9 @@ def batch(p_name, batch_id):
     worst = current_project.worst_def
     description = current_project.description
 
-    current_batch = current_project.batches[batch_id - 1]
-    question_number = range(1, current_batch.size + 1)
+    # the batch, with its tuples and their items only to validate the answers
+    query = batch_query() if request.method == "POST" else Batch.query
+    current_batch = query.filter_by(project=current_project).order_by(Batch.id).offset(batch_id - 1).first_or_404()
 
     # in case some people still want to change their submitted results by typing route
     # instead of clicking on button though this button is already deactivated
@@ -54,24 +64,32 @@ def batch(p_name, batch_id):
         flash(f"Batch {batch_id} already submitted!", "action")
         return redirect(url_for("annotator.project", p_name=p_name))
 
-    # initialization of all forms
-    forms = [TupleForm(prefix="question-" + str(i)) for i in question_number]
-    tuples = []
-
-    # dynamic choices and dynamic default value (if exists) for each RadioField attribute
+    # the questions of a batch never change, they are rendered once for all annotators
+    # and only the answers this annotator has saved before are filled in
+    if request.method == "GET":
+        fragments = question_fragments(current_batch, "question-", best, worst)
+        saved = saved_data(current_annotator, [tuple_id for tuple_id, _, _ in fragments])
+        return render_template(
+            "annotator/batch.html",
+            best=best,
+            worst=worst,
+            description=description,
+            questions=fill_questions(
+                fragments, "question-", {tuple_id: (data.best_id, data.worst_id) for tuple_id, data in saved.items()}
+            ),
+            p_name=p_name,
+            batch_id=batch_id,
+            tuple_size=len(fragments[-1][1]),
+        )
+
+    # initialization of all forms with dynamic choices and dynamic default value (if exists)
+    forms = tuple_forms(current_batch.tuples, "question-")
+    saved = saved_data(current_annotator, [tuple_.id for tuple_ in current_batch.tuples])
     for form, tuple_ in zip(forms, current_batch.tuples):
-        form.best_item.choices = [(item.id, item.item) for item in tuple_.items]
-        form.worst_item.choices = [(item.id, item.item) for item in tuple_.items]
-
         # check if this annotator has saved their data before
-        if Data.query.filter_by(annotator=current_annotator, tuple_=tuple_).first():
-            data = Data.query.filter_by(annotator=current_annotator, tuple_=tuple_).first()
-
-            form.best_item.default = data.best_id
-            form.worst_item.default = data.worst_id
-
-        # this is literally defined for Items that have String-Format!, must change for others
-        tuples.append(", ".join([item.item for item in tuple_.items]))
+        if tuple_.id in saved:
+            form.best_item.default = saved[tuple_.id].best_id
+            form.worst_item.default = saved[tuple_.id].worst_id
 
     if request.method == "POST":
         # Submit Button
@@ -83,22 +101,15 @@ def batch(p_name, batch_id):
                 return redirect(url_for("annotator.project", p_name=p_name))
 
             if all([form.validate_on_submit() for form in forms]):
-                for form, tuple_ in zip(forms, current_batch.tuples):
-                    if Data.query.filter_by(annotator=current_annotator, tuple_=tuple_).first():
-                        data = Data.query.filter_by(annotator=current_annotator, tuple_=tuple_).first()
-                        data.best_id = form.best_item.data
-                        data.worst_id = form.worst_item.data
-
-                    else:
-                        db.session.add(
-                            Data(
-                                best_id=form.best_item.data,
-                                worst_id=form.worst_item.data,
-                                tuple_=tuple_,
-                                annotator=current_annotator,
-                            )
-                        )
-                current_annotator.batches.append(current_batch)
+                submit_annotations(
+                    current_project,
+                    current_batch,
+                    [
+                        (tuple_, form.best_item.data, form.worst_item.data)
+                        for form, tuple_ in zip(forms, current_batch.tuples)
+                    ],
+                    current_annotator,
+                )
                 db.session.commit()
                 flash(f"Batch {batch_id} successfully submitted!", "action")
 
@@ -106,22 +117,13 @@ def batch(p_name, batch_id):
 
         # Save Button
         elif request.form["action"] == "save":
-            for form, tuple_ in zip(forms, current_batch.tuples):
-                if Data.query.filter_by(annotator=current_annotator, tuple_=tuple_).first():
-                    data = Data.query.filter_by(annotator=current_annotator, tuple_=tuple_).first()
-                    data.best_id = form.best_item.data
-                    data.worst_id = form.worst_item.data
-
-                else:
-                    db.session.add(
-                        Data(
-                            best_id=form.best_item.data,
-                            worst_id=form.worst_item.data,
-                            tuple_=tuple_,
-                            annotator=current_annotator,
-                        )
-                    )
-
+            save_annotations(
+                [
+                    (tuple_.id, form.best_item.data, form.worst_item.data)
+                    for form, tuple_ in zip(forms, current_batch.tuples)
+                ],
+                current_annotator,
+            )
             db.session.commit()
             flash(f"Batch {batch_id} saved!", "action")
             return redirect(url_for("annotator.project", p_name=p_name))
@@ -131,14 +133,10 @@ def batch(p_name, batch_id):
         best=best,
         worst=worst,
         description=description,
-        zip=zip,
-        batch_form=forms,
-        question_number=question_number,
-        tuples=tuples,
+        questions=render_questions(current_batch.tuples, forms, best, worst),
         p_name=p_name,
         batch_id=batch_id,
-        int=int,
-        tuple_size=len(tuple_.items),
+        tuple_size=len(current_batch.tuples[-1].items),
     )
 
 
@@ -167,32 +165,38 @@ def hit(p_name, hit_id):
     worst = current_project.worst_def
     description = current_project.description
 
-    current_batch = Batch.query.filter_by(project=current_project, hit_id=hit_id).first()
+    query = batch_query() if request.method == "POST" else Batch.query
+    current_batch = query.filter_by(project=current_project, hit_id=hit_id).first()
 
     # if the number of time this batch is submitted already meets the number of required annotations,
     # anyone tries to access this batch by typing route will not see the batch anymore
-    first_tuple = current_batch.tuples[0]
-    if len(first_tuple.datas) >= current_project.anno_number:
+    if current_batch.submissions >= current_project.anno_number:
         return "<h2> This HIT is no longer available! </h2>"
 
-    question_number = range(1, current_batch.size + 1)
-
-    # initialization of all forms
-    forms = [TupleForm(prefix=str(i)) for i in question_number]
-    tuples = []
-
-    # dynamic choices for each RadioField attribute
-    for form, tuple_ in zip(forms, current_batch.tuples):
-        form.best_item.choices = [(item.id, item.item) for item in tuple_.items]
-        form.worst_item.choices = [(item.id, item.item) for item in tuple_.items]
-
-        tuples.append(", ".join([item.item for item in tuple_.items]))
+    # the questions of a batch are rendered once for all turkers
+    if request.method == "GET":
+        fragments = question_fragments(current_batch, "", best, worst)
+        return render_template(
+            "annotator/batch.html",
+            best=best,
+            worst=worst,
+            description=description,
+            questions=fill_questions(fragments, ""),
+            hit_id=hit_id,
+            mturk=current_project.mturk,
+        )
+
+    # initialization of all forms with dynamic choices
+    forms = tuple_forms(current_batch.tuples, "")
 
     # Submit
     if all([form.validate_on_submit() for form in forms]):
-        for form, tuple_ in zip(forms, current_batch.tuples):
-            new_data = Data(best_id=form.best_item.data, worst_id=form.worst_item.data, tuple_=tuple_)
-            db.session.add(new_data)
+        answers = [
+            (tuple_, form.best_item.data, form.worst_item.data) for form, tuple_ in zip(forms, current_batch.tuples)
+        ]
+        if not submit_annotations(current_project, current_batch, answers):
+            db.session.rollback()
+            return "<h2> This HIT is no longer available! </h2>", 409
         db.session.commit()
 
         return f"""<h2> Your batch is submitted succesfully. Here is your keyword: 
@@ -203,11 +207,7 @@ def hit(p_name, hit_id):
         best=best,
         worst=worst,
         description=description,
-        zip=zip,
-        batch_form=forms,
-        question_number=question_number,
-        tuples=tuples,
+        questions=render_questions(current_batch.tuples, forms, best, worst),
         hit_id=hit_id,
-        int=int,
         mturk=current_project.mturk,
     )
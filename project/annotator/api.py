@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+API
+######################
+
+*Module* ``project.annotator.api``
+
+This module defines routes to save and submit the answers of a whole batch
+as one JSON payload, e.g. for other front ends:
+
+.. code-block:: json
+
+        {"action": "submit", "answers": [[4, 1], [2, 3]]}
+
+``answers`` holds the ids of the '**best**' and '**worst**' item of each tuple,
+in the order of the questions of the batch. The answers are checked in one pass
+(see :func:`~project.annotator.helpers.check_answers`) and saved the same way
+as the ones of the forms. With CSRF protection, the token of the batch page is
+sent in header ``X-CSRFToken``.
+
+"""
+
+from flask import current_app, jsonify, request
+from flask_login import login_required, current_user
+from flask_wtf.csrf import validate_csrf
+from wtforms import ValidationError
+from . import annotator_app, hit_app
+from .helpers import batch_query, check_answers, save_annotations, submit_annotations
+from .. import db
+from ..models import Batch, Project
+
+
+def payload():
+    """
+    Get the JSON payload of a request and check its CSRF token, if CSRF protection is enabled.
+
+    Returns:
+            tuple(dict, :flask:`Response <flask.Response>`): the payload, or ``None`` and the error response
+    """
+    if current_app.config.get("WTF_CSRF_ENABLED", True):
+        try:
+            validate_csrf(request.headers.get("X-CSRFToken"))
+        except ValidationError as error:
+            return None, (jsonify(error=str(error)), 400)
+
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return None, (jsonify(error="Expected a JSON object."), 400)
+    return data, None
+
+
+# Annotator - Answers of a batch
+@annotator_app.route("/<p_name>/batch-<int:batch_id>/answers", methods=["POST"])
+@login_required
+def batch_answers(p_name, batch_id):
+    """
+    Save (``"action": "save"``) or submit (``"action": "submit"``) the answers of a batch
+    within the project in the local system at ``/annotator/<p_name>/batch-<int:batch_id>/answers``.
+    Answers to save may be ``null``.
+
+    Args:
+            p_name (str): name of the project
+            batch_id (int): id of the batch
+
+    Returns:
+            ``{"action": ..., "answers": <number of answers>}``
+
+    Error:
+            ``{"errors": {<question number>: <message>}}`` with status 400 if any answer is invalid,
+            status 409 if the batch is already submitted.
+    """
+    data, error = payload()
+    if error:
+        return error
+
+    current_annotator = current_user
+    current_project = current_annotator.project
+    current_batch = (
+        batch_query().filter_by(project=current_project).order_by(Batch.id).offset(batch_id - 1).first_or_404()
+    )
+
+    action = data.get("action")
+    if action not in ("save", "submit"):
+        return jsonify(error="Action must be 'save' or 'submit'."), 400
+    if current_batch in current_annotator.batches:
+        return jsonify(error=f"Batch {batch_id} already submitted!"), 409
+
+    answers, errors = check_answers(current_batch.tuples, data.get("answers"), required=action == "submit")
+    if errors:
+        return jsonify(errors=errors), 400
+
+    if action == "submit":
+        submit_annotations(current_project, current_batch, answers, current_annotator)
+    else:
+        save_annotations([(tuple_.id, best_id, worst_id) for tuple_, best_id, worst_id in answers], current_annotator)
+    db.session.commit()
+
+    return jsonify(action=action, answers=len(answers))
+
+
+# MTurk - Answers of a batch
+@hit_app.route("/<p_name>/<hit_id>/answers", methods=["POST"])
+def hit_answers(p_name, hit_id):
+    """
+    Submit the answers of a HIT within the project directed from MTurk at ``/mturk/<p_name>/<hit_id>/answers``.
+
+    Args:
+            p_name (str): name of the project
+            hit_id (str): id of the HIT
+
+    Returns:
+            ``{"keyword": <keyword of the HIT>}``
+
+    Error:
+            ``{"errors": {<question number>: <message>}}`` with status 400 if any answer is invalid,
+            status 409 if the HIT is no longer available.
+    """
+    data, error = payload()
+    if error:
+        return error
+
+    current_project = Project.query.filter_by(p_name=p_name).first_or_404()
+    current_batch = batch_query().filter_by(project=current_project, hit_id=hit_id).first_or_404()
+
+    answers, errors = check_answers(current_batch.tuples, data.get("answers"))
+    if errors:
+        return jsonify(errors=errors), 400
+
+    if not submit_annotations(current_project, current_batch, answers):
+        db.session.rollback()
+        return jsonify(error="This HIT is no longer available!"), 409
+    db.session.commit()
+
+    return jsonify(keyword=current_batch.keyword)
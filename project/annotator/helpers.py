@@ -11,6 +11,27 @@ inside of the Annotator-System.
 
 """
 
+from flask import current_app, render_template
+from flask_wtf.csrf import generate_csrf
+from markupsafe import Markup
+from sqlalchemy import bindparam, insert, update
+from sqlalchemy.dialects import mysql
+from sqlalchemy.orm import selectinload
+from .forms import TupleForm
+from .. import db, fragment_cache
+from ..models import Batch, Data, Tuple
+from ..scores import UPSERTS, add_annotations
+
+# placeholder of the CSRF token of each annotator in the cached questions of a batch
+CSRF_TOKEN = "__CSRF_TOKEN__"
+
+# error messages of answers, the same as the ones of TupleForm
+ANSWER_ERRORS = {
+    "required": "Choose one item!",
+    "choice": "Not a valid choice.",
+    "equal": "Two questions for this tuple require 2 different answers",
+}
+
 
 def batches_list(project="batch", n_batches=5):
     """
@@ -31,3 +52,316 @@ def batches_list(project="batch", n_batches=5):
     """
     batches_links = [(project, i + 1, f"Batch {i+1}") for i in range(n_batches)]
     return batches_links
+
+
+def batch_query():
+    """
+    Query batches together with their tuples and the items of the tuples,
+    loaded in 2 more queries for all tuples instead of 1 query per tuple.
+
+    Returns:
+            :db:`Query <flask_sqlalchemy.query.Query>`: query of :class:`~project.models.Batch`
+    """
+    return Batch.query.options(selectinload(Batch.tuples).selectinload(Tuple.items))
+
+
+def saved_data(annotator, tuple_ids):
+    """
+    Get the data an annotator has saved or submitted for tuples, in one query.
+
+    Args:
+            annotator (:class:`~project.models.Annotator`): the annotator
+            tuple_ids (list(int)): ids of the tuples, e.g. of a batch
+
+    Returns:
+            dict: :class:`~project.models.Data` of each tuple id, only tuples with data
+    """
+    saved = {}
+    query = Data.query.filter(Data.anno_id == annotator.id, Data.tuple_id.in_(tuple_ids))
+    for data in query.order_by(Data.id):
+        saved.setdefault(data.tuple_id, data)
+    return saved
+
+
+def tuple_forms(tuples, prefix):
+    """
+    Create the form of each tuple of a batch with the items of the tuple as choices.
+
+    Args:
+            tuples (list(:class:`~project.models.Tuple`)): the tuples
+            prefix (str): prefix of the forms, followed by the number of the question,
+                            e.g. ``'question-'`` for ``question-1``
+
+    Returns:
+            list(:class:`~project.annotator.forms.TupleForm`): the forms
+    """
+    forms = []
+    for number, tuple_ in enumerate(tuples, start=1):
+        form = TupleForm(prefix=f"{prefix}{number}")
+        form.best_item.choices = form.worst_item.choices = [(item.id, item.item) for item in tuple_.items]
+        forms.append(form)
+    return forms
+
+
+def render_questions(tuples, forms, best, worst):
+    """
+    Render the question of each tuple of a batch with its form (``annotator/question.html``).
+
+    Args:
+            tuples (list(:class:`~project.models.Tuple`)): the tuples
+            forms (list(:class:`~project.annotator.forms.TupleForm`)): the forms of the tuples
+            best (str): definition of '**best**' of the project
+            worst (str): definition of '**worst**' of the project
+
+    Returns:
+            list(:class:`~markupsafe.Markup`): markup of each question
+    """
+    return [
+        Markup(
+            render_template(
+                "annotator/question.html",
+                question=number,
+                # this is literally defined for Items that have String-Format!, must change for others
+                tuple=", ".join([item.item for item in tuple_.items]),
+                form=form,
+                best=best,
+                worst=worst,
+                int=int,
+            )
+        )
+        for number, (tuple_, form) in enumerate(zip(tuples, forms), start=1)
+    ]
+
+
+def question_fragments(batch, prefix, best, worst):
+    """
+    Get the questions of a batch without any answer from the fragment cache (key: batch id and prefix).
+    The questions are rendered on the first request only, as the tuples and items of a batch
+    never change. The CSRF token in them is replaced by a placeholder, see :func:`fill_questions`.
+
+    Args:
+            batch (:class:`~project.models.Batch`): the batch
+            prefix (str): prefix of the forms, see :func:`tuple_forms`
+            best (str): definition of '**best**' of the project
+            worst (str): definition of '**worst**' of the project
+
+    Returns:
+            list(tuple(int, list(int), str)): ``(tuple id, item ids, markup)`` of each question
+    """
+
+    def create():
+        tuples = Tuple.query.options(selectinload(Tuple.items)).filter_by(batch_id=batch.id).order_by(Tuple.id).all()
+        questions = render_questions(tuples, tuple_forms(tuples, prefix), best, worst)
+
+        token = generate_csrf() if current_app.config.get("WTF_CSRF_ENABLED", True) else None
+        return [
+            (
+                tuple_.id,
+                [item.id for item in tuple_.items],
+                str(markup).replace(token, CSRF_TOKEN) if token else str(markup),
+            )
+            for tuple_, markup in zip(tuples, questions)
+        ]
+
+    return fragment_cache.get_or_create(f"questions:{batch.id}:{prefix}", create)
+
+
+def fill_questions(fragments, prefix, answers=None):
+    """
+    Fill the answers of an annotator and the CSRF token into the cached questions of a batch,
+    the same markup as rendered by :func:`render_questions` for forms with these answers as defaults.
+
+    Args:
+            fragments (list(tuple(int, list(int), str))): questions from :func:`question_fragments`
+            prefix (str): prefix of the forms, see :func:`tuple_forms`
+            answers (dict, optional): ``(best item id, worst item id)`` of tuple ids, *default:* ``None``
+
+    Returns:
+            list(:class:`~markupsafe.Markup`): markup of each question
+    """
+    answers = answers or {}
+    token = generate_csrf() if current_app.config.get("WTF_CSRF_ENABLED", True) else None
+
+    questions = []
+    for number, (tuple_id, item_ids, markup) in enumerate(fragments, start=1):
+        for field, item_id in zip(("best_item", "worst_item"), answers.get(tuple_id, (None, None))):
+            if item_id in item_ids:
+                radio = f'<input id="{prefix}{number}-{field}-{item_ids.index(item_id)}"'
+                markup = markup.replace(radio, '<input checked="checked"' + radio[len("<input") :], 1)
+        if token:
+            markup = markup.replace(CSRF_TOKEN, token)
+        questions.append(Markup(markup))
+    return questions
+
+
+def check_answers(tuples, answers, required=True):
+    """
+    Validate the answers to all tuples of a batch in one pass, with the same rules
+    (and messages) as the forms of the tuples, see :class:`~project.annotator.forms.TupleForm`.
+
+    Args:
+            tuples (list(:class:`~project.models.Tuple`)): the tuples of the batch
+            answers (list): ``[best item id, worst item id]`` of each tuple in the order of the questions,
+                            ``None`` for an item (or a tuple) without answer
+            required (bool, optional): whether every tuple must be answered, *default:* ``True``
+
+    Returns:
+            tuple(list(tuple(:class:`~project.models.Tuple`, int, int)), dict): the answer of each tuple
+            and the error message of each invalid question by its number (``0`` if the answers are not a list
+            of one answer per tuple), empty if all answers are valid
+    """
+    if not isinstance(answers, list) or len(answers) != len(tuples):
+        return [], {0: f"Expected a list of {len(tuples)} answers."}
+
+    valid, errors = [], {}
+    for number, (tuple_, answer) in enumerate(zip(tuples, answers), start=1):
+        answer = [None, None] if answer is None else answer
+        if not isinstance(answer, list) or len(answer) != 2:
+            errors[number] = ANSWER_ERRORS["choice"]
+            continue
+
+        best_id, worst_id = answer
+        item_ids = {item.id for item in tuple_.items}
+        if required and (best_id is None or worst_id is None):
+            errors[number] = ANSWER_ERRORS["required"]
+        elif any(item_id is not None and (type(item_id) is not int or item_id not in item_ids) for item_id in answer):
+            errors[number] = ANSWER_ERRORS["choice"]
+        elif best_id is not None and best_id == worst_id:
+            errors[number] = ANSWER_ERRORS["equal"]
+        else:
+            valid.append((tuple_, best_id, worst_id))
+
+    return valid, errors
+
+
+def submit_annotations(project, batch, answers, annotator=None):
+    """
+    Save the answers of a submitted batch, count the submission and add the answers
+    to the counts of the project. On MTurk, the batch is only submitted as long as it
+    has less than :attr:`~project.models.Project.anno_number` submissions.
+    The changes are committed by the caller.
+
+    Args:
+            project (:class:`~project.models.Project`): the project
+            batch (:class:`~project.models.Batch`): the batch
+            answers (list(tuple(:class:`~project.models.Tuple`, int, int))): answer of each tuple
+            annotator (:class:`~project.models.Annotator`, optional): annotator in the local system,
+                            *default:* ``None`` (on MTurk)
+
+    Returns:
+            bool: ``True`` if the batch is submitted, ``False`` if it has no place left
+    """
+    if annotator is None:
+        # others may have submitted this batch in the meantime, the last free place is taken only once
+        if not count_submission(batch, capacity=project.anno_number):
+            return False
+    else:
+        annotator.batches.append(batch)
+        count_submission(batch)
+
+    save_annotations([(tuple_.id, best_id, worst_id) for tuple_, best_id, worst_id in answers], annotator)
+    add_annotations(project, answers)
+    return True
+
+
+def count_submission(batch, capacity=None):
+    """
+    Count a submission of a batch with one conditional ``UPDATE``, only if the batch
+    is submitted less than ``capacity`` times. The database counts atomically, so the
+    capacity holds even if the batch is submitted in parallel.
+
+    Args:
+            batch (:class:`~project.models.Batch`): the batch
+            capacity (int, optional): maximum number of submissions, *default:* ``None`` (no maximum)
+
+    Returns:
+            bool: ``True`` if the submission is counted, ``False`` if the batch is full
+    """
+    statement = update(Batch).where(Batch.id == batch.id).values(submissions=Batch.submissions + 1)
+    if capacity is not None:
+        statement = statement.where(Batch.submissions < capacity)
+
+    return db.session.execute(statement).rowcount == 1
+
+
+def save_annotations(answers, annotator=None, chunk_size=500):
+    """
+    Save the answers to tuples in bulk. The answers of an annotator in the local system
+    replace the ones this annotator has saved before, with one ``INSERT ... ON CONFLICT``
+    (``ON DUPLICATE KEY UPDATE`` for MySQL) on the unique ``(anno_id, tuple_id)`` of
+    :class:`~project.models.Data`. Other databases update the existing answers and
+    insert the new ones with one statement each. On MTurk every submission is inserted.
+
+    Args:
+            answers (list(tuple(int, int, int))): ``(tuple id, best item id, worst item id)`` of each tuple
+            annotator (:class:`~project.models.Annotator`, optional): annotator in the local system,
+                            *default:* ``None`` (on MTurk)
+            chunk_size (int, optional): maximum number of rows per statement, *default:* ``500``
+    """
+    anno_id = annotator.id if annotator else None
+    rows = [
+        dict(anno_id=anno_id, tuple_id=tuple_id, best_id=best_id, worst_id=worst_id)
+        for tuple_id, best_id, worst_id in answers
+    ]
+    if not rows:
+        return
+
+    table = Data.__table__
+    if annotator is None:
+        db.session.execute(insert(table), rows)
+        return
+
+    dialect = db.session.get_bind().dialect.name
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start : start + chunk_size]
+
+        if dialect in UPSERTS:
+            statement = UPSERTS[dialect](table).values(chunk)
+            statement = statement.on_conflict_do_update(
+                index_elements=["anno_id", "tuple_id"],
+                set_=dict(best_id=statement.excluded.best_id, worst_id=statement.excluded.worst_id),
+            )
+            db.session.execute(statement)
+        elif dialect in ("mysql", "mariadb"):
+            statement = mysql.insert(table).values(chunk)
+            statement = statement.on_duplicate_key_update(
+                best_id=statement.inserted.best_id, worst_id=statement.inserted.worst_id
+            )
+            db.session.execute(statement)
+        else:
+            update_or_insert(table, chunk)
+
+
+def update_or_insert(table, rows):
+    """
+    Update the rows of table ``datas`` of an annotator that exist and insert the others,
+    for databases without upsert.
+
+    Args:
+            table (:class:`sqlalchemy.schema.Table`): table ``datas``
+            rows (list(dict)): rows of one annotator
+    """
+    existing = set(
+        db.session.scalars(
+            db.select(table.c.tuple_id).where(
+                table.c.anno_id == rows[0]["anno_id"], table.c.tuple_id.in_([row["tuple_id"] for row in rows])
+            )
+        )
+    )
+
+    updates = [
+        dict(a_id=row["anno_id"], t_id=row["tuple_id"], best=row["best_id"], worst=row["worst_id"])
+        for row in rows
+        if row["tuple_id"] in existing
+    ]
+    if updates:
+        db.session.execute(
+            update(table)
+            .where(table.c.anno_id == bindparam("a_id"), table.c.tuple_id == bindparam("t_id"))
+            .values(best_id=bindparam("best"), worst_id=bindparam("worst")),
+            updates,
+        )
+
+    inserts = [row for row in rows if row["tuple_id"] not in existing]
+    if inserts:
+        db.session.execute(insert(table), inserts)
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""
+*Module* ``project.assignments``
+
+This module synchronizes the assignments of the HITs of a project on Mechanical Turk
+with the annotations in the database, then approves or rejects them.
+
+The HITs are listed concurrently, each one from its own cursor (see :attr:`Batch.mturk_next_token
+<project.models.Batch>`), so a run only fetches the assignments submitted since the previous run.
+An assignment is approved if the turker typed in the keyword of the batch and the batch has
+a submission for it (see :attr:`Batch.submissions <project.models.Batch>`), otherwise it is rejected.
+Assignments already reviewed on MTurk, e.g. by the review policy of the HIT, are only recorded.
+
+"""
+
+from collections import Counter
+from functools import partial
+from flask import current_app
+from . import db, job_queue, mturk_clients
+from .models import Assignment
+from .mturk import answer_keyword, call_all, list_assignments, retry
+
+REJECT_REASONS = {
+    "keyword": "Sorry, we could not approve your submission as you did not type in the right keyword.",
+    "annotation": "Sorry, we could not approve your submission as we did not receive your annotations.",
+}
+
+
+def sync_assignments(project, client, workers=8, page_size=100, **options):
+    """
+    List the new assignments of all HITs of a project, save them and approve or reject
+    the submitted ones. A batch gets at most as many approved assignments as it has submissions.
+
+    Args:
+            project (:class:`~project.models.Project`): the project
+            client: MTurk client
+            workers (int, optional): maximum number of concurrent calls, *default:* ``8``
+            page_size (int, optional): number of assignments per listed page, *default:* ``100``
+            **options: options of :func:`~project.mturk.retry`
+
+    Returns:
+            dict: number of ``'listed'`` new assignments, of ``'approved'`` and of ``'rejected'`` ones
+    """
+    counts = Counter(listed=0, approved=0, rejected=0)
+    batches = {batch.id: batch for batch in project.batches if batch.mturk_hit_id}
+    if not batches:
+        return dict(counts)
+
+    # list the new assignments of all HITs at once, each one from its own cursor
+    listings = call_all(
+        partial(list_assignments, client, page_size=page_size, **options),
+        {batch.id: dict(hit_id=batch.mturk_hit_id, next_token=batch.mturk_next_token) for batch in batches.values()},
+        workers=workers,
+    )
+
+    known = {
+        assignment.id: assignment
+        for assignment in Assignment.query.filter(Assignment.batch_id.in_(batches)).order_by(Assignment.id)
+    }
+    for batch_id, (listed, next_token) in listings.items():
+        batches[batch_id].mturk_next_token = next_token
+
+        for entry in listed:
+            assignment = known.get(entry["AssignmentId"])
+            if assignment is None:
+                assignment = known[entry["AssignmentId"]] = Assignment(
+                    entry["AssignmentId"],
+                    batch=batches[batch_id],
+                    worker_id=entry.get("WorkerId"),
+                    keyword=answer_keyword(entry.get("Answer")),
+                )
+                db.session.add(assignment)
+                counts["listed"] += 1
+            assignment.status = entry.get("AssignmentStatus", assignment.status)
+
+    # save what is listed before any review, the cursors must not be listed again
+    db.session.commit()
+
+    # approve the submitted assignments with the right keyword, as long as the batch has submissions for them
+    approved = Counter(assignment.batch_id for assignment in known.values() if assignment.status == "Approved")
+    approve, reject = {}, {}
+
+    for assignment in known.values():
+        if assignment.status != "Submitted":
+            continue
+
+        if assignment.keyword != batches[assignment.batch_id].keyword:
+            reject[assignment.id] = dict(AssignmentId=assignment.id, RequesterFeedback=REJECT_REASONS["keyword"])
+        elif approved[assignment.batch_id] >= batches[assignment.batch_id].submissions:
+            reject[assignment.id] = dict(AssignmentId=assignment.id, RequesterFeedback=REJECT_REASONS["annotation"])
+        else:
+            approved[assignment.batch_id] += 1
+            approve[assignment.id] = dict(AssignmentId=assignment.id)
+
+    def reviewed(status):
+        def done(assignment_id, response):
+            known[assignment_id].status = status
+            counts[status.lower()] += 1
+
+        return done
+
+    try:
+        call_all(partial(retry, client.approve_assignment, **options), approve, workers, reviewed("Approved"))
+        call_all(partial(retry, client.reject_assignment, **options), reject, workers, reviewed("Rejected"))
+    finally:
+        db.session.commit()
+
+    return dict(counts)
+
+
+@job_queue.task("sync_assignments")
+def sync_assignments_job(job, aws_access_key_id=None, aws_secret_access_key=None):
+    """
+    Task of a job to synchronize the assignments of its project, see :func:`sync_assignments`.
+    The numbers of listed, approved and rejected assignments are saved as payload of the job.
+
+    Args:
+            job (:class:`~project.models.Job`): the job
+            aws_access_key_id (str, optional): IAM AWS credentials - key id, *default:* ``AWS_ACCESS_KEY_ID``
+            aws_secret_access_key (str, optional): IAM AWS credentials - secret access key,
+                            *default:* ``AWS_SECRET_ACCESS_KEY``
+    """
+    job.payload = sync_assignments(
+        job.project,
+        mturk_clients.client(aws_access_key_id, aws_secret_access_key),
+        workers=current_app.config["MTURK_WORKERS"],
+        retries=current_app.config["MTURK_RETRIES"],
+        backoff=current_app.config["MTURK_BACKOFF"],
+    )
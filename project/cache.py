@@ -0,0 +1,367 @@
+# -*- coding: utf-8 -*-
+"""
+*Module* ``project.cache``
+
+This module defines the cache of rendered outputs (e.g. ``scores.txt``) of the projects
+and the cache of rendered fragments of pages (e.g. the questions of a batch).
+
+Outputs are keyed by the project and its :attr:`~project.models.Project.data_version`,
+which is bumped whenever a batch or a HIT is submitted, so a cached output is never
+outdated: new annotations lead to a new key, old keys are simply no longer requested and
+are evicted by the backend.
+
+Backends:
+        * :class:`MemoryBackend`: in-process LRU cache
+        * :class:`FileSystemBackend`: one file per output in a directory, shared between processes
+        * :class:`RedisBackend`: any server speaking the Redis protocol
+          (`Redis <https://redis.io/>`__, `Valkey <https://valkey.io/>`__, ...)
+
+"""
+
+import os
+from collections import Counter, OrderedDict
+from hashlib import sha1
+from threading import Lock
+from flask import current_app
+
+try:
+    import redis
+except ImportError:  # redis-py is optional, only the "redis" backend needs it
+    redis = None
+
+BACKENDS = ("memory", "filesystem", "redis")
+
+
+class MemoryBackend(object):
+    """
+    Keep outputs in memory of the process, the least recently used ones are removed
+    once there are more than ``max_entries``. The number of each event (``'hit'``, ``'miss'``
+    and ``'evict'``) is counted in :attr:`stats`.
+
+    Args:
+            max_entries (int, optional): maximum number of outputs, *default:* ``128``
+            on_event (callable, optional): called with each event and its key, e.g. to export metrics
+    """
+
+    def __init__(self, max_entries=128, on_event=None):
+        self.max_entries = max_entries
+        self.on_event = on_event
+        self.entries = OrderedDict()
+        self.stats = Counter()
+        self.lock = Lock()
+
+    def event(self, name, key):
+        self.stats[name] += 1
+        if self.on_event:
+            self.on_event(name, key)
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+            self.event("miss" if value is None else "hit", key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.event("evict", self.entries.popitem(last=False)[0])
+
+
+class FileSystemBackend(object):
+    """
+    Keep outputs as files in a directory, the least recently used ones are removed
+    once there are more than ``max_entries``.
+
+    Args:
+            directory (str): directory of the cache, created if it does not exist
+            max_entries (int, optional): maximum number of outputs, *default:* ``128``
+    """
+
+    def __init__(self, directory, max_entries=128):
+        self.directory = directory
+        self.max_entries = max_entries
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.directory, "output-%s.txt" % sha1(key.encode("utf-8")).hexdigest())
+
+    def get(self, key):
+        path = self.path(key)
+        try:
+            with open(path, "r", encoding="utf-8", newline="") as file:
+                value = file.read()
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return value
+
+    def set(self, key, value):
+        write_atomic(self.path(key), lambda file: file.write(value), "w", encoding="utf-8", newline="")
+        self.evict()
+
+    def evict(self):
+        """
+        Remove the least recently used outputs until there are at most :attr:`max_entries`.
+        """
+        evict_oldest(self.directory, "output-", ".txt", max_entries=self.max_entries)
+
+
+class RedisBackend(object):
+    """
+    Keep outputs in a server speaking the Redis protocol. The server removes them
+    after ``ttl`` seconds or by its own eviction policy.
+
+    Args:
+            client: client of the server with methods ``get(key)`` and ``set(key, value, ex=ttl)``,
+                            e.g. :class:`redis.Redis` or a stand-in with the same methods
+            ttl (int, optional): seconds to keep an output, *default:* ``86400`` (1 day)
+            prefix (str, optional): prefix of the keys, *default:* ``'bws:'``
+    """
+
+    def __init__(self, client, ttl=86400, prefix="bws:"):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(cls, url, **kwargs):
+        """
+        Connect to a server with `redis-py <https://redis-py.readthedocs.io/>`__.
+
+        Args:
+                url (str): URL of the server, e.g. ``redis://localhost:6379/0``
+                **kwargs: arguments of :class:`RedisBackend`
+
+        Returns:
+                RedisBackend: the backend
+        """
+        if redis is None:
+            raise ImportError("The 'redis' result cache requires redis-py, install the extra 'redis'.")
+        return cls(redis.Redis.from_url(url), **kwargs)
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        if isinstance(value, bytes):
+            value = value.decode("utf-8")
+        return value
+
+    def set(self, key, value):
+        self.client.set(self.prefix + key, value.encode("utf-8"), ex=self.ttl)
+
+
+class ResultCache(object):
+    """
+    Flask extension to cache rendered outputs of projects in a backend chosen by
+    the configuration ``RESULT_CACHE``. The backend of each application is kept in
+    ``app.extensions['result_cache']``, so it can be replaced, e.g. by a stand-in in tests.
+
+    Args:
+            app (:flask:`Flask <flask.Flask>`, optional): application
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        Create the backend from the configuration of the application.
+
+        Args:
+                app (:flask:`Flask <flask.Flask>`): application
+        """
+        app.extensions["result_cache"] = create_backend(app.config)
+
+    @property
+    def backend(self):
+        """
+        Backend of the current application, ``None`` if outputs are not cached.
+        """
+        return current_app.extensions.get("result_cache")
+
+    @staticmethod
+    def key(name, project):
+        """
+        Get the key of an output.
+
+        Args:
+                name (str): name of the output, e.g. ``'scores'``
+                project (:class:`~project.models.Project`): the project
+
+        Returns:
+                str: key of the output in this version of the data
+        """
+        return f"{name}:{project.id}:{project.data_version}"
+
+    @classmethod
+    def etag(cls, name, project):
+        """
+        Get the entity tag of an output, which changes with every version of the data.
+
+        Args:
+                name (str): name of the output
+                project (:class:`~project.models.Project`): the project
+
+        Returns:
+                str: entity tag of the output
+        """
+        return sha1(cls.key(name, project).encode("utf-8")).hexdigest()
+
+    def get_or_create(self, name, project, create):
+        """
+        Get an output from the backend, or create and cache it.
+
+        Args:
+                name (str): name of the output
+                project (:class:`~project.models.Project`): the project
+                create (callable): function to render the output, returns ``None``
+                                                if there is nothing to cache
+
+        Returns:
+                str or None: the output
+        """
+        backend = self.backend
+        if backend is None:
+            return create()
+
+        key = self.key(name, project)
+        value = backend.get(key)
+        if value is None:
+            value = create()
+            if value is not None:
+                backend.set(key, value)
+        return value
+
+
+class FragmentCache(object):
+    """
+    Flask extension to keep rendered fragments of pages that never change, e.g. the questions
+    of a batch, in a :class:`MemoryBackend` of ``FRAGMENT_CACHE_SIZE`` entries. Each event of
+    the cache is passed to ``FRAGMENT_CACHE_METRICS``, if it is set.
+
+    Args:
+            app (:flask:`Flask <flask.Flask>`, optional): application
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        Create the cache of the application, none if ``FRAGMENT_CACHE_SIZE`` is ``0``.
+
+        Args:
+                app (:flask:`Flask <flask.Flask>`): application
+        """
+        size = app.config.get("FRAGMENT_CACHE_SIZE", 256)
+        app.extensions["fragment_cache"] = (
+            MemoryBackend(size, on_event=app.config.get("FRAGMENT_CACHE_METRICS")) if size else None
+        )
+
+    @property
+    def backend(self):
+        """
+        Backend of the current application, ``None`` if fragments are not cached.
+        """
+        return current_app.extensions.get("fragment_cache")
+
+    def get_or_create(self, key, create):
+        """
+        Get a fragment from the cache, or create and cache it.
+
+        Args:
+                key (str): key of the fragment, e.g. ``'questions:<batch id>:<prefix>'``
+                create (callable): function to render the fragment
+
+        Returns:
+                the fragment
+        """
+        backend = self.backend
+        if backend is None:
+            return create()
+
+        value = backend.get(key)
+        if value is None:
+            value = create()
+            backend.set(key, value)
+        return value
+
+
+def write_atomic(path, write, mode="w", **kwargs):
+    """
+    Write a file through a temporary file that replaces it at once,
+    so that no one reads a half written file.
+
+    Args:
+            path (str): path of the file
+            write (callable): function writing the content into the open file
+            mode (str, optional): mode to open the file, *default:* ``'w'``
+            **kwargs: other arguments of :func:`open`, e.g. ``encoding``
+    """
+    tmp_path = "%s.%d.tmp" % (path, os.getpid())
+    with open(tmp_path, mode, **kwargs) as file:
+        write(file)
+    os.replace(tmp_path, path)
+
+
+def evict_oldest(directory, prefix, suffix, max_entries=None, max_size=None):
+    """
+    Remove the least recently used files (by modification time) of a directory
+    whose names start with ``prefix`` and end with ``suffix``, until there are at most
+    ``max_entries`` of them and they are not larger than ``max_size`` in total.
+    Files removed by others in the meantime are skipped.
+
+    Args:
+            directory (str): the directory
+            prefix (str): prefix of the names, e.g. ``'output-'``
+            suffix (str): suffix of the names, e.g. ``'.txt'``
+            max_entries (int, optional): maximum number of files, *default:* ``None`` (no limit)
+            max_size (int, optional): maximum size of all files in bytes, *default:* ``None`` (no limit)
+    """
+    entries = []
+    for entry in os.scandir(directory):
+        if entry.name.startswith(prefix) and entry.name.endswith(suffix):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+    count, size = len(entries), sum(entry[1] for entry in entries)
+    for _, entry_size, path in sorted(entries):
+        if (max_entries is None or count <= max_entries) and (max_size is None or size <= max_size):
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        count, size = count - 1, size - entry_size
+
+
+def create_backend(config):
+    """
+    Create the backend of :class:`ResultCache` from a configuration.
+
+    Args:
+            config (dict): configuration with ``RESULT_CACHE``, ``RESULT_CACHE_SIZE``,
+                                    ``RESULT_CACHE_DIR``, ``RESULT_CACHE_URL`` and ``RESULT_CACHE_TTL``
+
+    Returns:
+            backend or None: the backend, ``None`` if outputs are not cached
+    """
+    backend = config.get("RESULT_CACHE")
+    if backend is None:
+        return None
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown result cache '{backend}', choose one of {', '.join(BACKENDS)}.")
+
+    if backend == "memory":
+        return MemoryBackend(config.get("RESULT_CACHE_SIZE", 128))
+    if backend == "filesystem":
+        return FileSystemBackend(config["RESULT_CACHE_DIR"], config.get("RESULT_CACHE_SIZE", 128))
+    return RedisBackend.from_url(config["RESULT_CACHE_URL"], ttl=config.get("RESULT_CACHE_TTL", 86400))
@@ -8,10 +8,32 @@ outside the application as it works independently.
 
 """
 
-from statistics import stdev
+import os
+import time
+from hashlib import sha1
+from array import array
+from codecs import getincrementaldecoder
+from functools import partial
+from math import comb, sqrt
 from collections import Counter
-from random import shuffle, choice
-from itertools import product, chain
+from random import Random, shuffle, randrange
+from itertools import chain, combinations, cycle, pairwise
+from concurrent.futures import ProcessPoolExecutor
+from .cache import evict_oldest, write_atomic
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional, only the "numpy" engine needs it
+    np = None
+
+ENGINES = ("python", "numpy")
+"""
+Available engines for :meth:`DataGenerator.generate_tuples`:
+
+        * ``python``: the reimplementation with sets, works without any extra dependency
+        * ``numpy``: items are mapped to integer ids and designs are built as
+          ``(n_tuples, tuple_size)`` arrays, requires `NumPy <https://numpy.org/>`__
+"""
 
 
 class BaseGenerator(object):
@@ -50,6 +72,198 @@ class BaseGenerator(object):
         return Counter(chain(*tuples))
 
 
+class PairBalance(object):
+    """
+    Keep track of how often each pair of items appears together in a tuple, while
+    tuples are added to or removed from a design. Only the running sum and sum of
+    squares of the pair frequencies are needed, so the standard deviation of the
+    frequencies is available at any time in ``O(1)``.
+
+    Items are given as integer ids, a pair ``(a, b)`` with ``a < b`` is stored
+    under the integer key ``a * n_items + b``.
+
+    Args:
+            n_items (int): number of items, ids are ``0 .. n_items-1``
+
+    Attributes:
+            counts (dict(int = int)): frequency of each pair that appears at least once
+            total (int): sum of all pair frequencies
+            total_sq (int): sum of all squared pair frequencies
+
+    Examples:
+            >>> balance = PairBalance(n_items=4)
+            >>> balance.add((0, 1, 2))
+            >>> balance.add((1, 2, 3))
+            >>> balance.stdev
+            0.4472135954999579
+            >>> balance.remove((1, 2, 3))
+            >>> balance.stdev
+            0.0
+
+    """
+
+    def __init__(self, n_items):
+        self.n_items = n_items
+        self.counts = {}
+        self.total = 0
+        self.total_sq = 0
+
+    def update(self, item1, item2, delta):
+        """
+        Change the frequency of the pair ``(item1, item2)`` by ``delta``.
+
+        Args:
+                item1 (int): id of the first item
+                item2 (int): id of the second item
+                delta (int): change of the frequency
+        """
+        key = item1 * self.n_items + item2 if item1 < item2 else item2 * self.n_items + item1
+        old = self.counts.get(key, 0)
+        new = old + delta
+
+        if new:
+            self.counts[key] = new
+        else:
+            del self.counts[key]
+
+        self.total += delta
+        self.total_sq += new * new - old * old
+
+    def add(self, tuple_):
+        """
+        Count all pairs of items of a new tuple.
+
+        Args:
+                tuple_ (list(int) or tuple(int)): item ids of the tuple
+        """
+        for item1, item2 in combinations(tuple_, 2):
+            self.update(item1, item2, 1)
+
+    def remove(self, tuple_):
+        """
+        Discount all pairs of items of a removed tuple.
+
+        Args:
+                tuple_ (list(int) or tuple(int)): item ids of the tuple
+        """
+        for item1, item2 in combinations(tuple_, 2):
+            self.update(item1, item2, -1)
+
+    @property
+    def variance(self):
+        """
+        float: sample variance of the frequencies of all pairs that appear at least once.
+        """
+        n_pairs = len(self.counts)
+        if n_pairs < 2:
+            return 0.0
+        return (n_pairs * self.total_sq - self.total * self.total) / (n_pairs * (n_pairs - 1))
+
+    @property
+    def stdev(self):
+        """
+        float: sample standard deviation of the frequencies, the two-way balance of the design.
+        """
+        return sqrt(self.variance)
+
+
+class DesignCache(object):
+    """
+    Store designs of item ids on disk to reuse them for later uploads. A design
+    only depends on the number of items, :attr:`DataGenerator.tuple_size`,
+    :attr:`DataGenerator.factor`, :attr:`DataGenerator.seed` and the options of the search
+    that affect its quality (see :meth:`DataGenerator.search_options`), the items themselves
+    are mapped onto it. Designs are saved as compact binary arrays of 32-bit ints,
+    the least recently used ones are removed once the cache grows over ``max_size``.
+
+    Args:
+            directory (str): directory of the cache, created if it does not exist
+            max_size (int, optional): maximum size of all designs in bytes,
+                            *default:* ``104857600`` (100 MB)
+
+    Examples:
+            >>> cache = DesignCache('/tmp/designs')
+            >>> cache.put([[0, 1, 2, 3], [1, 2, 4, 0]], n_items=5, tuple_size=4, factor=2)
+            >>> cache.get(n_items=5, tuple_size=4, factor=2)
+            [[0, 1, 2, 3], [1, 2, 4, 0]]
+
+    """
+
+    def __init__(self, directory, max_size=100 * 2**20):
+        self.directory = directory
+        self.max_size = max_size
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, n_items, tuple_size, factor, seed=None, options=None):
+        """
+        Get the file of a design.
+
+        Args:
+                n_items (int): number of items
+                tuple_size (int): size of each tuple
+                factor (int or float): factor of the number of tuples
+                seed (int, optional): seed of the design, ``None`` for any design of this shape
+                options (dict, optional): options of the search that created the design,
+                                e.g. ``{'engine': 'python', 'num_iter': 100}``, *default:* ``None``
+
+        Returns:
+                str: path of the file
+        """
+        seed = "any" if seed is None else seed
+        name = "design-%d-%d-%g-%s" % (n_items, tuple_size, factor, seed)
+        if options:
+            name += "-" + sha1(repr(sorted(options.items())).encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.directory, name + ".bin")
+
+    def get(self, n_items, tuple_size, factor, seed=None, options=None):
+        """
+        Load a design and mark it as recently used.
+
+        Args:
+                n_items (int): number of items
+                tuple_size (int): size of each tuple
+                factor (int or float): factor of the number of tuples
+                seed (int, optional): seed of the design
+                options (dict, optional): options of the search that created the design
+
+        Returns:
+                list(list(int)) or None: the design, ``None`` if it is not cached
+        """
+        path = self.path(n_items, tuple_size, factor, seed, options)
+        design = array("i")
+        try:
+            with open(path, "rb") as file:
+                design.frombytes(file.read())
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+
+        return [design[i : i + tuple_size].tolist() for i in range(0, len(design), tuple_size)]
+
+    def put(self, design, n_items, tuple_size, factor, seed=None, options=None):
+        """
+        Save a design, then remove the least recently used designs
+        if the cache is larger than :attr:`max_size`.
+
+        Args:
+                design (list(list(int))): design of item ids
+                n_items (int): number of items
+                tuple_size (int): size of each tuple
+                factor (int or float): factor of the number of tuples
+                seed (int, optional): seed of the design
+                options (dict, optional): options of the search that created the design
+        """
+        path = self.path(n_items, tuple_size, factor, seed, options)
+        write_atomic(path, array("i", chain(*design)).tofile, "wb")
+        self.evict()
+
+    def evict(self):
+        """
+        Remove the least recently used designs until the cache is not larger than :attr:`max_size`.
+        """
+        evict_oldest(self.directory, "design-", ".bin", max_size=self.max_size)
+
+
 class DataGenerator(BaseGenerator):
     """
     Extend :class:`BaseGenerator`. Create an object of input data for the
@@ -61,6 +275,27 @@ class DataGenerator(BaseGenerator):
             batch_size (int, optional): size of a normal batch, *default:* ``20``
             minimum (int, optional): minimum size of a batch to be formed if the
                                     rest items do not meet the normal size, *default:* ``5``
+            engine (str, optional): engine used to generate tuples, one of :data:`ENGINES`,
+                                    *default:* ``python``
+            workers (int, optional): number of processes to run the iterations in parallel,
+                                    *default:* ``1`` (no extra process)
+            seed (int, optional): seed of the random generators to get reproducible tuples,
+                                    *default:* ``None`` (a new seed each time)
+            patience (int, optional): stop after this number of iterations without a better score,
+                                    *default:* ``None`` (never)
+            target_score (float, optional): stop once the score is not higher than this value,
+                                    *default:* ``None`` (never)
+            time_budget (float, optional): stop once this number of seconds is used up,
+                                    *default:* ``None`` (no limit)
+            refine_steps (int, optional): number of swaps tried to refine the best design,
+                                    *default:* ``0`` (no refinement)
+            cache (DesignCache, optional): cache of designs to reuse, *default:* ``None``
+            balanced_batches (bool, optional): whether to divide tuples into batches of
+                                    (almost) equal size, *default:* ``False``
+
+    Raises:
+            ValueError: if ``engine`` is unknown.
+            ImportError: if ``engine`` is ``numpy`` but NumPy is not installed.
 
     Attributes:
             items (set): the unique given items
@@ -77,6 +312,17 @@ class DataGenerator(BaseGenerator):
                             *default:* ``2`` if fewer than 10000 items
             tuple_size (int): size of each tuple, *default:* ``4`` if fewer than 1000
                             items else ``5``
+            engine (str): engine used to generate tuples, *default:* ``python``
+            workers (int): number of processes to generate tuples, *default:* ``1``
+            seed (int or None): seed to generate tuples, *default:* ``None``
+            patience (int or None): iterations without improvement before stopping, *default:* ``None``
+            target_score (float or None): score to stop at, *default:* ``None``
+            time_budget (float or None): time limit in seconds to generate tuples, *default:* ``None``
+            refine_steps (int): number of swaps tried to refine the best design, *default:* ``0``
+            cache (DesignCache or None): cache of designs, *default:* ``None``
+            balanced_batches (bool): whether batch sizes differ by at most one, *default:* ``False``
+            iterations_run (int): number of iterations run by the last :meth:`generate_tuples`
+            best_score (float): score (standard deviation of pair frequencies) of :attr:`tuples`
 
     Examples:
             >>> example = open('../examples/movie_reviews_examples.txt','rb')
@@ -94,7 +340,26 @@ class DataGenerator(BaseGenerator):
 
     """
 
-    def __init__(self, num_iter=100, batch_size=20, minimum=5):
+    def __init__(
+        self,
+        num_iter=100,
+        batch_size=20,
+        minimum=5,
+        engine="python",
+        workers=1,
+        seed=None,
+        patience=None,
+        target_score=None,
+        time_budget=None,
+        refine_steps=0,
+        cache=None,
+        balanced_batches=False,
+    ):
+        if engine not in ENGINES:
+            raise ValueError("Unknown engine %r, use one of %s" % (engine, ", ".join(ENGINES)))
+        if engine == "numpy" and np is None:
+            raise ImportError("The 'numpy' engine requires NumPy to be installed")
+
         # initialize all data: items, tuples, batches
         self.items = set()
         self.tuples = []
@@ -111,6 +376,39 @@ class DataGenerator(BaseGenerator):
         # set tuple size
         self.tuple_size = 5 if len(self.items) > 1000 else 4
 
+        self.engine = engine
+        self.workers = workers
+        self.seed = seed
+
+        # convergence policy and its outcome
+        self.patience = patience
+        self.target_score = target_score
+        self.time_budget = time_budget
+        self.refine_steps = refine_steps
+        self.cache = cache
+        self.balanced_batches = balanced_batches
+        self.iterations_run = 0
+        self.best_score = None
+
+    def search_options(self):
+        """
+        Get the options of the search for tuples that affect the quality of the design,
+        a design is only taken from the :attr:`cache` if it was created with the same ones.
+        The number of :attr:`workers` does not change the design.
+
+        Returns:
+                dict: :attr:`engine`, :attr:`num_iter`, :attr:`patience`, :attr:`target_score`,
+                :attr:`time_budget` and :attr:`refine_steps`
+        """
+        return dict(
+            engine=self.engine,
+            num_iter=self.num_iter,
+            patience=self.patience,
+            target_score=self.target_score,
+            time_budget=self.time_budget,
+            refine_steps=self.refine_steps,
+        )
+
     def generate_tuples(self):
         """
         Generate tuples, this is a reimplementation of `generate-BWS-tuples.pl`
@@ -123,6 +421,23 @@ class DataGenerator(BaseGenerator):
                 2. each item in the item list appears approximately in the same number of tuples;
                 3. each pair of items appears approximately in the same number of tuples.
 
+        Each of the :attr:`num_iter` iterations is an independent random restart with its
+        own seed derived from :attr:`seed`. If :attr:`workers` is greater than ``1``, the
+        iterations are spread over a :futures:`ProcessPoolExecutor <concurrent.futures.ProcessPoolExecutor>`
+        and only the best design of each worker is sent back. The result does not depend
+        on the number of workers.
+
+        The iterations stop early according to :attr:`patience`, :attr:`target_score` and
+        :attr:`time_budget`. With several workers, each worker applies this policy to its own
+        share of the iterations.
+
+        If :attr:`refine_steps` is set, the best design is then improved with
+        :func:`refine_design`, so that fewer iterations are needed for a well balanced design.
+
+        If a :attr:`cache` is given, a cached design of the same shape, created by a search
+        with the same :meth:`search_options`, is used instead and no iteration runs at all.
+        Otherwise the new design is saved in the cache.
+
         Returns:
                 list: update list of all unique generated tuples with the best results
                 after all (attribute :attr:`tuples`).
@@ -131,8 +446,6 @@ class DataGenerator(BaseGenerator):
                 ValueError: if the number of :attr:`items` is fewer than :attr:`tuple_size`.
 
         """
-        create_key = lambda i1, i2: "%s-%s" % (i1, i2)
-
         # sort the items
         items = sorted(list(self.items))
 
@@ -144,102 +457,75 @@ class DataGenerator(BaseGenerator):
             raise ValueError("""The number of unique items is less than the number 
 										of items requested per tuple""")
 
-        # generate tuples
-        number_tuples = int(0.5 + self.factor * num_items)
+        # reuse a cached design, the items are placed randomly onto a design shared between uploads
+        if self.cache is not None:
+            design = self.cache.get(num_items, self.tuple_size, self.factor, self.seed, self.search_options())
+            if design is not None:
+                if self.seed is None:
+                    shuffle(items)
 
-        # try many iterations of different randomizations
-        best_score = 0
-        best_tuples = []
-        iter_ = 0
-
-        for i_iter in range(self.num_iter):
-            # print('Iteration %d'%(i_iter+1))
-
-            # generate tuples by randomly sampling without replacement
-            tuples = []
-
-            count = 1
-
-            # make a random list of items
-            random_items = items[:]
-            shuffle(random_items)
+                balance = PairBalance(num_items)
+                for tuple_ in design:
+                    balance.add(tuple_)
 
-            freq_pair = {}
+                self.best_score = balance.stdev
+                self.iterations_run = 0
+                self.tuples = [[items[i] for i in tuple_] for tuple_ in design]
+                return
 
-            # set index of current item in the random list
-            curr_ind = 0
+        # generate tuples, there cannot be more unique tuples than combinations of items
+        number_tuples = min(int(0.5 + self.factor * num_items), comb(num_items, self.tuple_size))
 
-            while count <= number_tuples:
-                # new tuple
-                new_tuple = set()
+        seed = self.seed if self.seed is not None else randrange(2**32)
+        args = (self.engine, num_items, self.tuple_size, number_tuples, seed)
+        policy = dict(patience=self.patience, target_score=self.target_score, time_budget=self.time_budget)
 
-                # check if there are enough remained items in the random list for a new tuple
-                if (curr_ind + self.tuple_size) <= len(random_items):
-                    # set a new tuple with tuple_size items in the random list
-                    # starting at index curr_ind
-                    new_tuple = set(random_items[curr_ind : curr_ind + self.tuple_size])
-                    curr_ind += self.tuple_size
-
-                # get the rest of the list
-                else:
-                    # the number of items that we will need to get from a new random list
-                    need_more = self.tuple_size - len(random_items) + curr_ind
-
-                    while curr_ind < len(random_items):
-                        new_tuple.add(random_items[curr_ind])
-                        curr_ind += 1
-
-                    # generate a new random list of items
-                    random_items = items[:]
-                    shuffle(random_items)
-
-                    for curr_ind in range(need_more):
-                        # if there is a duplicate item, move it to the end of the list
-                        while random_items[curr_ind] in new_tuple:
-                            dup = random_items.pop(curr_ind)
-                            random_items.append(dup)
-
-                        new_tuple.add(random_items[curr_ind])
-
-                # check whether this new_tuple already in the list of tuples
-                if new_tuple not in tuples:
-                    tuples.append(new_tuple)
-                    count += 1
-                else:
-                    continue
-
-                # add frequencies of pairs of items
-                for item1, item2 in product(new_tuple, new_tuple):
-                    if item1 < item2:
-                        key = create_key(item1, item2)
-
-                    else:
-                        key = create_key(item2, item1)
-
-                    if key in freq_pair:
-                        freq_pair[key] += 1
-                    else:
-                        freq_pair[key] = 1
+        # try many iterations of different randomizations
+        if self.workers > 1 and self.num_iter > 1:
+            # split the iterations into contiguous chunks, one per worker
+            n_workers = min(self.workers, self.num_iter)
+            bounds = [self.num_iter * w // n_workers for w in range(n_workers + 1)]
+
+            with ProcessPoolExecutor(max_workers=n_workers) as executor:
+                futures = [
+                    executor.submit(search_designs, *args, range(start, stop), **policy)
+                    for start, stop in pairwise(bounds)
+                ]
+                results = [future.result() for future in futures]
+
+            # keep the earliest iteration among equal scores, as in a serial run
+            best_score, _, best_design, _ = min(results, key=lambda result: result[:2])
+            iterations_run = sum(result[3] for result in results)
+        else:
+            best_score, _, best_design, iterations_run = search_designs(*args, range(self.num_iter), **policy)
 
-            # calculate the two-way balance of the set of tuples
-            freq_pair_values = freq_pair.values()
+        self.best_score = best_score
+        self.iterations_run = iterations_run
 
-            # calculate the score for the set and keep the best score and the best set
-            score = stdev(freq_pair_values)
+        if self.engine == "numpy":
+            best_design = best_design.tolist()
 
-            if i_iter == 0 or score < best_score:
-                best_score = score
-                best_tuples = tuples[:]
-                # iter_ = i_iter
+        # improve the best design by swapping items between tuples
+        if self.refine_steps:
+            rng = Random(iteration_seed(seed, self.num_iter))
+            best_design, self.best_score = refine_design(best_design, num_items, self.refine_steps, rng)
 
-        # print('Choose from iteration {} with score {}'.format(iter_+1, best_score))
+        if self.cache is not None:
+            self.cache.put(best_design, num_items, self.tuple_size, self.factor, self.seed, self.search_options())
 
-        self.tuples = [list(best_tuple) for best_tuple in best_tuples]
+        self.tuples = [[items[i] for i in best_tuple] for best_tuple in best_design]
 
     def generate_batches(self):
         """
         Split the whole set of tuples into batches.
 
+        The tuples are shuffled and cut into batches of :attr:`batch_size`. If the rest
+        cannot fill a batch of :attr:`minimum` size, the rest tuples are spread round-robin
+        over the formed batches in random order, so no batch gets more than one extra tuple
+        before every batch has got one. If :attr:`balanced_batches` is set, the tuples are
+        instead divided into batches whose sizes differ by at most one. Both run in linear
+        time and are reproducible with :attr:`seed`.
+
         Returns:
                 dict(int = list): update all batches prepared for questionnaire
                                 (attribute :attr:`batches`).
@@ -260,57 +546,70 @@ class DataGenerator(BaseGenerator):
             self.batch_size = 5
             self.minimum = 3
 
-        remained = n_tuples % self.batch_size
+        rng = Random(self.seed)
+        rng.shuffle(self.tuples)
+        self.batches = {}
 
-        shuffle(self.tuples)
+        # divide the tuples into batches whose sizes differ by at most one
+        if self.balanced_batches:
+            n_batches = max(1, round(n_tuples / self.batch_size))
+            bounds = [n_tuples * b // n_batches for b in range(n_batches + 1)]
+            for count, (start, stop) in enumerate(pairwise(bounds)):
+                self.batches[count + 1] = self.tuples[start:stop]
+            return
+
+        remained = n_tuples % self.batch_size
+        n_full = n_tuples - remained
 
         # divide the tuples into batches
-        for count, i in enumerate(range(0, n_tuples - remained, self.batch_size)):
+        for count, i in enumerate(range(0, n_full, self.batch_size)):
             self.batches[count + 1] = self.tuples[i : i + self.batch_size]
 
+        remained_tuples = self.tuples[n_full:]
+
         # set this batch with minimum size if it cannot fulfill the normally set batch size
-        if remained >= self.minimum:
-            self.batches[count + 2] = self.tuples[i + self.batch_size :]
+        if remained >= self.minimum or not self.batches:
+            self.batches[len(self.batches) + 1] = remained_tuples
 
         # if the number of remained items cannot fulfill the minimum size condition,
-        # try to randomly add each of the rest tuples into the formed batches
+        # add each of the rest tuples to the formed batches, one batch after another in random order
         else:
-            chosen_batches = []
-            remained_tuples = self.tuples[i + self.batch_size :]
-
-            while len(remained_tuples) > 0:
-                tuple_ = remained_tuples.pop()
-
-                # choose randomly a batch to add tuple
-                i_batch = choice(list(self.batches.keys()))
-
-                # check if all batches already have new randomly added tuples
-                # while there are still remained tuples
-                while i_batch in chosen_batches:
-                    if len(chosen_batches) < len(self.batches):
-                        i_batch = choice(list(self.batches.keys()))
-
-                    # set the check to null again
-                    else:
-                        chosen_batches = []
+            i_batches = list(self.batches)
+            rng.shuffle(i_batches)
 
+            for tuple_, i_batch in zip(remained_tuples, cycle(i_batches)):
                 self.batches[i_batch].append(tuple_)
-                chosen_batches.append(i_batch)
 
-    def generate_items(self, file_name):
+    def generate_items(self, file_name, chunk_size=2**16):
         """
         Read uploaded *txt*-file. Accept only one file each time.
 
+        The file is read in chunks of ``chunk_size`` bytes and decoded incrementally,
+        so a character split between two chunks is still decoded correctly. Every
+        line is one item, surrounding whitespace is removed and empty lines are skipped.
+        Only the unique items are kept in memory, never the whole file.
+
         Args:
                 file_name (:dat-struct:`FileStorage <werkzeug.datastructures.FileStorage>` or :reader:`io.BufferedReader <io.BufferedReader>`): uploaded file
+                chunk_size (int, optional): number of bytes read at once, *default:* ``65536``
 
         Returns:
                 list: update list of items with this file (attribute :attr:`items`).
 
         """
-        input_file = file_name.read().decode(encoding="utf-8", errors="ignore").strip()
-        data = input_file.split("\n") if input_file != "" else []
-        self.items = self.items.union(set(data))
+        decoder = getincrementaldecoder("utf-8")(errors="ignore")
+        rest = ""
+
+        for chunk in iter(partial(file_name.read, chunk_size), b""):
+            lines = (rest + decoder.decode(chunk)).split("\n")
+
+            # the last line may continue in the next chunk
+            rest = lines.pop()
+            self.items.update(line for line in map(str.strip, lines) if line)
+
+        rest = (rest + decoder.decode(b"", final=True)).strip()
+        if rest:
+            self.items.add(rest)
 
     def generate_data(self):
         """
@@ -321,6 +620,289 @@ class DataGenerator(BaseGenerator):
         self.generate_batches()
 
 
+def iteration_seed(seed, i_iter):
+    """
+    Derive the seed of one iteration from the seed of the whole search, so that
+    every iteration is reproducible no matter which process runs it.
+
+    Args:
+            seed (int): seed of the search
+            i_iter (int): index of the iteration
+
+    Returns:
+            int: seed of the iteration
+    """
+    return (seed << 32) + i_iter
+
+
+def search_designs(
+    engine, n_items, tuple_size, n_tuples, seed, iterations, patience=None, target_score=None, time_budget=None
+):
+    """
+    Run the given iterations of random restarts and keep the best design.
+    This is a module level function so that it can be sent to worker processes.
+
+    The search stops early, always after at least one iteration, once ``patience``
+    iterations in a row did not improve the score, once the score reaches
+    ``target_score`` or once ``time_budget`` seconds are used up.
+
+    Args:
+            engine (str): one of :data:`ENGINES`
+            n_items (int): number of items
+            tuple_size (int): size of each tuple
+            n_tuples (int): number of tuples of a design
+            seed (int): seed of the search, see :func:`iteration_seed`
+            iterations (range): indices of the iterations to run
+            patience (int, optional): number of iterations without improvement before stopping
+            target_score (float, optional): score that is good enough to stop
+            time_budget (float, optional): maximum duration of the search in seconds
+
+    Returns:
+            tuple(float, int, list or numpy.ndarray, int): best score, index of its iteration,
+            the design of item ids and the number of iterations run
+    """
+    deadline = time.monotonic() + time_budget if time_budget is not None else None
+
+    best = None
+    n_run = without_improvement = 0
+    for i_iter in iterations:
+        if engine == "numpy":
+            design = numpy_design(n_items, tuple_size, n_tuples, np.random.default_rng(iteration_seed(seed, i_iter)))
+            score = numpy_score(design, n_items)
+        else:
+            design, score = python_design(n_items, tuple_size, n_tuples, Random(iteration_seed(seed, i_iter)))
+
+        n_run += 1
+        if best is None or score < best[0]:
+            best = (score, i_iter, design)
+            without_improvement = 0
+        else:
+            without_improvement += 1
+
+        # check the convergence policy
+        if (
+            (patience is not None and without_improvement >= patience)
+            or (target_score is not None and best[0] <= target_score)
+            or (deadline is not None and time.monotonic() >= deadline)
+        ):
+            break
+
+    return best + (n_run,)
+
+
+def python_design(n_items, tuple_size, n_tuples, rng):
+    """
+    Build one random design on item ids ``0 .. n_items-1`` with the ``python`` engine
+    and calculate its two-way balance.
+
+    Args:
+            n_items (int): number of items
+            tuple_size (int): size of each tuple
+            n_tuples (int): number of tuples, at most ``comb(n_items, tuple_size)``
+            rng (random.Random): random generator
+
+    Returns:
+            tuple(list(list(int)), float): the design and its score, lower is better
+    """
+    items = list(range(n_items))
+
+    # generate tuples by randomly sampling without replacement
+    tuples = []
+    seen = set()
+
+    # make a random list of items
+    random_items = items[:]
+    rng.shuffle(random_items)
+
+    balance = PairBalance(n_items)
+
+    # set index of current item in the random list
+    curr_ind = 0
+
+    while len(tuples) < n_tuples:
+        # check if there are enough remained items in the random list for a new tuple
+        if (curr_ind + tuple_size) <= len(random_items):
+            # set a new tuple with tuple_size items in the random list
+            # starting at index curr_ind
+            new_tuple = random_items[curr_ind : curr_ind + tuple_size]
+            curr_ind += tuple_size
+
+        # get the rest of the list
+        else:
+            # the number of items that we will need to get from a new random list
+            need_more = tuple_size - len(random_items) + curr_ind
+            new_tuple = random_items[curr_ind:]
+
+            # generate a new random list of items
+            random_items = items[:]
+            rng.shuffle(random_items)
+
+            for curr_ind in range(need_more):
+                # if there is a duplicate item, move it to the end of the list
+                while random_items[curr_ind] in new_tuple:
+                    dup = random_items.pop(curr_ind)
+                    random_items.append(dup)
+
+                new_tuple.append(random_items[curr_ind])
+
+            # continue right after the items used for this tuple
+            curr_ind = need_more
+
+        # check whether this new_tuple already in the list of tuples
+        key_tuple = frozenset(new_tuple)
+        if key_tuple in seen:
+            continue
+        seen.add(key_tuple)
+        tuples.append(new_tuple)
+
+        # add frequencies of pairs of items
+        balance.add(new_tuple)
+
+    # the score for the set is the two-way balance of the set of tuples
+    return tuples, balance.stdev
+
+
+def refine_design(design, n_items, steps, rng):
+    """
+    Refine a design by local search: swap two items between two tuples and keep
+    the swap only if it lowers the variance of the pair frequencies.
+
+    A swap moves each of both items into the other tuple, so every item keeps
+    its frequency. Swaps that would put an item twice into a tuple or create a
+    tuple that already exists are skipped. Each swap only touches the pairs of
+    both tuples, so it costs ``O(tuple_size)`` with :class:`PairBalance`.
+
+    Args:
+            design (list(list(int))): design of item ids
+            n_items (int): number of items
+            steps (int): number of swaps to try
+            rng (random.Random): random generator
+
+    Returns:
+            tuple(list(list(int)), float): the refined design and its score
+    """
+    design = [list(tuple_) for tuple_ in design]
+    seen = set(frozenset(tuple_) for tuple_ in design)
+
+    balance = PairBalance(n_items)
+    for tuple_ in design:
+        balance.add(tuple_)
+
+    def move(tuple_, old, new, skip):
+        # replace item old by item new in the pairs with the other items of tuple_
+        for other in tuple_:
+            if other != skip:
+                balance.update(old, other, -1)
+                balance.update(new, other, 1)
+
+    for _ in range(steps):
+        i1, i2 = rng.randrange(len(design)), rng.randrange(len(design))
+        tuple1, tuple2 = design[i1], design[i2]
+        pos1, pos2 = rng.randrange(len(tuple1)), rng.randrange(len(tuple2))
+        item1, item2 = tuple1[pos1], tuple2[pos2]
+
+        if i1 == i2 or item1 in tuple2 or item2 in tuple1:
+            continue
+
+        new1 = tuple1[:pos1] + [item2] + tuple1[pos1 + 1 :]
+        new2 = tuple2[:pos2] + [item1] + tuple2[pos2 + 1 :]
+        key1, key2 = frozenset(new1), frozenset(new2)
+        if key1 in seen or key2 in seen:
+            continue
+
+        variance = balance.variance
+        move(tuple1, item1, item2, skip=item1)
+        move(tuple2, item2, item1, skip=item2)
+
+        if balance.variance < variance:
+            seen.difference_update((frozenset(tuple1), frozenset(tuple2)))
+            seen.update((key1, key2))
+            design[i1], design[i2] = new1, new2
+        else:
+            # undo the swap
+            move(tuple2, item1, item2, skip=item2)
+            move(tuple1, item2, item1, skip=item1)
+
+    return design, balance.stdev
+
+
+def numpy_design(n_items, tuple_size, n_tuples, rng):
+    """
+    Build one random design with the same sampling scheme as
+    :meth:`DataGenerator.generate_tuples`, on item ids ``0 .. n_items-1``.
+
+    Random permutations of all ids are cut into consecutive tuples. A tuple that
+    spans two permutations is completed from the next one, duplicated ids are
+    moved to the end of that permutation. Repeated tuples are dropped, keeping
+    the first occurrence, until ``n_tuples`` unique tuples are found.
+
+    Args:
+            n_items (int): number of items
+            tuple_size (int): size of each tuple
+            n_tuples (int): number of tuples, at most ``comb(n_items, tuple_size)``
+            rng (numpy.random.Generator): random generator
+
+    Returns:
+            numpy.ndarray: int array of shape ``(n_tuples, tuple_size)``
+    """
+    blocks = []
+    n_rows = 0
+    leftover = np.empty(0, dtype=np.int64)
+
+    while True:
+        perm = rng.permutation(n_items)
+        start = 0
+
+        # complete the tuple from the end of the previous permutation
+        if leftover.size:
+            need = tuple_size - leftover.size
+            dup = np.isin(perm, leftover)
+            taken = np.flatnonzero(~dup)[:need]
+            cut = taken[-1] + 1
+            perm = np.concatenate([perm[taken], perm[cut:], perm[:cut][dup[:cut]]])
+            blocks.append(np.concatenate([leftover, perm[:need]])[None, :])
+            n_rows += 1
+            start = need
+
+        n_full = (n_items - start) // tuple_size
+        end = start + n_full * tuple_size
+        blocks.append(perm[start:end].reshape(n_full, tuple_size))
+        leftover = perm[end:]
+        n_rows += n_full
+
+        if n_rows >= n_tuples:
+            design = np.concatenate(blocks)
+
+            # keep only the first occurrence of each tuple, in order of generation
+            _, first = np.unique(np.sort(design, axis=1), axis=0, return_index=True)
+            if first.size >= n_tuples:
+                return design[np.sort(first)[:n_tuples]]
+
+
+def numpy_score(design, n_items):
+    """
+    Calculate the two-way balance of a design: the standard deviation of the
+    frequencies of all pairs of items that appear together in a tuple. This is
+    the vectorized counterpart of :attr:`PairBalance.stdev`.
+
+    Args:
+            design (numpy.ndarray): int array of shape ``(n_tuples, tuple_size)``
+            n_items (int): number of items
+
+    Returns:
+            float: the score, lower is better
+    """
+    # encode each unordered pair (a, b) with a < b as a single integer
+    keys = np.concatenate(
+        [
+            np.minimum(design[:, i], design[:, j]) * n_items + np.maximum(design[:, i], design[:, j])
+            for i, j in combinations(range(design.shape[1]), 2)
+        ]
+    )
+    _, counts = np.unique(keys, return_counts=True)
+    return float(counts.std(ddof=1)) if counts.size > 1 else 0.0
+
+
 class ScoreGenerator(BaseGenerator):
     """
     Create an object to calculate the scores of given items based on annotations.
@@ -371,3 +953,116 @@ class ScoreGenerator(BaseGenerator):
             else:
                 scores[item] = (pos - neg) / self.frequencies[item]
         return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+    @classmethod
+    def from_counts(cls, frequencies, best, worst):
+        """
+        Create an object from counts that are already aggregated, e.g. in the database.
+        ``scores.txt`` is calculated this way from the counts of each item kept up to date
+        on every submission (see :mod:`project.scores`), so its scoring only takes time
+        linear in the number of items, not in the number of annotations.
+
+        Args:
+                frequencies (dict): number of annotated tuples each item is in
+                best (dict): number of times each item is annotated as '**best**'
+                worst (dict): number of times each item is annotated as '**worst**'
+
+        Returns:
+                ScoreGenerator: object to calculate the scores with :meth:`scoring`
+
+        Examples:
+                >>> generator = ScoreGenerator.from_counts({'A': 2, 'B': 2}, best={'A': 2}, worst={'B': 1})
+                >>> generator.scoring()
+                [('A', 1.0), ('B', -0.5)]
+        """
+        generator = cls.__new__(cls)
+        generator.frequencies = frequencies
+        generator.best = best
+        generator.worst = worst
+        return generator
+
+    @classmethod
+    def score(cls, tuples, best, worst):
+        """
+        Calculate scores of annotated items given as integer ids with :func:`numpy_scoring`
+        if NumPy is installed, else with :meth:`scoring`. Both give the same result.
+
+        Args:
+                tuples (list(list(int)) or numpy.ndarray): item ids of the annotated tuples
+                best (list(int)): ids of items annotated as '**best**'
+                worst (list(int)): ids of items annotated as '**worst**'
+
+        Returns:
+                list(tuple(int, float)): descendingly sorted list of tuples ``(item id, score)``
+                based on scores
+        """
+        if np is not None:
+            return numpy_scoring(tuples, best, worst)
+        return cls(tuples, best, worst).scoring()
+
+
+def numpy_scoring(tuples, best, worst):
+    """
+    Vectorized counterpart of :meth:`ScoreGenerator.scoring` for integer item ids,
+    the counts are computed with :func:`numpy.bincount` instead of Counters.
+    Items with the same score keep the order of their first appearance in ``tuples``,
+    exactly as in :meth:`ScoreGenerator.scoring`.
+
+    Args:
+            tuples (list(list(int)) or numpy.ndarray): item ids of the annotated tuples
+            best (list(int) or numpy.ndarray): ids of items annotated as '**best**'
+            worst (list(int) or numpy.ndarray): ids of items annotated as '**worst**'
+
+    Returns:
+            list(tuple(int, float)): descendingly sorted list of tuples ``(item id, score)``
+            based on scores
+
+    Examples:
+            >>> numpy_scoring([(1, 2, 3), (2, 3, 4), (4, 1, 3)], best=[1, 2, 1], worst=[2, 4, 3])
+            [(1, 1.0), (2, 0.0), (3, -0.3333333333333333), (4, -0.5)]
+    """
+    if isinstance(tuples, np.ndarray):
+        flat = tuples.ravel().astype(np.int64, copy=False)
+    else:
+        flat = np.fromiter(chain.from_iterable(tuples), dtype=np.int64)
+
+    if not flat.size:
+        return []
+
+    # map the item ids onto 0 .. n_ids-1 with a lookup table if the ids are dense enough
+    # (as primary keys are), else by sorting
+    if flat.min() >= 0 and flat.max() < max(4 * flat.size, 2**20):
+        lookup = np.full(flat.max() + 1, -1, dtype=np.int64)
+        ids = np.flatnonzero(np.bincount(flat))
+        lookup[ids] = np.arange(ids.size)
+
+        def index(values):
+            inside = (values >= 0) & (values < lookup.size)
+            positions = np.full(values.size, -1, dtype=np.int64)
+            positions[inside] = lookup[values[inside]]
+            return positions
+
+    else:
+        ids = np.unique(flat)
+
+        def index(values):
+            positions = np.searchsorted(ids, values).clip(max=ids.size - 1)
+            return np.where(ids[positions] == values, positions, -1)
+
+    inverse = index(flat)
+    frequencies = np.bincount(inverse, minlength=ids.size)
+
+    def count(annotated):
+        # count annotated items, ignoring items that are in none of the tuples
+        positions = index(np.asarray(annotated, dtype=np.int64))
+        return np.bincount(positions[positions >= 0], minlength=ids.size)
+
+    scores = (count(best) - count(worst)) / frequencies
+
+    # order by first appearance, then stable by descending score
+    first = np.full(ids.size, flat.size, dtype=np.int64)
+    np.minimum.at(first, inverse, np.arange(flat.size))
+    order = np.argsort(first, kind="stable")
+    order = order[np.argsort(-scores[order], kind="stable")]
+
+    return list(zip(ids[order].tolist(), scores[order].tolist()))
@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+"""
+*Module* ``project.jobs``
+
+This module defines the queue of background jobs, e.g. to create the batches of an
+uploaded project outside of the HTTP request.
+
+Jobs are stored in table :class:`~project.models.Job` of the application's own database
+with their status and progress, then run by a local pool of worker threads. A job is
+claimed with a conditional update before it runs, so it runs only once even if several
+processes try to run it. A running job renews its lease (its heartbeat) whenever it saves
+its progress; jobs that were interrupted (e.g. by a restart) stay in the table, and once
+their lease of ``JOB_LEASE`` seconds expired they can be run again with
+``flask --app main run-jobs``, failed builds of projects with ``flask --app main run-jobs --failed``.
+
+Note:
+        The database is imported inside the functions, as this extension is created
+        together with ``project.db`` in package ``project``.
+
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from flask import current_app
+from sqlalchemy import or_, update
+
+TASKS = {}
+
+
+class JobQueue(object):
+    """
+    Flask extension to run jobs in a pool of ``JOB_WORKERS`` threads. With ``JOB_EAGER``,
+    jobs run at once when they are enqueued, e.g. during testing.
+
+    Args:
+            app (:flask:`Flask <flask.Flask>`, optional): application
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        Create the pool of workers of the application.
+
+        Args:
+                app (:flask:`Flask <flask.Flask>`): application
+        """
+        executor = None
+        if not app.config.get("JOB_EAGER"):
+            executor = ThreadPoolExecutor(app.config.get("JOB_WORKERS", 2), thread_name_prefix="job")
+        app.extensions["job_queue"] = executor
+
+    @staticmethod
+    def task(name):
+        """
+        Register a function as task of jobs, called with the job and
+        the keyword arguments given to :meth:`enqueue`.
+
+        Args:
+                name (str): name of the task, saved as :attr:`Job.kind <project.models.Job>`
+
+        Returns:
+                decorator
+        """
+
+        def decorator(function):
+            TASKS[name] = function
+            return function
+
+        return decorator
+
+    def enqueue(self, job, **kwargs):
+        """
+        Commit a job and run it in the background.
+
+        Args:
+                job (:class:`~project.models.Job`): the job
+                **kwargs: arguments of the task that must not be saved in the database,
+                                e.g. credentials, they only live in memory until the job has run
+
+        Returns:
+                :futures:`Future <concurrent.futures.Future>` or None: the running job, ``None`` if it has run already
+        """
+        from . import db
+
+        db.session.add(job)
+        db.session.commit()
+
+        executor = current_app.extensions["job_queue"]
+        if executor is None:
+            run_job(job.id, **kwargs)
+            return None
+
+        return executor.submit(run_in_context, current_app._get_current_object(), job.id, kwargs)
+
+
+def run_in_context(app, job_id, kwargs):
+    """
+    Run a job in a worker thread within its own application context (and database session).
+
+    Args:
+            app (:flask:`Flask <flask.Flask>`): application
+            job_id (int): id of the job
+            kwargs (dict): arguments of the task
+    """
+    from . import db
+
+    with app.app_context():
+        try:
+            run_job(job_id, **kwargs)
+        finally:
+            db.session.remove()
+
+
+def utcnow():
+    """
+    Get the current time in UTC as naive datetime, as saved in the database.
+
+    Returns:
+            :class:`~datetime.datetime`: the current time
+    """
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def claimable(failed=False):
+    """
+    Get the condition of jobs that may be claimed to run: jobs that are queued and
+    running jobs whose lease of ``JOB_LEASE`` seconds expired, e.g. as their process was stopped.
+
+    Args:
+            failed (bool, optional): whether failed jobs may be claimed too, to retry them, *default:* ``False``
+
+    Returns:
+            SQL expression of the condition
+    """
+    from .models import Job
+
+    expired = utcnow() - timedelta(seconds=current_app.config.get("JOB_LEASE", 600))
+    statuses = ["queued", "failed"] if failed else ["queued"]
+    return or_(
+        Job.status.in_(statuses),
+        (Job.status == "running") & or_(Job.heartbeat.is_(None), Job.heartbeat < expired),
+    )
+
+
+def claim(job_id, failed=False):
+    """
+    Claim a job to run it, marking it as ``'running'`` with a conditional update: only
+    one of several workers trying to claim the same job succeeds. This commits the current transaction.
+
+    Args:
+            job_id (int): id of the job
+            failed (bool, optional): whether a failed job may be claimed to retry it, *default:* ``False``
+
+    Returns:
+            bool: ``True`` if the job was claimed, ``False`` if it is done, failed or run by another worker
+    """
+    from . import db
+    from .models import Job
+
+    claimed = (
+        db.session.execute(
+            update(Job)
+            .where(Job.id == job_id, claimable(failed))
+            .values(status="running", error=None, heartbeat=utcnow(), attempts=Job.attempts + 1)
+        ).rowcount
+        == 1
+    )
+    db.session.commit()
+    return claimed
+
+
+def run_job(job_id, retry_failed=False, **kwargs):
+    """
+    Claim and run a job (see :func:`claim`). If the task fails, its changes are rolled back
+    and the job (and its project, if it is still being built) are marked as ``'failed'``.
+    A failed job that is retried marks its failed project as ``'building'`` again.
+
+    Args:
+            job_id (int): id of the job
+            retry_failed (bool, optional): whether to retry the job if it failed, *default:* ``False``
+            **kwargs: arguments of the task
+
+    Returns:
+            :class:`~project.models.Job` or None: the job, ``None`` if it could not be claimed
+    """
+    from . import db
+    from .models import Job
+
+    if not claim(job_id, retry_failed):
+        current_app.logger.info("Job %d is not claimable, skipped", job_id)
+        return None
+    job = db.session.get(Job, job_id)
+    if retry_failed and job.project and job.project.status == "failed":
+        job.project.status = "building"
+        db.session.commit()
+
+    try:
+        TASKS[job.kind](job, **kwargs)
+        job.status = "done"
+        db.session.commit()
+    except Exception as error:
+        current_app.logger.exception("Job %d (%s) failed", job_id, job.kind)
+        db.session.rollback()
+
+        job = db.session.get(Job, job_id)
+        job.status = "failed"
+        job.error = f"{type(error).__name__}: {error}"
+        if job.project and job.project.status == "building":
+            job.project.status = "failed"
+        db.session.commit()
+
+    return job
+
+
+def progress(job, **counts):
+    """
+    Save the progress of a running job, e.g. ``progress(job, hits_created=3)``,
+    and renew its lease. This commits the current transaction.
+
+    Args:
+            job (:class:`~project.models.Job`): the job
+            **counts: progress counters of :class:`~project.models.Job`
+    """
+    from . import db
+
+    for key, value in counts.items():
+        setattr(job, key, value)
+    job.heartbeat = utcnow()
+    db.session.commit()
@@ -81,6 +81,10 @@ class Project(db.Model):
             p_name (:sql-type:`db.String <String>`): endpoint to this project
             mturk (:sql-type:`db.Boolean <Boolean>`): whether to upload this project
                                                                             on `Mechanical Turk <https://www.mturk.com/>`__
+            data_version (:sql-type:`db.Integer <Integer>`): version of the annotations,
+                                                                            bumped whenever a batch or a HIT is submitted
+            status (:sql-type:`db.String <String>`): ``'building'`` while its batches are created
+                                                                            in the background, then ``'ready'`` or ``'failed'``
             user_id (:sql-type:`db.Integer <Integer>`): id of user this project belongs to
             user (:sql-rel:`db.relationship <sqlalchemy.orm.relationship>`): ``many-to-one``
                                                                             relationship with :class:`User`
@@ -98,11 +102,25 @@ class Project(db.Model):
     p_name = db.Column(db.Text, unique=True, nullable=False)
 
     mturk = db.Column(db.Boolean)
+    data_version = db.Column(db.Integer, nullable=False, default=0)
+    status = db.Column(db.String(10), nullable=False, default="ready")
 
     user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
     user = db.relationship("User", backref=db.backref("projects", order_by=id), lazy=True)
 
-    def __init__(self, name, description, anno_number, best_def, worst_def, n_items, p_name, mturk=False, user=None):
+    def __init__(
+        self,
+        name,
+        description,
+        anno_number,
+        best_def,
+        worst_def,
+        n_items,
+        p_name,
+        mturk=False,
+        user=None,
+        status="ready",
+    ):
         self.name = name
         self.description = description
         self.anno_number = anno_number
@@ -112,6 +130,7 @@ class Project(db.Model):
         self.p_name = p_name
         self.mturk = mturk
         self.user = user
+        self.status = status
 
 
 annotator_batch = db.Table(
@@ -135,6 +154,12 @@ class Batch(db.Model):
                                                                             (only used in case of MTurk)
             hit_id (:sql-type:`db.String <String>`): endpoint to this batch
                                                                             in annotator system with option MTurk
+            mturk_hit_id (:sql-type:`db.String <String>`): HITId of this batch on MTurk,
+                                                                            saved as soon as the HIT is created
+            mturk_next_token (:sql-type:`db.Text <Text>`): cursor to list the new assignments
+                                                                            of the HIT on MTurk
+            submissions (:sql-type:`db.Integer <Integer>`): number of times this batch is submitted,
+                                                                            counted by :func:`~project.annotator.helpers.count_submission`
             project_id (:sql-type:`db.Integer <Integer>`): id of this batch's project
             project (:sql-rel:`db.relationship <sqlalchemy.orm.relationship>`): ``many-to-one``
                                                                             relationship with :class:`Project`
@@ -148,15 +173,21 @@ class Batch(db.Model):
     # for MTurk
     keyword = db.Column(db.String, unique=True)
     hit_id = db.Column(db.Text)
+    mturk_hit_id = db.Column(db.String(64))
+    mturk_next_token = db.Column(db.Text)
+
+    submissions = db.Column(db.Integer, nullable=False, default=0)
 
     project_id = db.Column(db.Integer, db.ForeignKey("projects.id"), nullable=False)
     project = db.relationship("Project", backref=db.backref("batches", order_by=id), lazy=True)
 
-    def __init__(self, size, keyword=None, hit_id=None, project=None):
+    def __init__(self, size, keyword=None, hit_id=None, project=None, mturk_hit_id=None):
         self.size = size
         self.keyword = keyword
         self.hit_id = hit_id
         self.project = project
+        self.mturk_hit_id = mturk_hit_id
+        self.submissions = 0
 
 
 tuple_item = db.Table(
@@ -179,7 +210,8 @@ class Tuple(db.Model):
             batch (:sql-rel:`db.relationship <sqlalchemy.orm.relationship>`): ``many-to-one``
                                                                                                                     relationship with :class:`Batch`
             items (:sql-rel:`db.relationship <sqlalchemy.orm.relationship>`): ``many-to-many``
-                                                                                                                    relationship with :class:`Item`
+                                                                                                                    relationship with :class:`Item`,
+                                                                                                                    ordered by id
     """
 
     __tablename__ = "tuples"
@@ -189,7 +221,7 @@ class Tuple(db.Model):
     batch_id = db.Column(db.Integer, db.ForeignKey("batches.id"), nullable=False)
     batch = db.relationship("Batch", backref=db.backref("tuples", order_by=id), lazy=True)
 
-    items = db.relationship("Item", secondary=tuple_item, backref=db.backref("tuples", lazy=True))
+    items = db.relationship("Item", secondary=tuple_item, order_by="Item.id", backref=db.backref("tuples", lazy=True))
 
     def __init__(self, batch=None):
         self.batch = batch
@@ -281,6 +313,8 @@ class Data(db.Model):
     """
 
     __tablename__ = "datas"
+    # an annotator in the local system has one answer per tuple (on MTurk anno_id is NULL)
+    __table_args__ = (db.UniqueConstraint("anno_id", "tuple_id", name="uq_datas_anno_tuple"),)
 
     id = db.Column(db.Integer, primary_key=True)
 
@@ -298,3 +332,130 @@ class Data(db.Model):
         self.worst_id = worst_id
         self.annotator = annotator
         self.tuple_ = tuple_
+
+
+class ItemScore(db.Model):
+    """
+    Extend :db:`db.Model <flask_sqlalchemy.SQLAlchemy>`.
+
+    Store the counts of each item in a project needed to calculate its BWS-score,
+    updated whenever a batch is submitted.
+
+    Attributes:
+            project_id (:sql-type:`db.Integer <Integer>`): id of the project
+            item_id (:sql-type:`db.Integer <Integer>`): id of the item in table :class:`Item`
+            appearances (:sql-type:`db.Integer <Integer>`): number of submitted annotations
+                                                                                            of tuples with this item
+            best (:sql-type:`db.Integer <Integer>`): number of times the item is chosen as '**best**'
+            worst (:sql-type:`db.Integer <Integer>`): number of times the item is chosen as '**worst**'
+            item (:sql-rel:`db.relationship <sqlalchemy.orm.relationship>`): ``many-to-one``
+                                                                                            relationship with :class:`Item`
+    """
+
+    __tablename__ = "item_scores"
+
+    project_id = db.Column(db.Integer, db.ForeignKey("projects.id"), primary_key=True)
+    item_id = db.Column(db.Integer, db.ForeignKey("items.id"), primary_key=True)
+
+    appearances = db.Column(db.Integer, nullable=False, default=0)
+    best = db.Column(db.Integer, nullable=False, default=0)
+    worst = db.Column(db.Integer, nullable=False, default=0)
+
+    item = db.relationship("Item", lazy=True)
+
+    def __init__(self, project_id, item_id, appearances=0, best=0, worst=0):
+        self.project_id = project_id
+        self.item_id = item_id
+        self.appearances = appearances
+        self.best = best
+        self.worst = worst
+
+
+class Assignment(db.Model):
+    """
+    Extend :db:`db.Model <flask_sqlalchemy.SQLAlchemy>`.
+
+    Store each assignment of a HIT on MTurk that is listed by :func:`~project.assignments.sync_assignments`.
+
+    Attributes:
+            id (:sql-type:`db.String <String>`): AssignmentId on MTurk
+            worker_id (:sql-type:`db.String <String>`): WorkerId of the turker
+            keyword (:sql-type:`db.String <String>`): keyword typed in by the turker
+            status (:sql-type:`db.String <String>`): ``'Submitted'``, ``'Approved'`` or ``'Rejected'``
+            batch_id (:sql-type:`db.Integer <Integer>`): id of the batch of the HIT
+            batch (:sql-rel:`db.relationship <sqlalchemy.orm.relationship>`): ``many-to-one``
+                                                                                            relationship with :class:`Batch`
+    """
+
+    __tablename__ = "assignments"
+
+    id = db.Column(db.String(64), primary_key=True)
+    worker_id = db.Column(db.String(64))
+    keyword = db.Column(db.String)
+    status = db.Column(db.String(10), nullable=False, default="Submitted")
+
+    batch_id = db.Column(db.Integer, db.ForeignKey("batches.id"), nullable=False)
+    batch = db.relationship("Batch", backref=db.backref("assignments", order_by=id), lazy=True)
+
+    def __init__(self, id, batch=None, worker_id=None, keyword=None, status="Submitted"):
+        self.id = id
+        self.batch = batch
+        self.worker_id = worker_id
+        self.keyword = keyword
+        self.status = status
+
+
+class Job(db.Model):
+    """
+    Extend :db:`db.Model <flask_sqlalchemy.SQLAlchemy>`.
+
+    Store each background job, e.g. creating the batches of an uploaded project,
+    run by :class:`~project.jobs.JobQueue`.
+
+    Attributes:
+            id (:sql-type:`db.Integer <Integer>`): automatically defined job-id
+            kind (:sql-type:`db.String <String>`): name of the task to run
+            status (:sql-type:`db.String <String>`): ``'queued'``, ``'running'``, ``'done'`` or ``'failed'``
+            payload (:sql-type:`db.JSON <JSON>`): arguments of the task (never any credentials)
+            error (:sql-type:`db.Text <Text>`): error message if the job failed
+            items_parsed (:sql-type:`db.Integer <Integer>`): progress, number of parsed items
+            tuples_generated (:sql-type:`db.Integer <Integer>`): progress, number of generated tuples
+            batches_stored (:sql-type:`db.Integer <Integer>`): progress, number of stored batches
+            hits_created (:sql-type:`db.Integer <Integer>`): progress, number of HITs created on MTurk
+            heartbeat (:sql-type:`db.DateTime <DateTime>`): last time (UTC) the running job was claimed or saved
+                                                                        its progress, the lease of the job expires ``JOB_LEASE``
+                                                                        seconds later
+            attempts (:sql-type:`db.Integer <Integer>`): number of times the job was claimed to run
+            project_id (:sql-type:`db.Integer <Integer>`): id of the project of this job
+            project (:sql-rel:`db.relationship <sqlalchemy.orm.relationship>`): ``many-to-one``
+                                                                                            relationship with :class:`Project`
+    """
+
+    __tablename__ = "jobs"
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    status = db.Column(db.String(10), nullable=False, default="queued")
+    payload = db.Column(db.JSON, nullable=False)
+    error = db.Column(db.Text)
+
+    items_parsed = db.Column(db.Integer, nullable=False, default=0)
+    tuples_generated = db.Column(db.Integer, nullable=False, default=0)
+    batches_stored = db.Column(db.Integer, nullable=False, default=0)
+    hits_created = db.Column(db.Integer, nullable=False, default=0)
+    heartbeat = db.Column(db.DateTime)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+
+    project_id = db.Column(db.Integer, db.ForeignKey("projects.id"), nullable=True)
+    project = db.relationship("Project", backref=db.backref("jobs", order_by=id), lazy=True)
+
+    def __init__(self, kind, payload, project=None, items_parsed=0):
+        self.kind = kind
+        self.payload = payload
+        self.project = project
+        self.status = "queued"
+        self.items_parsed = items_parsed
+        self.tuples_generated = 0
+        self.batches_stored = 0
+        self.hits_created = 0
+        self.attempts = 0
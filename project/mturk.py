@@ -0,0 +1,426 @@
+# -*- coding: utf-8 -*-
+"""
+*Module* ``project.mturk``
+
+This module provides the functions to work with `Mechanical Turk <https://www.mturk.com/>`__,
+e.g. creating the HITs of a project or listing their assignments concurrently, and
+the registry of MTurk clients shared by all of them.
+
+Calls that are throttled by MTurk are retried with exponential backoff. Each HIT is created
+with a ``UniqueRequestToken``, so MTurk refuses to create the same HIT twice, and
+the id of each created HIT is recorded at once by the caller (see :attr:`Batch.mturk_hit_id
+<project.models.Batch>`), so an interrupted creation can be resumed. A HIT that was created
+but not recorded before the interruption is found again by its token, see :func:`create_hit`.
+
+"""
+
+import random
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
+from hashlib import sha256
+from threading import Lock
+from xml.etree import ElementTree
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from flask import current_app, render_template
+from markupsafe import escape
+
+# error codes of MTurk and AWS for calls that are refused but may succeed later
+RETRYABLE_ERRORS = {
+    "Throttling",
+    "ThrottlingException",
+    "TooManyRequestsException",
+    "RequestLimitExceeded",
+    "ServiceUnavailable",
+    "ServiceFault",
+}
+
+# placeholder of the url to the batch in the question of a HIT
+HIT_URL = "__HIT_URL__"
+
+# HITId in the message of the error of MTurk for a HIT created twice with the same UniqueRequestToken,
+# e.g. 'The HIT with ID "3AQN9REUTFGXCRWFB1G74WLZ1O7YD3" already exists.'
+HIT_EXISTS = re.compile(r"already exists|HitAlreadyExists", re.IGNORECASE)
+HIT_ID = re.compile(r'\bID:? "?([A-Z0-9]+)')
+
+
+class ClientRegistry(object):
+    """
+    Keep MTurk clients to reuse them, one for each set of credentials and endpoint.
+    Building a client loads the service model of botocore and costs tens of milliseconds,
+    a client is thread-safe and keeps a pool of connections. Clients that are not used
+    for ``ttl`` seconds are removed.
+
+    Args:
+            config (:class:`botocore.config.Config`): configuration of the clients
+            ttl (float, optional): seconds a client is kept after its last use, *default:* ``3600``
+            factory (callable, optional): function to build a client,
+                            *default:* ``client`` of one shared :class:`boto3.session.Session`
+            clock (callable, optional): function returning the current time in seconds,
+                            *default:* :func:`time.monotonic`
+    """
+
+    def __init__(self, config, ttl=3600, factory=None, clock=time.monotonic):
+        self.config = config
+        self.ttl = ttl
+        self.factory = factory or boto3.session.Session().client
+        self.clock = clock
+        self.clients = {}
+        self.lock = Lock()
+
+    def get(self, aws_access_key_id, aws_secret_access_key, endpoint_url=None, region_name="us-east-1"):
+        """
+        Get the client for credentials and endpoint, build it if there is none.
+
+        Args:
+                aws_access_key_id (str): IAM AWS credentials - key id
+                aws_secret_access_key (str): IAM AWS credentials - secret access key
+                endpoint_url (str, optional): endpoint of MTurk, e.g. the sandbox, *default:* ``None``
+                region_name (str, optional): AWS region, *default:* ``'us-east-1'``
+
+        Returns:
+                MTurk client
+        """
+        # the secret is only kept in the client itself, the key holds its hash
+        key = (aws_access_key_id, sha256((aws_secret_access_key or "").encode()).hexdigest(), endpoint_url, region_name)
+
+        with self.lock:
+            now = self.clock()
+            self.evict(now)
+
+            if key not in self.clients:
+                client = self.factory(
+                    service_name="mturk",
+                    aws_access_key_id=aws_access_key_id,
+                    aws_secret_access_key=aws_secret_access_key,
+                    region_name=region_name,
+                    endpoint_url=endpoint_url,
+                    config=self.config,
+                )
+                self.clients[key] = [client, now]
+
+            entry = self.clients[key]
+            entry[1] = now
+            return entry[0]
+
+    def evict(self, now):
+        """
+        Remove the clients that were not used for :attr:`ttl` seconds.
+
+        Args:
+                now (float): current time in seconds
+        """
+        for key in [key for key, (_, used) in self.clients.items() if now - used > self.ttl]:
+            del self.clients[key]
+
+
+class MTurkClients(object):
+    """
+    Flask extension to share the :class:`ClientRegistry` of the application,
+    configured by ``MTURK_POOL_SIZE``, ``MTURK_CONNECT_TIMEOUT``, ``MTURK_READ_TIMEOUT`` and
+    ``MTURK_CLIENT_TTL``. The clients do not retry any call themselves, throttled calls are only
+    retried by :func:`retry` (``MTURK_RETRIES``, ``MTURK_BACKOFF``), so the delays do not stack up.
+
+    Args:
+            app (:flask:`Flask <flask.Flask>`, optional): application
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        Create the registry of clients of the application.
+
+        Args:
+                app (:flask:`Flask <flask.Flask>`): application
+        """
+        config = Config(
+            max_pool_connections=app.config["MTURK_POOL_SIZE"],
+            retries={"mode": "standard", "total_max_attempts": 1},
+            connect_timeout=app.config["MTURK_CONNECT_TIMEOUT"],
+            read_timeout=app.config["MTURK_READ_TIMEOUT"],
+        )
+        app.extensions["mturk_clients"] = ClientRegistry(config, ttl=app.config["MTURK_CLIENT_TTL"])
+
+    def client(self, aws_access_key_id=None, aws_secret_access_key=None):
+        """
+        Get the client of the current application for credentials, by default the configured ones
+        (``AWS_ACCESS_KEY_ID``, ``AWS_SECRET_ACCESS_KEY``), at the endpoint ``MTURK_URL``.
+
+        Args:
+                aws_access_key_id (str, optional): IAM AWS credentials - key id
+                aws_secret_access_key (str, optional): IAM AWS credentials - secret access key
+
+        Returns:
+                MTurk client
+        """
+        return current_app.extensions["mturk_clients"].get(
+            aws_access_key_id or current_app.config["AWS_ACCESS_KEY_ID"],
+            aws_secret_access_key or current_app.config["AWS_SECRET_ACCESS_KEY"],
+            endpoint_url=current_app.config["MTURK_URL"],
+        )
+
+
+def question_template(title, description):
+    """
+    Render the question of the HITs of a project (``questions.xml``) once,
+    with a placeholder for the url of each batch, see :func:`question`.
+
+    Args:
+            title (str): title of the project
+            description (str): description of the project
+
+    Returns:
+            str: the question with placeholder
+    """
+    return render_template("questions.xml", title=title, description=description, url=HIT_URL)
+
+
+def question(template, url):
+    """
+    Fill in the url of a batch into the question of a HIT.
+
+    Args:
+            template (str): the question rendered by :func:`question_template`
+            url (str): url of the batch
+
+    Returns:
+            str: the question of the HIT
+    """
+    return template.replace(HIT_URL, str(escape(url)))
+
+
+def retry(call, retries=5, backoff=0.5, sleep=time.sleep, **kwargs):
+    """
+    Call the MTurk API, retry with exponential backoff (with full jitter)
+    as long as the call is throttled.
+
+    Args:
+            call (callable): method of the MTurk client, e.g. ``client.create_hit``
+            retries (int, optional): maximum number of retries, *default:* ``5``
+            backoff (float, optional): maximum delay in seconds before the first retry,
+                            doubled for each further retry, *default:* ``0.5``
+            sleep (callable, optional): function to wait, *default:* :func:`time.sleep`
+            **kwargs: arguments of the call
+
+    Returns:
+            dict: the response of the call
+
+    Raises:
+            :class:`botocore.exceptions.ClientError`: if the call fails for another reason
+            or is still throttled after all retries
+    """
+    for attempt in range(retries + 1):
+        try:
+            return call(**kwargs)
+        except ClientError as error:
+            if error.response.get("Error", {}).get("Code") not in RETRYABLE_ERRORS or attempt == retries:
+                raise
+            sleep(random.uniform(0, backoff * 2**attempt))
+
+
+def call_all(call, calls, workers=8, on_done=None):
+    """
+    Call a function concurrently on a bounded pool of threads, once for each set of arguments.
+    Every successful call is passed to ``on_done`` in the calling thread, even if others fail.
+
+    Args:
+            call (callable): the function, e.g. ``partial(retry, client.create_hit)``
+            calls (dict): keyword arguments of each call by a key, e.g. batch id
+            workers (int, optional): maximum number of concurrent calls, *default:* ``8``
+            on_done (callable, optional): called with the key and the result of each successful call
+
+    Returns:
+            dict: result of each key
+
+    Raises:
+            Exception: the first error, after all other calls are done
+    """
+    results, errors = {}, []
+
+    with ThreadPoolExecutor(max(1, min(workers, len(calls)))) as executor:
+        futures = {executor.submit(call, **kwargs): key for key, kwargs in calls.items()}
+
+        for future in as_completed(futures):
+            key = futures[future]
+            try:
+                results[key] = future.result()
+            except Exception as error:
+                errors.append(error)
+                continue
+
+            if on_done:
+                on_done(key, results[key])
+
+    if errors:
+        raise errors[0]
+    return results
+
+
+def create_hit(client, retries=5, backoff=0.5, sleep=time.sleep, **kwargs):
+    """
+    Create a HIT with :func:`retry`. If MTurk refuses to create it as a HIT with the same
+    ``UniqueRequestToken`` exists already, e.g. created by a run that was interrupted before
+    the HIT was recorded, the id of the existing HIT is returned instead. It is taken from the
+    message of the error or else found by :func:`find_hit`.
+
+    Args:
+            client: MTurk client
+            retries (int, optional): maximum number of retries, *default:* ``5``
+            backoff (float, optional): maximum delay in seconds before the first retry, *default:* ``0.5``
+            sleep (callable, optional): function to wait, *default:* :func:`time.sleep`
+            **kwargs: arguments of :meth:`create_hit`
+
+    Returns:
+            str: HITId of the HIT
+
+    Raises:
+            :class:`botocore.exceptions.ClientError`: if the HIT is neither created nor found
+    """
+    options = dict(retries=retries, backoff=backoff, sleep=sleep)
+    try:
+        return retry(client.create_hit, **options, **kwargs)["HIT"]["HITId"]
+    except ClientError as error:
+        token = kwargs.get("UniqueRequestToken")
+        message = error.response.get("Error", {}).get("Message") or ""
+        if not token or not HIT_EXISTS.search(message):
+            raise
+
+        match = HIT_ID.search(message)
+        hit_id = match.group(1) if match else find_hit(client, token, **options)
+        if hit_id is None:
+            raise
+        return hit_id
+
+
+def find_hit(client, token, **options):
+    """
+    Find a HIT of the requester by its ``RequesterAnnotation``, which holds
+    the ``UniqueRequestToken`` of the HIT, see :func:`create_hits`.
+
+    Args:
+            client: MTurk client
+            token (str): the token
+            **options: options of :func:`retry`
+
+    Returns:
+            str or None: HITId of the HIT, ``None`` if there is none
+    """
+    return find_hits(client, [token], **options).get(token)
+
+
+def find_hits(client, tokens, **options):
+    """
+    Find HITs of the requester by their ``RequesterAnnotation`` in one listing of the HITs,
+    which stops as soon as all are found. MTurk only refuses a duplicate ``UniqueRequestToken``
+    for 24 hours, so HITs created before are looked up this way before they are created again.
+
+    Args:
+            client: MTurk client
+            tokens (iterable(str)): the tokens
+            **options: options of :func:`retry`
+
+    Returns:
+            dict: HITId of each token that was found
+    """
+    missing, found = set(tokens), {}
+    kwargs = dict(MaxResults=100)
+    while missing:
+        response = retry(client.list_hits, **options, **kwargs)
+        for hit in response.get("HITs", []):
+            if hit.get("RequesterAnnotation") in missing:
+                missing.discard(hit["RequesterAnnotation"])
+                found[hit["RequesterAnnotation"]] = hit["HITId"]
+
+        if not response.get("NextToken") or not response.get("HITs"):
+            break
+        kwargs["NextToken"] = response["NextToken"]
+
+    return found
+
+
+def create_hits(client, hits, workers=8, on_created=None, **options):
+    """
+    Create HITs concurrently on a bounded pool of threads with :func:`create_hit`. Every HIT that
+    is created, or found as it was created before with the same ``UniqueRequestToken``,
+    is passed to ``on_created`` in the calling thread, even if others fail. The token is also
+    saved as ``RequesterAnnotation`` of the HIT, if it has none, to find the HIT again.
+
+    Args:
+            client: MTurk client, e.g. :class:`boto3.client('mturk') <MTurk.Client>`
+            hits (dict): arguments of :meth:`create_hit` for each key, e.g. batch id
+            workers (int, optional): maximum number of concurrent calls, *default:* ``8``
+            on_created (callable, optional): called with the key and the HITId of each created HIT
+            **options: options of :func:`retry`
+
+    Returns:
+            dict: HITId of each key
+
+    Raises:
+            :class:`botocore.exceptions.ClientError`: the first error, after all other HITs are done
+    """
+    hits = {
+        key: dict(kwargs, RequesterAnnotation=kwargs["UniqueRequestToken"])
+        if "UniqueRequestToken" in kwargs and "RequesterAnnotation" not in kwargs
+        else kwargs
+        for key, kwargs in hits.items()
+    }
+    return call_all(partial(create_hit, client, **options), hits, workers=workers, on_done=on_created)
+
+
+def list_assignments(client, hit_id, next_token=None, page_size=100, **options):
+    """
+    List the assignments of a HIT page by page, starting from a cursor.
+
+    Args:
+            client: MTurk client
+            hit_id (str): HITId of the HIT
+            next_token (str, optional): cursor of a previous listing, *default:* ``None`` (first page)
+            page_size (int, optional): number of assignments per page, *default:* ``100`` (maximum of MTurk)
+            **options: options of :func:`retry`
+
+    Returns:
+            tuple(list(dict), str): the assignments and the cursor to list the following ones,
+            the token of the last page, which is read again as it may not be full yet
+    """
+    assignments = []
+    while True:
+        kwargs = dict(HITId=hit_id, MaxResults=page_size)
+        if next_token:
+            kwargs["NextToken"] = next_token
+
+        response = retry(client.list_assignments_for_hit, **options, **kwargs)
+        assignments.extend(response.get("Assignments", []))
+
+        if not response.get("NextToken") or not response.get("Assignments"):
+            return assignments, next_token
+        next_token = response["NextToken"]
+
+
+def answer_keyword(answer, question="keyword"):
+    """
+    Get the keyword typed in by a worker from the answer of an assignment
+    (``QuestionFormAnswers`` XML).
+
+    Args:
+            answer (str): answer of the assignment
+            question (str, optional): identifier of the field, *default:* ``'keyword'``
+
+    Returns:
+            str or None: the keyword, ``None`` if there is none
+    """
+    try:
+        root = ElementTree.fromstring(answer)
+    except (ElementTree.ParseError, TypeError):
+        return None
+
+    for node in root:
+        fields = {child.tag.rsplit("}", 1)[-1]: (child.text or "").strip() for child in node}
+        if fields.get("QuestionIdentifier") == question:
+            return fields.get("FreeText")
+    return None
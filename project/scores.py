@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+"""
+*Module* ``project.scores``
+
+This module aggregates the annotations of a project into the counts needed
+for the BWS-scores, directly in the database.
+
+The counts are kept in table :class:`~project.models.ItemScore`, updated together with
+every submitted batch by :func:`add_annotations`, so reading the scores does not depend on
+the number of annotations. :func:`rebuild_scores` recounts them from the raw annotations,
+:func:`ensure_counts` counts them once for projects whose annotations predate the counts.
+
+"""
+
+from collections import defaultdict
+from sqlalchemy import and_, bindparam, case, func, insert, update
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from . import db
+from .models import Batch, Data, Item, ItemScore, Project, Tuple, annotator_batch, tuple_item
+
+# INSERT ... ON CONFLICT of the dialects that support it
+UPSERTS = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+
+
+def count_annotations(project):
+    """
+    Count for each annotated item of a project how many annotations it appears in
+    and how often it is chosen as '**best**' and '**worst**', in one grouped query over
+    the tables ``datas``, ``tuple_item``, ``tuples`` and ``batches``.
+
+    On Mechanical Turk every annotation counts. In the local system only the
+    annotations of batches that the annotator has submitted count, saved ones do not.
+
+    Args:
+            project (:class:`~project.models.Project`): the project
+
+    Returns:
+            list(tuple(int, str, int, int, int)): ``(item id, item, appearances, best, worst)``
+            for each item, in order of the first tuple the item appears in
+    """
+    query = (
+        db.session.query(
+            Item.id,
+            Item.item,
+            func.count(),
+            func.sum(case((Data.best_id == Item.id, 1), else_=0)),
+            func.sum(case((Data.worst_id == Item.id, 1), else_=0)),
+        )
+        .select_from(Data)
+        .join(Tuple, Tuple.id == Data.tuple_id)
+        .join(Batch, Batch.id == Tuple.batch_id)
+        .join(tuple_item, tuple_item.c.tuple_id == Data.tuple_id)
+        .join(Item, Item.id == tuple_item.c.item_id)
+        .filter(Batch.project_id == project.id)
+    )
+
+    # only submitted batches of annotators in the local system
+    if not project.mturk:
+        query = query.join(
+            annotator_batch,
+            and_(annotator_batch.c.annotator_id == Data.anno_id, annotator_batch.c.batch_id == Tuple.batch_id),
+        )
+
+    query = query.group_by(Item.id, Item.item).order_by(func.min(Tuple.id), Item.id)
+
+    return [(id_, item, int(n), int(best), int(worst)) for id_, item, n, best, worst in query]
+
+
+def load_counts(project):
+    """
+    Read the counts of a project from table :class:`~project.models.ItemScore`.
+
+    Args:
+            project (:class:`~project.models.Project`): the project
+
+    Returns:
+            list(tuple(int, str, int, int, int)): ``(item id, item, appearances, best, worst)``
+            for each annotated item, in order of the item ids
+    """
+    query = (
+        db.session.query(ItemScore.item_id, Item.item, ItemScore.appearances, ItemScore.best, ItemScore.worst)
+        .join(Item, Item.id == ItemScore.item_id)
+        .filter(ItemScore.project_id == project.id)
+        .order_by(ItemScore.item_id)
+    )
+    return [tuple(row) for row in query]
+
+
+def add_annotations(project, annotations):
+    """
+    Add the annotations of a submitted batch to the counts of a project in
+    table :class:`~project.models.ItemScore` and bump the version of its annotations.
+    The counters are incremented in the database, the changes are committed together
+    with the annotations by the caller.
+
+    Args:
+            project (:class:`~project.models.Project`): the project
+            annotations (list(tuple(:class:`~project.models.Tuple`, int, int))): annotated tuples
+                                                                    with the ids of '**best**' and '**worst**' item
+    """
+    counts = defaultdict(lambda: [0, 0, 0])
+    for tuple_, best_id, worst_id in annotations:
+        for item in tuple_.items:
+            counts[item.id][0] += 1
+        counts[best_id][1] += 1
+        counts[worst_id][2] += 1
+
+    if not counts:
+        return
+
+    bump_data_version(project)
+
+    # create the rows of items annotated for the first time
+    existing = {
+        item_id
+        for (item_id,) in db.session.query(ItemScore.item_id).filter(
+            ItemScore.project_id == project.id, ItemScore.item_id.in_(counts)
+        )
+    }
+    missing = [{"project_id": project.id, "item_id": item_id} for item_id in counts if item_id not in existing]
+    if missing:
+        # another submission may create the same rows in the meantime
+        insert_ignore(ItemScore.__table__, missing, appearances=0, best=0, worst=0)
+
+    table = ItemScore.__table__
+    db.session.execute(
+        update(table)
+        .where(table.c.project_id == bindparam("p_id"), table.c.item_id == bindparam("i_id"))
+        .values(
+            appearances=table.c.appearances + bindparam("n"),
+            best=table.c.best + bindparam("n_best"),
+            worst=table.c.worst + bindparam("n_worst"),
+        ),
+        [
+            {"p_id": project.id, "i_id": item_id, "n": n, "n_best": n_best, "n_worst": n_worst}
+            for item_id, (n, n_best, n_worst) in counts.items()
+        ],
+    )
+
+
+def insert_ignore(table, rows, **values):
+    """
+    Insert rows into a table, except the ones whose key already exists, e.g. as they were inserted
+    by a concurrent transaction in the meantime, with ``INSERT ... ON CONFLICT DO NOTHING``
+    (``INSERT IGNORE`` for MySQL). Other databases insert each row within a savepoint.
+
+    Args:
+            table (:class:`sqlalchemy.schema.Table`): the table
+            rows (list(dict)): the rows
+            **values: values of all rows, e.g. ``appearances=0``
+    """
+    dialect = db.session.get_bind().dialect.name
+    if dialect in UPSERTS:
+        db.session.execute(UPSERTS[dialect](table).values(**values).on_conflict_do_nothing(), rows)
+    elif dialect in ("mysql", "mariadb"):
+        db.session.execute(mysql.insert(table).values(**values).prefix_with("IGNORE"), rows)
+    else:
+        for row in rows:
+            try:
+                with db.session.begin_nested():
+                    db.session.execute(insert(table).values(**values), [row])
+            except IntegrityError:
+                pass
+
+
+def rebuild_scores(project):
+    """
+    Recount the counts of a project in table :class:`~project.models.ItemScore`
+    from its annotations with :func:`count_annotations`, e.g. after annotations were changed
+    directly in the database, and bump the version of its annotations.
+    The changes are committed by the caller.
+
+    Args:
+            project (:class:`~project.models.Project`): the project
+
+    Returns:
+            int: number of annotated items
+    """
+    counts = count_annotations(project)
+    bump_data_version(project)
+
+    db.session.execute(ItemScore.__table__.delete().where(ItemScore.__table__.c.project_id == project.id))
+    store_counts(project, counts)
+
+    return len(counts)
+
+
+def ensure_counts(project):
+    """
+    Read the counts of a project with :func:`load_counts`. A project without counts whose annotations
+    were submitted before the counts were kept, e.g. in an earlier version of the database, is counted
+    once from its annotations with :func:`count_annotations` and its counts are stored.
+    The version of its annotations stays the same, as they do not change.
+    The changes are committed by the caller.
+
+    Args:
+            project (:class:`~project.models.Project`): the project
+
+    Returns:
+            list(tuple(int, str, int, int, int)): ``(item id, item, appearances, best, worst)``
+            for each annotated item, in order of the item ids
+    """
+    counts = load_counts(project)
+    if counts:
+        return counts
+
+    counts = count_annotations(project)
+    if not counts:
+        return []
+    store_counts(project, counts)
+    return load_counts(project)
+
+
+def store_counts(project, counts):
+    """
+    Insert the counts of a project into table :class:`~project.models.ItemScore`,
+    which has none of these items yet. The changes are committed by the caller.
+
+    Args:
+            project (:class:`~project.models.Project`): the project
+            counts (list(tuple(int, str, int, int, int))): counts as given by :func:`count_annotations`
+    """
+    if counts:
+        db.session.execute(
+            insert(ItemScore.__table__),
+            [
+                {"project_id": project.id, "item_id": id_, "appearances": n, "best": best, "worst": worst}
+                for id_, _, n, best, worst in counts
+            ],
+        )
+
+
+def bump_data_version(project):
+    """
+    Increment :attr:`~project.models.Project.data_version` of a project in the database,
+    which invalidates its cached outputs. The change is committed by the caller.
+
+    Args:
+            project (:class:`~project.models.Project`): the project
+    """
+    db.session.execute(update(Project).where(Project.id == project.id).values(data_version=Project.data_version + 1))
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+*Module* ``project.upgrade``
+
+This module upgrades the database of an earlier version of the application in place,
+as ``db.create_all()`` only creates missing tables: it adds the missing columns of
+existing tables (e.g. :attr:`Project.status <project.models.Project>` or
+:attr:`Batch.mturk_hit_id <project.models.Batch>`) and the unique constraint of the
+answers of annotators in table ``datas``. Columns and tables that count what is in the
+database already, as :attr:`Batch.submissions <project.models.Batch>` or the counts of the
+scores in :class:`~project.models.ItemScore`, are filled from it.
+
+Each step is only taken if it is needed, so the upgrade runs on every start of the
+application (see ``main.py``) or with ``flask --app main upgrade-db``.
+
+"""
+
+from sqlalchemy import delete, func, inspect, literal, select, text, update
+from . import db
+from .models import Batch, Data, ItemScore, Project, Tuple, annotator_batch
+from .scores import ensure_counts
+
+# unique index of the answers of the annotators in the local system, see Data
+DATAS_UNIQUE = "uq_datas_anno_tuple"
+
+
+def upgrade_database():
+    """
+    Create the missing tables and take the steps of the upgrade that are needed.
+    The changes are committed.
+
+    Returns:
+            list(str): the steps that were taken
+    """
+    db.create_all()
+
+    added = add_columns()
+    steps = [f"added column {column}" for column in added]
+    if "batches.submissions" in added:
+        count_submissions()
+        steps.append("counted the submissions of the batches")
+    if add_datas_unique():
+        steps.append(f"removed duplicate answers, added unique index {DATAS_UNIQUE}")
+    steps.extend(f"counted the scores of project {p_name}" for p_name in count_scores())
+
+    db.session.commit()
+    return steps
+
+
+def column_definition(column):
+    """
+    Get the definition of a column to add to an existing table. A column that is not
+    nullable needs a scalar default, which is also the value of the existing rows.
+
+    Args:
+            column (:class:`sqlalchemy.Column`): column of a model
+
+    Returns:
+            str: the definition, e.g. ``status VARCHAR(10) DEFAULT 'ready' NOT NULL``
+    """
+    dialect = db.engine.dialect
+    definition = f"{column.name} {column.type.compile(dialect=dialect)}"
+
+    if column.default is not None and column.default.is_scalar:
+        default = literal(column.default.arg, column.type).compile(
+            dialect=dialect, compile_kwargs={"literal_binds": True}
+        )
+        definition += f" DEFAULT {default}"
+    if not column.nullable:
+        definition += " NOT NULL"
+    return definition
+
+
+def add_columns():
+    """
+    Add the columns of the models that are missing in existing tables.
+
+    Returns:
+            list(str): the added columns as ``table.column``
+    """
+    inspector = inspect(db.engine)
+    added = []
+
+    for table in db.metadata.sorted_tables:
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                db.session.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column_definition(column)}"))
+                added.append(f"{table.name}.{column.name}")
+
+    return added
+
+
+def add_datas_unique():
+    """
+    Add the unique index of the answers of the annotators in the local system if it is missing.
+    Duplicate answers of an annotator to the same tuple are removed first, the latest one is kept.
+
+    Returns:
+            bool: ``True`` if the index was added
+    """
+    inspector = inspect(db.engine)
+    names = {constraint["name"] for constraint in inspector.get_unique_constraints(Data.__tablename__)}
+    names.update(index["name"] for index in inspector.get_indexes(Data.__tablename__))
+    if DATAS_UNIQUE in names:
+        return False
+
+    # wrapped in a derived table, as MySQL does not select from the table it deletes from
+    latest = (
+        select(func.max(Data.id).label("id"))
+        .where(Data.anno_id.is_not(None))
+        .group_by(Data.anno_id, Data.tuple_id)
+        .subquery()
+    )
+    db.session.execute(delete(Data).where(Data.anno_id.is_not(None), Data.id.not_in(select(latest.c.id))))
+    db.session.execute(text(f"CREATE UNIQUE INDEX {DATAS_UNIQUE} ON {Data.__tablename__} (anno_id, tuple_id)"))
+    return True
+
+
+def count_submissions():
+    """
+    Count the submissions of the existing batches: on Mechanical Turk the annotations
+    of a batch divided by its size, as every submission saves an answer to each tuple,
+    in the local system the annotators who submitted the batch.
+    """
+    mturk = select(Project.id).where(Project.mturk.is_(True))
+    annotations = select(func.count(Data.id)).join(Tuple).where(Tuple.batch_id == Batch.id).scalar_subquery()
+    annotators = (
+        select(func.count()).select_from(annotator_batch).where(annotator_batch.c.batch_id == Batch.id)
+    ).scalar_subquery()
+
+    db.session.execute(update(Batch).where(Batch.project_id.in_(mturk)).values(submissions=annotations // Batch.size))
+    db.session.execute(update(Batch).where(Batch.project_id.not_in(mturk)).values(submissions=annotators))
+
+
+def count_scores():
+    """
+    Count the scores of the annotated projects without counts in :class:`~project.models.ItemScore`,
+    whose annotations were submitted before the counts were kept, see :func:`~project.scores.ensure_counts`.
+
+    Returns:
+            list(str): names of the counted projects
+    """
+    projects = Project.query.filter(Project.id.not_in(select(ItemScore.project_id))).order_by(Project.id)
+    return [project.p_name for project in projects if ensure_counts(project)]
@@ -12,7 +12,12 @@ of each subroute inside User-System.
 
 import string
 import random
+from collections import defaultdict
 from datetime import date
+from flask import Response, request, stream_with_context
+from sqlalchemy import insert, select
+from .. import db, result_cache
+from ..models import Annotator, Batch, Data, Item, Tuple, annotator_batch, tuple_item
 from ..generator import DataGenerator
 from ..validators import allowed_file
 
@@ -36,12 +41,16 @@ def is_not_current_user(user, current_name):
     return user and user.is_authenticated and current_name != user.username
 
 
-def upload_file(files):
+def upload_file(files, generate=True, **options):
     """
     Upload all files and store in container for later use.
 
     Args:
             files (list(:dat-struct:`FileStorage <werkzeug.datastructures.FileStorage>`)): list of uploaded files
+            generate (bool, optional): whether to generate tuples and batches as well
+                            or only read the items, *default:* ``True``
+            options: keyword arguments for :class:`~project.generator.DataGenerator`,
+                            e.g. ``engine='numpy'``
 
     Returns:
             generator.DataGenerator: object that contains list of items, batches and tuples
@@ -53,7 +62,7 @@ def upload_file(files):
     """
 
     # create DataGenerator object
-    data = DataGenerator()
+    data = DataGenerator(**options)
 
     # keep updating datas for all validated uploaded files
     for file in files:
@@ -69,11 +78,92 @@ def upload_file(files):
             return 1
 
     # generate data, this generates the batches and tuples from the given items
-    data.generate_data()
+    if generate:
+        data.generate_data()
 
     return data
 
 
+def store_items(items, chunk_size=500):
+    """
+    Get the ids of items, the items that are not saved in table :class:`~project.models.Item`
+    yet are inserted at once. Existing items are looked up with one ``IN`` query per chunk
+    of items instead of one query per item.
+
+    Args:
+            items (iterable(str)): items
+            chunk_size (int, optional): number of items in one query, *default:* ``500``
+
+    Returns:
+            dict(str, int): id of each item
+    """
+    items = list(dict.fromkeys(items))
+    ids = {}
+
+    for i in range(0, len(items), chunk_size):
+        ids.update(
+            (item, id_)
+            for id_, item in db.session.execute(
+                select(Item.id, Item.item).where(Item.item.in_(items[i : i + chunk_size]))
+            )
+        )
+
+    missing = [item for item in items if item not in ids]
+    if missing:
+        new_ids = db.session.scalars(
+            insert(Item).returning(Item.id, sort_by_parameter_order=True), [{"item": item} for item in missing]
+        )
+        ids.update(zip(missing, new_ids))
+
+    return ids
+
+
+def store_batches(project, batches):
+    """
+    Save batches of a project with their tuples in bulk: one ``INSERT`` for all batches,
+    one for all tuples and one for all links between tuples and items
+    (besides those of :func:`store_items`), no matter how many there are.
+
+    Args:
+            project (:class:`~project.models.Project`): the project, added to the session already
+            batches (list(tuple(list(tuple(str)), str, str))): tuples of items, keyword and hit-id
+                                                                    of each batch
+
+    Returns:
+            list(int): ids of the batches
+    """
+    if not batches:
+        return []
+
+    db.session.flush()
+    item_ids = store_items(item for tuples_, _, _ in batches for tuple_ in tuples_ for item in tuple_)
+
+    batch_ids = db.session.scalars(
+        insert(Batch).returning(Batch.id, sort_by_parameter_order=True),
+        [
+            {"project_id": project.id, "size": len(tuples_), "keyword": keyword, "hit_id": hit_id}
+            for tuples_, keyword, hit_id in batches
+        ],
+    ).all()
+
+    tuples = [tuple_ for tuples_, _, _ in batches for tuple_ in tuples_]
+    tuple_ids = db.session.scalars(
+        insert(Tuple).returning(Tuple.id, sort_by_parameter_order=True),
+        [{"batch_id": batch_id} for batch_id, (tuples_, _, _) in zip(batch_ids, batches) for _ in tuples_],
+    ).all()
+
+    db.session.execute(
+        insert(tuple_item),
+        [
+            {"tuple_id": tuple_id, "item_id": item_ids[item]}
+            for tuple_id, tuple_ in zip(tuple_ids, tuples)
+            for item in dict.fromkeys(tuple_)
+        ],
+    )
+
+    return batch_ids
+
+
 def generate_keyword(chars=None, k_length=None):
     """
     Generate keyword for annotators and batches.
@@ -138,3 +228,177 @@ def convert_into_seconds(duration, unit):
         return duration * 60 * 60
     elif unit == "min":
         return duration * 60
+
+
+def text_output(name, project, create):
+    """
+    Respond with an output of a project as .txt-file, cached by
+    :class:`~project.cache.ResultCache` and tagged with an ETag of the version of its annotations.
+    If the client already has this version (``If-None-Match``), respond with
+    ``304 Not Modified`` without rendering the output at all.
+
+    Args:
+            name (str): name of the output, e.g. ``'scores'``
+            project (:class:`~project.models.Project`): the project
+            create (callable): function to render the output, returns ``None`` if there is no output yet
+
+    Returns:
+            :flask:`Response <flask.Response>` or None: the response, ``None`` if there is no output yet
+    """
+    etag = result_cache.etag(name, project)
+    if etag in request.if_none_match:
+        return tag_output(Response(status=304), etag)
+
+    body = result_cache.get_or_create(name, project, create)
+    if body is None:
+        return None
+    return tag_output(Response(body, mimetype="text/plain"), etag)
+
+
+def stream_output(name, project, generate):
+    """
+    Stream an output of a project as .txt-file while it is rendered, tagged with an ETag
+    of the version of its annotations like :func:`text_output`. The output is not cached,
+    so the memory does not depend on its size.
+
+    Args:
+            name (str): name of the output, e.g. ``'report'``
+            project (:class:`~project.models.Project`): the project
+            generate (callable): generator function yielding the output in chunks
+
+    Returns:
+            :flask:`Response <flask.Response>`: the response
+    """
+    etag = result_cache.etag(name, project)
+    if etag in request.if_none_match:
+        return tag_output(Response(status=304), etag)
+
+    return tag_output(Response(stream_with_context(generate()), mimetype="text/plain"), etag)
+
+
+def tag_output(response, etag):
+    """
+    Tag the response of an output with its ETag, clients may keep the output
+    but have to revalidate it every time.
+
+    Args:
+            response (:flask:`Response <flask.Response>`): the response
+            etag (str): entity tag of the output
+
+    Returns:
+            :flask:`Response <flask.Response>`: the response
+    """
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+
+def generate_report(project):
+    """
+    Generate the report of all annotations of a project batch by batch. Each batch is
+    read with its own queries of plain rows, so only one batch is in memory at a time:
+    its tuples with their items and all its annotations at once, looked up by
+    tuple (MTurk) or by annotator and tuple (local system).
+
+    Args:
+            project (:class:`~project.models.Project`): the project
+
+    Yields:
+            str: the header, then the lines of each batch, joined by new lines
+    """
+    name, best_def, worst_def, mturk = project.name, project.best_def, project.worst_def, project.mturk
+    # number and name of each annotator in the project, numbered in order of Project.annotators
+    annotators = {
+        anno_id: (ordinal, anno_name)
+        for ordinal, (anno_id, anno_name) in enumerate(
+            db.session.execute(
+                select(Annotator.id, Annotator.name).filter_by(project_id=project.id).order_by(Annotator.id)
+            ),
+            start=1,
+        )
+    }
+    batch_ids = db.session.scalars(select(Batch.id).filter_by(project_id=project.id).order_by(Batch.id)).all()
+
+    yield (f'\tProject: "{name.upper()}"\t').center(30).center(120, "*")
+
+    for b_id, batch_id in enumerate(batch_ids):
+        out = [f"\nBatch {b_id+1}"]
+        tuples = batch_tuples(batch_id)
+
+        # collect annotations from annotators (Workers) from MTurk
+        if mturk:
+            datas = defaultdict(list)
+            for tuple_id, best_id, worst_id in db.session.execute(
+                select(Data.tuple_id, Data.best_id, Data.worst_id)
+                .join(Tuple, Tuple.id == Data.tuple_id)
+                .where(Tuple.batch_id == batch_id)
+                .order_by(Data.tuple_id, Data.id)
+            ):
+                datas[tuple_id].append((best_id, worst_id))
+
+            for t_id, (tuple_id, items) in enumerate(tuples.items()):
+                out.append("\tTuple %d:\t%s" % (t_id + 1, ", ".join(items.values())))
+                if datas[tuple_id]:
+                    for d_anno, (best_id, worst_id) in enumerate(datas[tuple_id]):
+                        out.append(f"\t\tAnnotation {d_anno+1}: ")
+                        out.append(f"\t\t\t{best_def} - {items[best_id]}")
+                        out.append(f"\t\t\t{worst_def} - {items[worst_id]}\n")
+                else:
+                    out.append("\t\tNo result yet!\n")
+
+        # collect annotations from annotators from local system
+        else:
+            # annotators who submitted this batch, in the order of Batch.annotators
+            submitted = db.session.scalars(
+                select(annotator_batch.c.annotator_id).where(annotator_batch.c.batch_id == batch_id)
+            ).all()
+
+            # first annotation of each annotator for each tuple in this batch
+            datas = {}
+            for anno_id, tuple_id, best_id, worst_id in db.session.execute(
+                select(Data.anno_id, Data.tuple_id, Data.best_id, Data.worst_id)
+                .join(Tuple, Tuple.id == Data.tuple_id)
+                .where(Tuple.batch_id == batch_id, Data.anno_id.in_(submitted))
+                .order_by(Data.id)
+            ):
+                datas.setdefault((anno_id, tuple_id), (best_id, worst_id))
+
+            for t_id, (tuple_id, items) in enumerate(tuples.items()):
+                out.append("\tTuple %d:\t%s" % (t_id + 1, ", ".join(items.values())))
+                if submitted:
+                    for anno_id in submitted:
+                        best_id, worst_id = datas[anno_id, tuple_id]
+                        ordinal, anno_name = annotators[anno_id]
+
+                        out.append(f"\t\tAnnotator {ordinal} - '{anno_name}': ")
+                        out.append(f"\t\t\t{best_def} - {items[best_id]}")
+                        out.append(f"\t\t\t{worst_def} - {items[worst_id]}\n")
+                else:
+                    out.append("\t\tNo result yet!\n")
+
+        out.append("#" * 100)
+        yield "\n" + "\n".join(out)
+
+
+def batch_tuples(batch_id):
+    """
+    Read the items of each tuple in a batch with one query.
+
+    Args:
+            batch_id (int): id of the batch
+
+    Returns:
+            dict(int, dict(int, str)): items (id to item) of each tuple id, in order of the tuples
+            and of the items as in :attr:`Tuple.items <project.models.Tuple>`
+    """
+    tuples = defaultdict(dict)
+    for tuple_id, item_id, item in db.session.execute(
+        select(tuple_item.c.tuple_id, Item.id, Item.item)
+        .join(Item, Item.id == tuple_item.c.item_id)
+        .join(Tuple, Tuple.id == tuple_item.c.tuple_id)
+        .where(Tuple.batch_id == batch_id)
+        .order_by(tuple_item.c.tuple_id, tuple_item.c.item_id)
+    ):
+        tuples[tuple_id][item_id] = item
+    return tuples
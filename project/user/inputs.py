@@ -10,15 +10,18 @@ This module defines routes to manage input new inputs of projects from users.
 """
 
 import re
-import boto3
 import string
-from flask import render_template, redirect, url_for, Response, current_app
+from urllib.parse import urlsplit
+from flask import render_template, redirect, url_for, request, current_app
 from flask_login import login_required, current_user
 from . import user_app
 from .forms import ProjectInformationForm
-from .helpers import upload_file, generate_keyword, convert_into_seconds
-from .. import db
-from ..models import Project, Annotator, Batch, Tuple, Item
+from .helpers import upload_file, generate_keyword, convert_into_seconds, store_batches
+from .. import db, job_queue, mturk_clients
+from ..generator import DataGenerator, DesignCache
+from ..jobs import progress
+from ..mturk import create_hits, find_hits, question, question_template
+from ..models import Project, Annotator, Batch, Job
 
 
 # User - Upload project
@@ -33,6 +36,8 @@ def upload_project():
 
     Note:
             Upload project on Mechanical Turk Platform or use local annotator system.
+            The project is ``'building'`` until its tuples, batches (and HITs) are created
+            in the background by :func:`build_project`.
 
     Error:
             Error message emerges if there are invalid fields or there is no logged in user.
@@ -42,8 +47,8 @@ def upload_project():
     project_form = ProjectInformationForm()
 
     if project_form.validate_on_submit():
-        # get data from uploaded file
-        data = upload_file(project_form.upload.data)
+        # get items from uploaded file, tuples and batches are created in the background
+        data = upload_file(project_form.upload.data, generate=False)
 
         # check if user uploaded empty validated file(s)
         if not data:
@@ -63,7 +68,7 @@ def upload_project():
             name = project_form.name.data.strip()
 
         # add link to project page for user to view project information
-        p_name = ("%s" % (re.sub("[^\w]+", "-", name))).strip("-").strip("_")
+        p_name = ("%s" % (re.sub(r"[^\w]+", "-", name))).strip("-").strip("_")
 
         # if this name exists already (more than one user have the same project name)
         if Project.query.filter_by(name=name).first():
@@ -81,17 +86,20 @@ def upload_project():
             p_name = "%s-%d" % (p_name, len(Project.query.all()))
 
         # add new project
+        # (fields that are not sent at all have no data, see tests/functional/test_wrong_cases_input_required.py)
         current_project = Project(
             name=name,
-            description=project_form.description.data,
+            description=project_form.description.data or "",
             anno_number=project_form.anno_number.data,
-            best_def=project_form.best_def.data,
-            worst_def=project_form.worst_def.data,
+            best_def=project_form.best_def.data or "",
+            worst_def=project_form.worst_def.data or "",
             n_items=len(data.items),
             user=current_user,
             p_name=p_name,
             mturk=project_form.mturk.data,
+            status="building",
         )
+        db.session.add(current_project)
 
         # user wants to upload this project on Mechanical Turk Market
         if project_form.mturk.data:
@@ -122,20 +130,27 @@ def upload_project():
             if any(check):
                 return render_template("user/upload-project.html", form=project_form, name=current_user.username)
 
-            mturk = boto3.client(
-                service_name="mturk",
-                aws_access_key_id=aws_access_key_id,
-                aws_secret_access_key=aws_secret_access_key,
-                region_name="us-east-1",
-                endpoint_url=current_app.config["MTURK_URL"],
+            # credentials are only given to the job in memory, never saved
+            credentials = dict(aws_access_key_id=aws_access_key_id, aws_secret_access_key=aws_secret_access_key)
+
+            # information from user for creating HITs on MTurk
+            hits = dict(
+                title=project_form.name.data,
+                description=project_form.description.data,
+                keywords=project_form.keywords.data,
+                reward=project_form.reward.data,
+                max_assignments=project_form.anno_number.data,
+                lifetime=convert_into_seconds(duration=project_form.lifetime.data, unit=project_form.lifetimeunit.data),
+                hit_duration=convert_into_seconds(
+                    duration=project_form.hit_duration.data, unit=project_form.duration_unit.data
+                ),
+                url_root=request.url_root,
             )
 
-            # define endpoint to a HIT using generated hit_id
-            hit_ids = set()
-            hit_code = generate_keyword(chars=string.ascii_letters, k_length=3)
-
         # user wants to choose annotators themselves (they want to use our local system)
         else:
+            credentials, hits = {}, None
+
             # add keywords for annotators in local system
             for num_anno in range(project_form.anno_number.data):
                 new_keyword = generate_keyword()
@@ -145,99 +160,158 @@ def upload_project():
                     new_keyword = generate_keyword()
 
                 # add new key word
-                Annotator(keyword=new_keyword, project=current_project)
+                db.session.add(Annotator(keyword=new_keyword, project=current_project))
+
+        # create tuples, batches (and HITs) of the project in the background
+        job = Job(
+            kind="build_project",
+            payload={"items": sorted(data.items), "hits": hits},
+            project=current_project,
+            items_parsed=len(data.items),
+        )
+        job_queue.enqueue(job, **credentials)
+
+        return redirect(url_for("user.profile", some_name=current_user.username))
+
+    return render_template("user/upload-project.html", form=project_form, name=current_user.username)
+
+
+# Job - Build the uploaded project
+@job_queue.task("build_project")
+def build_project(job, aws_access_key_id=None, aws_secret_access_key=None):
+    """
+    Create tuples and batches of an uploaded project from the items in the payload of its job
+    and save them, then create a HIT on Mechanical Turk for each batch if wanted and mark the
+    project as ``'ready'``. The progress is saved in the job after each step.
+
+    The job can be run again if it is interrupted: batches that are saved already are
+    not created again, neither are HITs whose ids are saved in :attr:`Batch.mturk_hit_id
+    <project.models.Batch>`. A HIT that was created but not saved is found again by its token
+    before the HITs are created (see :func:`~project.mturk.find_hits`), or else when MTurk refuses
+    the token (see :func:`~project.mturk.create_hit`).
+
+    Args:
+            job (:class:`~project.models.Job`): the job, its payload contains the ``items``
+                                    and the settings of the ``hits`` (``None`` for the local system)
+            aws_access_key_id (str, optional): IAM AWS credentials - key id, *default:* ``AWS_ACCESS_KEY_ID``
+            aws_secret_access_key (str, optional): IAM AWS credentials - secret access key,
+                                    *default:* ``AWS_SECRET_ACCESS_KEY``
+    """
+    current_project = job.project
+    hits = job.payload["hits"]
+
+    if not current_project.batches:
+        # generate tuples and batches from the uploaded items
+        options = dict(current_app.config["GENERATOR_OPTIONS"])
+        if current_app.config["DESIGN_CACHE_DIR"]:
+            options["cache"] = DesignCache(
+                current_app.config["DESIGN_CACHE_DIR"], current_app.config["DESIGN_CACHE_SIZE"]
+            )
 
-        # add batches, tuples and items
+        data = DataGenerator(**options)
+        data.items = set(job.payload["items"])
+        data.generate_data()
+        progress(job, tuples_generated=sum(len(tuples_) for tuples_ in data.batches.values()))
+
+        # define endpoint to a HIT using generated hit_id
+        keywords = set()
+        hit_ids = set()
+        hit_code = generate_keyword(chars=string.ascii_letters, k_length=3)
+
+        # keywords and hit_ids of the batches, saved together with tuples and items afterwards
+        batches = []
         for i, tuples_ in data.batches.items():
             # create keyword for each batch to upload this project on Mechanical Turk Market
-            if project_form.mturk.data:
+            if hits:
                 new_keyword = generate_keyword()
 
                 # make sure the new created keyword is never used for any batch of any project
-                while Batch.query.filter_by(keyword=new_keyword).first():
+                while new_keyword in keywords or Batch.query.filter_by(keyword=new_keyword).first():
                     new_keyword = generate_keyword()
+                keywords.add(new_keyword)
 
-                # create this HIT on MTurk
                 # create HIT_ID for the batch in local system (has nothing to do with HITID on MTurk)
                 new_hit_id = hit_code + generate_keyword(chars=string.digits)
                 while new_hit_id in hit_ids:
                     new_hit_id = hit_code + generate_keyword(chars=string.digits)
                 hit_ids.add(new_hit_id)
 
-                # get url for the hit to save on corresponding one on MTurk
-                url = url_for("mturk.hit", p_name=p_name, hit_id=new_hit_id, _external=True)
-
-                # define the questions.xml template with the type box for keyword
-                response = Response(
-                    render_template(
-                        "questions.xml",
-                        title=project_form.name.data,
-                        description=project_form.description.data,
-                        url=url,
-                    ),
-                    mimetype="text/plain",
-                )
-                response.implicit_sequence_conversion = False
-                question = response.get_data(as_text=True)
-
-                # get information from user for creating hit on MTurk
-                p_keyword = project_form.keywords.data
-                p_reward = project_form.reward.data
-                lifetime = convert_into_seconds(
-                    duration=project_form.lifetime.data, unit=project_form.lifetimeunit.data
-                )
-                hit_duration = convert_into_seconds(
-                    duration=project_form.hit_duration.data, unit=project_form.duration_unit.data
-                )
-
-                # create new hit on MTurk
-                new_hit = mturk.create_hit(
-                    Title=project_form.name.data,
-                    Description=project_form.description.data,
-                    Keywords=p_keyword,
-                    Reward=p_reward,
-                    MaxAssignments=project_form.anno_number.data,
-                    LifetimeInSeconds=lifetime,
-                    AssignmentDurationInSeconds=hit_duration,
-                    Question=question,
-                    AssignmentReviewPolicy={
-                        "PolicyName": "ScoreMyKnownAnswers/2011-09-01",
-                        "Parameters": [
-                            {"Key": "AnswerKey", "MapEntries": [{"Key": "keyword", "Values": [new_keyword]}]},
-                            {"Key": "ApproveIfKnownAnswerScoreIsAtLeast", "Values": ["1"]},
-                            {"Key": "RejectIfKnownAnswerScoreIsLessThan", "Values": ["1"]},
-                            {
-                                "Key": "RejectReason",
-                                "Values": [
-                                    """Sorry, we could not approve your submission 
-	                     			as you did not type in the right keyword."""
-                                ],
-                            },
-                        ],
-                    },
-                )
-
             # no need to create keyword and hit_id for batch as this is for the local process
             else:
                 new_keyword = new_hit_id = None
 
-            # add new batch
-            current_batch = Batch(project=current_project, size=len(tuples_), keyword=new_keyword, hit_id=new_hit_id)
+            batches.append((tuples_, new_keyword, new_hit_id))
+
+        # add batches, tuples and items in bulk
+        store_batches(current_project, batches)
+        progress(job, batches_stored=len(batches))
+
+    # user wants to upload this project on Mechanical Turk Market
+    if hits:
+        # shared client of these credentials
+        mturk = mturk_clients.client(aws_access_key_id, aws_secret_access_key)
+
+        # build urls to the HITs outside of a request, from where the project was uploaded
+        url_root = urlsplit(hits["url_root"])
+        urls = current_app.url_map.bind(url_root.netloc, script_name=url_root.path, url_scheme=url_root.scheme)
+
+        # define the questions.xml template with the type box for keyword, the same for all HITs
+        template = question_template(title=hits["title"], description=hits["description"])
+
+        # create the HITs that are not created yet on MTurk
+        batches = {batch.id: batch for batch in current_project.batches if not batch.mturk_hit_id}
+        new_hits = {
+            batch_id: dict(
+                Title=hits["title"],
+                Description=hits["description"],
+                Keywords=hits["keywords"],
+                Reward=hits["reward"],
+                MaxAssignments=hits["max_assignments"],
+                LifetimeInSeconds=hits["lifetime"],
+                AssignmentDurationInSeconds=hits["hit_duration"],
+                # get url for the hit to save on corresponding one on MTurk
+                Question=question(
+                    template,
+                    urls.build(
+                        "mturk.hit", {"p_name": current_project.p_name, "hit_id": batch.hit_id}, force_external=True
+                    ),
+                ),
+                # MTurk refuses to create a HIT with the same token twice
+                UniqueRequestToken=f"bws-{batch.keyword}",
+                AssignmentReviewPolicy={
+                    "PolicyName": "ScoreMyKnownAnswers/2011-09-01",
+                    "Parameters": [
+                        {"Key": "AnswerKey", "MapEntries": [{"Key": "keyword", "Values": [batch.keyword]}]},
+                        {"Key": "ApproveIfKnownAnswerScoreIsAtLeast", "Values": ["1"]},
+                        {"Key": "RejectIfKnownAnswerScoreIsLessThan", "Values": ["1"]},
+                        {
+                            "Key": "RejectReason",
+                            "Values": [
+                                """Sorry, we could not approve your submission 
+	                     			as you did not type in the right keyword."""
+                            ],
+                        },
+                    ],
+                },
+            )
+            for batch_id, batch in batches.items()
+        }
 
-            for tuple_ in tuples_:
-                # add new tuple
-                current_tuple = Tuple(batch=current_batch)
+        # save the id of each HIT as soon as it is created
+        def created(batch_id, mturk_hit_id):
+            batches[batch_id].mturk_hit_id = mturk_hit_id
+            progress(job, hits_created=job.hits_created + 1)
 
-                for item in tuple_:
-                    # check if this item is already saved in the database
-                    if Item.query.filter_by(item=item).first():
-                        current_tuple.items.append(Item.query.filter_by(item=item).first())
-                    else:
-                        new_item = Item(item=item)
-                        current_tuple.items.append(new_item)
+        retries = dict(retries=current_app.config["MTURK_RETRIES"], backoff=current_app.config["MTURK_BACKOFF"])
 
-        db.session.commit()
+        # a resumed job first records the HITs created but not recorded before it was interrupted,
+        # as MTurk refuses their tokens again only for 24 hours
+        if job.attempts > 1 and new_hits:
+            tokens = {hit["UniqueRequestToken"]: batch_id for batch_id, hit in new_hits.items()}
+            for token, mturk_hit_id in find_hits(mturk, tokens, **retries).items():
+                del new_hits[tokens[token]]
+                created(tokens[token], mturk_hit_id)
 
-        return redirect(url_for("user.profile", some_name=current_user.username))
+        create_hits(mturk, new_hits, workers=current_app.config["MTURK_WORKERS"], on_created=created, **retries)
 
-    return render_template("user/upload-project.html", form=project_form, name=current_user.username)
+    current_project.status = "ready"
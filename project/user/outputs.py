@@ -9,14 +9,16 @@ This module defines routes to manage outputs for users.
 
 """
 
+from functools import partial
 from flask import redirect, url_for, flash, Response
 from flask_login import login_required, logout_user, current_user
 from . import user_app
 from .forms import LoginForm
-from .helpers import is_not_current_user
-from ..generator import ScoreGenerator
+from .helpers import generate_report, is_not_current_user, stream_output, text_output
 from .. import db
-from ..models import Project, Item, Data
+from ..generator import ScoreGenerator
+from ..scores import ensure_counts
+from ..models import Project
 
 
 # User - Get Scores
@@ -50,37 +52,28 @@ def get_scores(some_name, p_name):
 
     current_project = Project.query.filter_by(p_name=p_name, user=current_user).first()
 
-    tuples, best, worst = [], [], []
-
-    # collect annotations from annotators (Workers) from MTurk
-    if current_project.mturk:
-        for batch in current_project.batches:
-            for tuple_ in batch.tuples:
-                for data in tuple_.datas:
-                    tuples.append([item.id for item in data.tuple_.items])
-                    best.append(data.best_id)
-                    worst.append(data.worst_id)
-
-    # collect annotations from annotators from local system
-    else:
-        for annotator in current_project.annotators:
-            # get submitted batch(es) of this project by this annotator
-            for batch in annotator.batches:
-                for tuple_ in batch.tuples:
-                    data = Data.query.filter_by(annotator=annotator, tuple_=tuple_).first()
-                    tuples.append([item.id for item in data.tuple_.items])
-                    best.append(data.best_id)
-                    worst.append(data.worst_id)
-
-    if tuples:
-        scores = ScoreGenerator(tuples, best, worst).scoring()
-        out = [f"{db.session.get(Item,key).item}\t{value}" for key, value in scores]
-
-        # return output
-        return Response("\n".join(out), mimetype="text/plain")
-
-    else:
+    def create():
+        # counts of each item from annotations of annotators (Workers) from MTurk
+        # or from annotators from local system, updated on every submission
+        # (counted once here for annotations submitted before the counts were kept)
+        counts = ensure_counts(current_project)
+        db.session.commit()
+        if not counts:
+            return None
+
+        items = {id_: item for id_, item, _, _, _ in counts}
+        scores = ScoreGenerator.from_counts(
+            frequencies={id_: n for id_, _, n, _, _ in counts},
+            best={id_: best for id_, _, _, best, _ in counts},
+            worst={id_: worst for id_, _, _, _, worst in counts},
+        ).scoring()
+        return "\n".join(f"{items[key]}\t{value}" for key, value in scores)
+
+    # return output, cached until new annotations are submitted
+    response = text_output("scores", current_project, create)
+    if response is None:
         return "<h2> No result yet! </h2>"
+    return response
 
 
 # User - Get Report
@@ -114,44 +107,8 @@ def get_report(some_name, p_name):
 
     current_project = Project.query.filter_by(p_name=p_name, user=current_user).first()
 
-    out = []
-    out.append((f'\tProject: "{current_project.name.upper()}"\t').center(30).center(120, "*"))
-
-    # collect annotations from annotators (Workers) from MTurk
-    if current_project.mturk:
-        for b_id, batch in enumerate(current_project.batches):
-            out.append(f"\nBatch {b_id+1}")
-            for t_id, tuple_ in enumerate(batch.tuples):
-                out.append("\tTuple %d:\t%s" % (t_id + 1, ", ".join([f"{item.item}" for item in tuple_.items])))
-                if len(tuple_.datas) > 0:
-                    for d_anno, data in enumerate(tuple_.datas):
-                        out.append(f"\t\tAnnotation {d_anno+1}: ")
-                        out.append(f"\t\t\t{current_project.best_def} - {db.session.get(Item,data.best_id).item}")
-                        out.append(f"\t\t\t{current_project.worst_def} - {db.session.get(Item,data.worst_id).item}\n")
-                else:
-                    out.append("\t\tNo result yet!\n")
-            out.append("#" * 100)
-
-    # collect annotations from annotators from local system
-    else:
-        annotators = current_project.annotators
-        for b_id, batch in enumerate(current_project.batches):
-            out.append(f"\nBatch {b_id+1}")
-            for t_id, tuple_ in enumerate(batch.tuples):
-                out.append("\tTuple %d:\t%s" % (t_id + 1, ", ".join([f"{item.item}" for item in tuple_.items])))
-                if batch.annotators:
-                    for annotator in batch.annotators:
-                        data = Data.query.filter_by(annotator=annotator, tuple_=tuple_).first()
-
-                        out.append(f"\t\tAnnotator {annotators.index(annotator)+1} - '{annotator.name}': ")
-                        out.append(f"\t\t\t{current_project.best_def} - {db.session.get(Item,data.best_id).item}")
-                        out.append(f"\t\t\t{current_project.worst_def} - {db.session.get(Item,data.worst_id).item}\n")
-                else:
-                    out.append("\t\tNo result yet!\n")
-            out.append("#" * 100)
-
-    # return output
-    return Response("\n".join(out), mimetype="text/plain")
+    # return output while it is generated, batch by batch
+    return stream_output("report", current_project, partial(generate_report, current_project))
 
 
 # User - Get Keywords for annotators
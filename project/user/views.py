@@ -67,13 +67,14 @@ def profile(some_name):
                 "n_anno": project.anno_number,
                 "best": project.best_def,
                 "worst": project.worst_def,
+                "status": project.status,
             }
             for i, project in enumerate(current_user.projects)
         }
         if current_user.projects
         else None
     )
-    other_keys = ["n_anno", "best", "worst", "description"]
+    other_keys = ["n_anno", "best", "worst", "description", "status"]
 
     # define style for the titles in table of projects
     title_styles = {
@@ -83,6 +84,7 @@ def profile(some_name):
         "Definition of 'best'": "30",
         "Definition of 'worst'": "30",
         "Description": "100",
+        "Status": "15",
     }
     if projects:
         projects = projects.items()
@@ -136,10 +138,8 @@ def project(some_name, p_name):
     # the number of annotations for each HIT (batch)
     if mturk:
         for i, batch in enumerate(current_project.batches):
-            check_tuple = batch.tuples[0]
-
             # get n_anno_join, check the number of annotators who submit this batch
-            n_anno_join = len(check_tuple.datas)
+            n_anno_join = batch.submissions
 
             # get n_anno_left
             # how many annotators this batch still needs
@@ -1,4 +1,8 @@
 import pytest
+from threading import Lock
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from project.mturk import ClientRegistry
 from project.models import User, Project, Batch, Tuple, Item, Annotator, Data
 from project import create_app, db
 from config import config
@@ -80,6 +84,125 @@ def new_data():
     return data
 
 
+class FakeMTurk:
+    """
+    Local stand-in of the MTurk API (thread-safe like a boto3 client).
+    Calls fail with the error codes in ``errors`` first, HITs with a known
+    ``UniqueRequestToken`` are refused like on MTurk. Assignments are submitted
+    with :meth:`submit` and listed in pages of ``MaxResults``.
+    """
+
+    ANSWER = (
+        '<QuestionFormAnswers xmlns="http://mechanicalturk.amazonaws.com/'
+        'AWSMechanicalTurkDataSchemas/2005-10-01/QuestionFormAnswers.xsd">'
+        "<Answer><QuestionIdentifier>keyword</QuestionIdentifier><FreeText>%s</FreeText></Answer>"
+        "</QuestionFormAnswers>"
+    )
+
+    def __init__(self):
+        self.hits = {}
+        self.assignments = {}
+        self.listed = []
+        self.errors = []
+        self.calls = 0
+        # whether the error for a HIT created twice leaves out its HITId
+        self.hide_hit_id = False
+        # whether the tokens of the created HITs expired, as on MTurk after 24 hours
+        self.expired = False
+        self.lock = Lock()
+
+    def call(self, operation):
+        self.calls += 1
+        if self.errors:
+            code = self.errors.pop(0)
+            raise ClientError({"Error": {"Code": code, "Message": code}}, operation)
+
+    def create_hit(self, **kwargs):
+        with self.lock:
+            self.call("CreateHIT")
+
+            token = kwargs.get("UniqueRequestToken")
+            for hit in self.hits.values():
+                if hit["UniqueRequestToken"] == token and not self.expired:
+                    message = (
+                        "HitAlreadyExists" if self.hide_hit_id else f'The HIT with ID "{hit["HITId"]}" already exists.'
+                    )
+                    raise ClientError({"Error": {"Code": "RequestError", "Message": message}}, "CreateHIT")
+
+            hit_id = "HIT%04d" % (len(self.hits) + 1)
+            self.hits[hit_id] = dict(kwargs, HITId=hit_id)
+            return {"HIT": {"HITId": hit_id}}
+
+    def list_hits(self, MaxResults=10, NextToken=None):
+        with self.lock:
+            self.call("ListHITs")
+
+            hits = [dict(hit) for hit in self.hits.values()]
+            start = int(NextToken or 0)
+            response = {"HITs": hits[start : start + MaxResults]}
+            response["NumResults"] = len(response["HITs"])
+            if response["NumResults"] == MaxResults:
+                response["NextToken"] = str(start + MaxResults)
+            return response
+
+    def submit(self, hit_id, keyword, worker_id="WORKER"):
+        with self.lock:
+            assignment_id = "ASSIGNMENT%04d" % (len(self.assignments) + 1)
+            self.assignments[assignment_id] = dict(
+                AssignmentId=assignment_id,
+                WorkerId=worker_id,
+                HITId=hit_id,
+                AssignmentStatus="Submitted",
+                Answer=self.ANSWER % keyword,
+            )
+            return assignment_id
+
+    def list_assignments_for_hit(self, HITId, MaxResults=10, NextToken=None):
+        with self.lock:
+            self.call("ListAssignmentsForHIT")
+            self.listed.append((HITId, NextToken))
+
+            assignments = [dict(assignment) for assignment in self.assignments.values() if assignment["HITId"] == HITId]
+            start = int(NextToken or 0)
+            response = {"Assignments": assignments[start : start + MaxResults]}
+            response["NumResults"] = len(response["Assignments"])
+            # like MTurk, a full page has a token, even if no assignments follow
+            if response["NumResults"] == MaxResults:
+                response["NextToken"] = str(start + MaxResults)
+            return response
+
+    def review(self, operation, AssignmentId, status):
+        with self.lock:
+            self.call(operation)
+            assignment = self.assignments[AssignmentId]
+            if assignment["AssignmentStatus"] != "Submitted":
+                raise ClientError({"Error": {"Code": "RequestError", "Message": "NotSubmitted"}}, operation)
+            assignment["AssignmentStatus"] = status
+            return {}
+
+    def approve_assignment(self, AssignmentId, RequesterFeedback=None):
+        return self.review("ApproveAssignment", AssignmentId, "Approved")
+
+    def reject_assignment(self, AssignmentId, RequesterFeedback):
+        return self.review("RejectAssignment", AssignmentId, "Rejected")
+
+
+@pytest.fixture
+def fake_mturk():
+    return FakeMTurk()
+
+
+@pytest.fixture
+def mturk_factory(test_client, mocker, fake_mturk):
+    """
+    Replace the registry of MTurk clients of the application by an empty one,
+    whose clients are the stand-in ``fake_mturk``. Returns the mocked factory of clients.
+    """
+    factory = mocker.Mock(return_value=fake_mturk)
+    mocker.patch.dict(test_client.application.extensions, {"mturk_clients": ClientRegistry(Config(), factory=factory)})
+    return factory
+
+
 #######################################
 # Configurations for Functional Tests #
 #######################################
@@ -1,3 +1,11 @@
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+from project import db
+from project.annotator.helpers import ANSWER_ERRORS, UPSERTS, count_submission, save_annotations
+from project.models import Annotator, Batch, Data, Item, Project, Tuple
+
 #################################################
 # Functional Tests to submit an annotated batch #
 #################################################
@@ -126,3 +134,293 @@ def test_resubmit_same_batch(test_client, init_database):
     # 3.
     assert b"Admin" in response.data
     assert b"Batch 1 already submitted!" in response.data
+
+
+def test_batch_queries(test_client, init_database):
+    """
+    GIVEN a Flask application, a project with batch 1 of 1 tuple and batch 2 of 30 tuples
+    WHEN a logged-in annotator saves some answers of batch 2 and requests both batch pages (GET)
+    THEN check if:
+            1. both pages are rendered with a few queries, no matter how many tuples
+            2. the saved answers are checked on the page of batch 2
+    """
+    project = Project.query.filter_by(p_name="test").first()
+    items = Item.query.order_by(Item.id).all()
+    batch = Batch(size=30, project=project)
+    for _ in range(30):
+        Tuple(batch=batch).items = items
+    db.session.add(batch)
+    db.session.commit()
+
+    test_client.post("/annotator", data=dict(keyword="kjd8f9s879", name="sanaz"), follow_redirects=True)
+    test_client.post(
+        "/annotator/test/batch-2",
+        data={"action": "save", "question-2-best_item": "4", "question-2-worst_item": "1"},
+    )
+
+    queries = []
+
+    def count(conn, cursor, statement, *args):
+        queries.append(statement)
+
+    event.listen(db.engine, "before_cursor_execute", count)
+    try:
+        response = test_client.get("/annotator/test/batch-1")
+        n_queries = len(queries)
+        response = test_client.get("/annotator/test/batch-2")
+    finally:
+        event.remove(db.engine, "before_cursor_execute", count)
+
+    # 1.
+    assert response.status_code == 200
+    assert len(queries) - n_queries <= n_queries <= 7
+    # 2.
+    assert b'<input checked="checked" id="question-2-best_item-3"' in response.data
+    assert b'<input checked="checked" id="question-2-worst_item-0"' in response.data
+    assert response.data.count(b'checked="checked"') == 2
+
+
+def test_question_fragments(test_client, init_database):
+    """
+    GIVEN a Flask application, batch 2 of 30 tuples with saved answers of annotator sanaz
+    WHEN the page of batch 2 is requested (GET) by sanaz and by another annotator, also with CSRF protection
+    THEN check if:
+            1. the questions are rendered once and taken from the fragment cache afterwards
+            2. only the saved answers of each annotator are checked
+            3. each annotator gets their own CSRF token in the cached questions
+    """
+    app = test_client.application
+    backend = app.extensions["fragment_cache"]
+    backend.entries.clear()
+    stats = backend.stats.copy()
+    responses = []
+
+    # each annotator with their own client and context, i.e. their own session and CSRF token
+    for keyword, name in [("kjd8f9s879", "sanaz"), ("ax7832ljf", "jung")]:
+        client = app.test_client()
+        with app.app_context():
+            client.post("/annotator", data=dict(keyword=keyword, name=name))
+        app.config["WTF_CSRF_ENABLED"] = True
+        try:
+            with app.app_context():
+                responses.append(client.get("/annotator/test/batch-2"))
+        finally:
+            app.config["WTF_CSRF_ENABLED"] = False
+
+    tokens = [
+        {line for line in response.data.decode().splitlines() if 'name="question-1-csrf_token"' in line}
+        for response in responses
+    ]
+
+    # 1.
+    assert [response.status_code for response in responses] == [200, 200]
+    assert backend.stats - stats == {"miss": 1, "hit": 1}
+    assert "__CSRF_TOKEN__" in backend.get("questions:2:question-")[0][2]
+    # 2.
+    assert responses[0].data.count(b'checked="checked"') == 2
+    assert b'<input checked="checked" id="question-2-best_item-3"' in responses[0].data
+    assert b'checked="checked"' not in responses[1].data
+    # 3.
+    assert b"__CSRF_TOKEN__" not in responses[0].data + responses[1].data
+    assert len(tokens[0]) == len(tokens[1]) == 1 and tokens[0] != tokens[1]
+
+
+@pytest.mark.parametrize("upsert", [True, False])
+def test_save_annotations(test_client, init_database, mocker, upsert):
+    """
+    GIVEN a Flask application, an annotator with saved answers of batch 2 and a database with or without upsert
+    WHEN the annotator saves answers of batch 2 again
+    THEN check if:
+            1. the saved answers are replaced and the new ones are added, one row per tuple
+            2. a second row of an annotator for the same tuple is refused by the database
+            3. answers from MTurk (without annotator) are always added
+    """
+    if not upsert:
+        mocker.patch.dict(UPSERTS, clear=True)
+    annotator = db.session.get(Annotator, 2)
+    tuples = Batch.query.order_by(Batch.id).all()[1].tuples
+    n_datas = Data.query.count()
+
+    save_annotations([(tuples[0].id, 1, 2), (tuples[1].id, 3, 4)], annotator)
+    save_annotations([(tuples[1].id, 2, 1), (tuples[2].id, 4, 3)], annotator)
+
+    # 1.
+    datas = Data.query.filter(Data.anno_id == 2, Data.tuple_id.in_([tuple_.id for tuple_ in tuples[:3]])).all()
+    assert sorted((data.tuple_id, data.best_id, data.worst_id) for data in datas) == [
+        (tuples[0].id, 1, 2),
+        (tuples[1].id, 2, 1),
+        (tuples[2].id, 4, 3),
+    ]
+    # 2.
+    db.session.add(Data(best_id=1, worst_id=2, annotator=annotator, tuple_=tuples[0]))
+    with pytest.raises(IntegrityError):
+        db.session.flush()
+    db.session.rollback()
+    # 3.
+    save_annotations([(tuples[0].id, 1, 2)])
+    save_annotations([(tuples[0].id, 1, 2)])
+    assert Data.query.filter_by(anno_id=None, tuple_id=tuples[0].id).count() == 2
+
+    db.session.rollback()
+    assert Data.query.count() == n_datas
+
+
+def test_hit_capacity(test_client, init_database):
+    """
+    GIVEN a Flask application and a project on MTurk with 2 annotations per HIT
+    WHEN the HIT of a batch is submitted 10 times in parallel
+    THEN check if:
+            1. 2 submissions are counted and saved, they get the keyword
+            2. the other submissions are refused as the HIT is full, nothing of them is saved
+            3. the HIT is no longer available (GET)
+    """
+    project = Project.query.filter_by(p_name="test").first()
+    items = Item.query.order_by(Item.id).all()
+    hit_project = Project(
+        name="hit capacity",
+        description="this is a test about the capacity of a HIT",
+        anno_number=2,
+        best_def="best",
+        worst_def="worst",
+        n_items=4,
+        p_name="hit-capacity",
+        mturk=True,
+        user=project.user,
+    )
+    batch = Batch(size=1, keyword="capacity", hit_id="HITCAPACITY", project=hit_project)
+    Tuple(batch=batch).items = items
+    db.session.add_all([hit_project, batch])
+    db.session.commit()
+
+    app = test_client.application
+
+    def submit(_):
+        with app.test_client() as client:
+            return client.post("/mturk/hit-capacity/HITCAPACITY", data={"1-best_item": "1", "1-worst_item": "2"})
+
+    with ThreadPoolExecutor(5) as executor:
+        responses = list(executor.map(submit, range(10)))
+
+    # 1.
+    db.session.refresh(batch)
+    assert batch.submissions == 2
+    assert sum(b"capacity" in response.data for response in responses) == 2
+    assert Data.query.filter_by(tuple_id=batch.tuples[0].id).count() == 2
+    # 2.
+    assert sum(b"This HIT is no longer available!" in response.data for response in responses) == 8
+    assert {response.status_code for response in responses} <= {200, 409}
+    # 3.
+    assert b"This HIT is no longer available!" in test_client.get("/mturk/hit-capacity/HITCAPACITY").data
+
+
+def test_count_submission(test_client, init_database):
+    """
+    GIVEN a Flask application and a batch with 3 places left
+    WHEN the batch is submitted 20 times in parallel
+    THEN check if exactly 3 submissions are counted
+    """
+    app = test_client.application
+    batch = Batch.query.filter_by(hit_id="HITCAPACITY").first()
+    capacity = batch.submissions + 3
+
+    def submit(_):
+        with app.app_context():
+            counted = count_submission(db.session.get(Batch, batch.id), capacity=capacity)
+            db.session.commit()
+            return counted
+
+    with ThreadPoolExecutor(8) as executor:
+        counted = list(executor.map(submit, range(20)))
+
+    db.session.refresh(batch)
+    assert counted.count(True) == 3
+    assert batch.submissions == capacity
+
+
+def test_batch_answers(test_client, init_database):
+    """
+    GIVEN a Flask application, a logged-in annotator and batch 2 of 30 tuples of items A(1), B(2), C(3), D(4)
+    WHEN the answers of the batch are saved and submitted as JSON
+    THEN check if:
+            1. invalid answers are refused with the error of each question, nothing is saved
+            2. saved answers may be incomplete, they are checked on the batch page afterwards
+            3. the batch is submitted with all answers and cannot be submitted again
+    """
+    test_client.post("/annotator", data=dict(keyword="ax7832ljf", name="jung"), follow_redirects=True)
+    annotator = db.session.get(Annotator, 3)
+    n_datas = Data.query.filter_by(annotator=annotator).count()
+
+    # 1.
+    answers = [[1, 1], [1, 9], None] + [[1, 2]] * 27
+    response = test_client.post("/annotator/test/batch-2/answers", json=dict(action="submit", answers=answers))
+    assert response.status_code == 400
+    assert response.json["errors"] == {
+        "1": ANSWER_ERRORS["equal"],
+        "2": ANSWER_ERRORS["choice"],
+        "3": ANSWER_ERRORS["required"],
+    }
+    response = test_client.post("/annotator/test/batch-2/answers", json=dict(action="save", answers=[[1, 2]]))
+    assert response.status_code == 400 and list(response.json["errors"]) == ["0"]
+    assert Data.query.filter_by(annotator=annotator).count() == n_datas
+
+    # 2.
+    answers = [[4, 1], [None, 3]] + [None] * 28
+    response = test_client.post("/annotator/test/batch-2/answers", json=dict(action="save", answers=answers))
+    assert response.json == {"action": "save", "answers": 30}
+    response = test_client.get("/annotator/test/batch-2")
+    assert b'<input checked="checked" id="question-1-best_item-3"' in response.data
+    assert b'<input checked="checked" id="question-2-worst_item-2"' in response.data
+    assert response.data.count(b'checked="checked"') == 3
+
+    # 3.
+    batch = Batch.query.order_by(Batch.id).all()[1]
+    submissions = batch.submissions
+    answers = [[4, 1]] * 30
+    response = test_client.post("/annotator/test/batch-2/answers", json=dict(action="submit", answers=answers))
+    assert response.json == {"action": "submit", "answers": 30}
+    db.session.refresh(batch)
+    assert batch.submissions == submissions + 1 and batch in annotator.batches
+    assert Data.query.filter_by(annotator=annotator, best_id=4, worst_id=1).count() == 30
+    response = test_client.post("/annotator/test/batch-2/answers", json=dict(action="submit", answers=answers))
+    assert response.status_code == 409
+
+
+def test_hit_answers(test_client, init_database):
+    """
+    GIVEN a Flask application and a HIT of 1 tuple on MTurk with 2 annotations per HIT
+    WHEN the answers of the HIT are submitted as JSON, with and without CSRF protection
+    THEN check if:
+            1. answers without CSRF token are refused, if CSRF protection is enabled
+            2. invalid answers are refused with the error of each question
+            3. valid answers get the keyword until the HIT is full
+    """
+    hit_project = Project.query.filter_by(p_name="hit-capacity").first()
+    items = Item.query.order_by(Item.id).all()
+    batch = Batch(size=1, keyword="answers", hit_id="HITANSWERS", project=hit_project)
+    Tuple(batch=batch).items = items
+    db.session.add(batch)
+    db.session.commit()
+
+    # 1.
+    test_client.application.config["WTF_CSRF_ENABLED"] = True
+    try:
+        response = test_client.post("/mturk/hit-capacity/HITANSWERS/answers", json=dict(answers=[[1, 2]]))
+    finally:
+        test_client.application.config["WTF_CSRF_ENABLED"] = False
+    assert response.status_code == 400 and "CSRF" in response.json["error"]
+
+    # 2.
+    response = test_client.post("/mturk/hit-capacity/HITANSWERS/answers", json=dict(answers=[[1, None]]))
+    assert response.status_code == 400 and response.json["errors"] == {"1": ANSWER_ERRORS["required"]}
+    response = test_client.post("/mturk/hit-capacity/HITANSWERS/answers", data="answers")
+    assert response.status_code == 400
+
+    # 3.
+    responses = [
+        test_client.post("/mturk/hit-capacity/HITANSWERS/answers", json=dict(answers=[[1, 2]])) for _ in range(3)
+    ]
+    assert [response.status_code for response in responses] == [200, 200, 409]
+    assert responses[0].json == {"keyword": "answers"}
+    db.session.refresh(batch)
+    assert batch.submissions == 2
+    assert Data.query.filter_by(tuple_id=batch.tuples[0].id, best_id=1, worst_id=2).count() == 2
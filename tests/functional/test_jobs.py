@@ -0,0 +1,359 @@
+from config import basedir
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event
+from project import db, job_queue
+from project.assignments import sync_assignments
+from project.jobs import claim, run_job, utcnow
+from datetime import timedelta
+from project.models import Assignment, Job, Project
+import os
+
+#################################################################
+# Functional Tests to build uploaded projects in the background #
+#################################################################
+
+
+MTURK_OPTIONS = dict(
+    mturk=True,
+    aws_access_key_id="my_key_id",
+    aws_secret_access_key="my_secret_key",
+    keywords="characters",
+    reward="0.10",
+    lifetime=1,
+    lifetimeunit="d",
+    hit_duration=1,
+    duration_unit="h",
+)
+
+
+def upload(test_client, name, items=None, **options):
+    if items:
+        file = (BytesIO("\n".join(items).encode()), "items.txt")
+    else:
+        file = open(os.path.join(basedir, "examples/first_10_characters_examples.txt"), "rb")
+
+    return test_client.post(
+        "/user/upload-project",
+        data=dict(
+            upload=[file],
+            name=name,
+            description="this is a test about the first 10 characters",
+            anno_number=3,
+            best_def="the best character",
+            worst_def="the worst character",
+            **options,
+        ),
+        follow_redirects=True,
+    )
+
+
+def submit_hit(test_client, project, batch):
+    data = {}
+    for i, tuple_ in enumerate(batch.tuples, start=1):
+        data[f"{i}-best_item"] = tuple_.items[0].id
+        data[f"{i}-worst_item"] = tuple_.items[1].id
+    return test_client.post(f"/mturk/{project.p_name}/{batch.hit_id}", data=data)
+
+
+def test_build_project(test_client, init_database):
+    """
+    GIVEN a Flask application running jobs at once (JOB_EAGER)
+    WHEN a logged-in user uploads a valid project for the local system
+    THEN check if:
+            1. the job of the project is done and its progress is saved
+            2. the project is ready with its batches
+            3. the profile shows the project as ready
+    """
+    test_client.post("/user/login", data=dict(username="jung", password="12345678"), follow_redirects=True)
+    response = upload(test_client, "built project")
+    project = Project.query.filter_by(name="built project").first()
+    job = project.jobs[0]
+
+    # 1.
+    assert job.kind == "build_project"
+    assert job.status == "done"
+    assert job.items_parsed == 10
+    assert job.tuples_generated == sum(batch.size for batch in project.batches)
+    assert job.batches_stored == len(project.batches)
+    assert job.hits_created == 0
+    # 2.
+    assert project.status == "ready"
+    assert project.batches
+    # 3.
+    assert b"ready" in response.data
+
+
+def test_build_project_mturk(test_client, init_database, mturk_factory, fake_mturk):
+    """
+    GIVEN a Flask application running jobs at once (JOB_EAGER) and a stand-in of MTurk
+    WHEN a logged-in user uploads a valid project for Mechanical Turk
+    THEN check if:
+            1. a HIT is created for each batch with the credentials given by the user
+            2. the credentials are not saved in the job
+            3. each batch has a keyword, an endpoint and the id of its HIT
+    """
+    upload(test_client, "mturk project", **MTURK_OPTIONS)
+    project = Project.query.filter_by(name="mturk project").first()
+    job = project.jobs[0]
+
+    # 1.
+    assert mturk_factory.call_args.kwargs["aws_access_key_id"] == "my_key_id"
+    assert len(fake_mturk.hits) == len(project.batches) == job.hits_created
+    question = next(iter(fake_mturk.hits.values()))["Question"]
+    assert f"http://localhost/mturk/{project.p_name}/" in question
+    # 2.
+    assert "my_secret_key" not in str(job.payload)
+    # 3.
+    assert project.status == "ready"
+    assert all(batch.keyword and batch.hit_id for batch in project.batches)
+    assert {batch.mturk_hit_id for batch in project.batches} == set(fake_mturk.hits)
+
+
+def test_resume_build_project_mturk(test_client, init_database, mturk_factory, fake_mturk):
+    """
+    GIVEN a Flask application running jobs at once (JOB_EAGER) and a stand-in of MTurk
+    WHEN creating the HITs of an uploaded project fails for one batch and the failed job is retried
+    THEN check if:
+            1. the job and the project failed, but the batches and the created HITs are saved
+            2. the job is only retried with 'flask run-jobs --failed', it only creates the missing HIT,
+            the project is ready
+    """
+    fake_mturk.errors = ["RequestError"]
+    upload(test_client, "resumed project", items=[f"item {i}" for i in range(60)], **MTURK_OPTIONS)
+    project = Project.query.filter_by(name="resumed project").first()
+    job = project.jobs[0]
+
+    # 1.
+    assert len(project.batches) > 1
+    assert job.status == "failed"
+    assert project.status == "failed"
+    assert job.batches_stored == len(project.batches)
+    assert len(fake_mturk.hits) == job.hits_created == len(project.batches) - 1
+
+    # 2.
+    assert run_job(job.id) is None
+    result = test_client.application.test_cli_runner().invoke(args=["run-jobs", "--failed"])
+    assert f"Job {job.id} (build_project): done" in result.output
+    assert job.status == "done"
+    assert job.error is None
+    assert project.status == "ready"
+    assert len(fake_mturk.hits) == job.hits_created == len(project.batches)
+    assert all(batch.mturk_hit_id for batch in project.batches)
+
+
+def test_resume_unrecorded_hit(test_client, init_database, mturk_factory, fake_mturk):
+    """
+    GIVEN a Flask application running jobs at once (JOB_EAGER) and a stand-in of MTurk
+    WHEN the job of a project on MTurk was interrupted after a HIT was created but before it was recorded,
+    and the job is run again, also after the token of the HIT expired
+    THEN check if the existing HIT is recorded for its batch instead of a new one, the project is ready
+    """
+    upload(test_client, "unrecorded hit", items=[f"item {i}" for i in range(60)], **MTURK_OPTIONS)
+    project = Project.query.filter_by(name="unrecorded hit").first()
+    job = project.jobs[0]
+    batch = project.batches[-1]
+    mturk_hit_id = batch.mturk_hit_id
+    n_hits = len(fake_mturk.hits)
+
+    for expired in [False, True]:
+        fake_mturk.expired = expired
+        batch.mturk_hit_id = None
+        job.status, job.heartbeat = "running", None
+        project.status = "building"
+        db.session.commit()
+        run_job(job.id)
+
+        assert job.status == "done"
+        assert project.status == "ready"
+        assert batch.mturk_hit_id == mturk_hit_id
+        assert len(fake_mturk.hits) == n_hits
+
+
+def test_failed_job(test_client, init_database):
+    """
+    GIVEN a Flask application
+    WHEN a job of a project fails
+    THEN check if:
+            1. the job is marked as failed with the error
+            2. the project is marked as failed only if it was being built
+    """
+
+    @job_queue.task("fail")
+    def fail(job):
+        raise RuntimeError("no more space")
+
+    project = Project.query.filter_by(name="built project").first()
+    job_queue.enqueue(Job(kind="fail", payload={}, project=project))
+    job = Job.query.filter_by(kind="fail").first()
+
+    # 1.
+    assert job.status == "failed"
+    assert job.error == "RuntimeError: no more space"
+    # 2.
+    assert project.status == "ready"
+    project.status = "building"
+    job_queue.enqueue(Job(kind="fail", payload={}, project=project))
+    assert project.status == "failed"
+
+
+def test_claim_job(test_client, init_database):
+    """
+    GIVEN a Flask application with a queued job
+    WHEN the job is claimed several times, e.g. by several workers, and command 'flask run-jobs' is run
+    THEN check if:
+            1. only the first claim succeeds and marks the job as running with a heartbeat
+            2. the running job is neither claimed nor run again while its lease lasts
+            3. the job is claimed and run again once its lease expired
+    """
+    runs = []
+
+    @job_queue.task("count")
+    def count(job):
+        runs.append(job.id)
+
+    job = Job(kind="count", payload={})
+    db.session.add(job)
+    db.session.commit()
+    runner = test_client.application.test_cli_runner()
+
+    # 1.
+    assert claim(job.id)
+    assert not claim(job.id)
+    assert job.status == "running"
+    assert job.attempts == 1
+    assert job.heartbeat is not None
+    # 2.
+    assert run_job(job.id) is None
+    assert f"Job {job.id} " not in runner.invoke(args=["run-jobs"]).output
+    assert runs == []
+    # 3.
+    job.heartbeat = utcnow() - timedelta(seconds=test_client.application.config["JOB_LEASE"] + 1)
+    db.session.commit()
+    assert f"Job {job.id} (count): done" in runner.invoke(args=["run-jobs"]).output
+    assert runs == [job.id]
+    assert job.attempts == 2
+
+
+def test_background_job(test_client, init_database):
+    """
+    GIVEN a Flask application running jobs in a pool of workers
+    WHEN a job of an uploaded project is still running
+    THEN check if:
+            1. enqueuing returns at once and the profile shows the project as building
+            2. the job is done and the project is ready as soon as the task is finished
+    """
+    started, release = Event(), Event()
+
+    @job_queue.task("wait")
+    def wait(job):
+        started.set()
+        release.wait(5)
+        job.project.status = "ready"
+
+    project = Project(
+        name="background",
+        description="this is a test in the background",
+        anno_number=1,
+        best_def="best",
+        worst_def="worst",
+        n_items=0,
+        p_name="background",
+        user=Project.query.first().user,
+        status="building",
+    )
+
+    extensions = test_client.application.extensions
+    with ThreadPoolExecutor(1) as extensions["job_queue"]:
+        job = Job(kind="wait", payload={}, project=project)
+        future = job_queue.enqueue(job)
+        assert started.wait(5)
+
+        # 1.
+        assert b"building" in test_client.get("/user/jung").data
+
+        # 2.
+        release.set()
+        future.result(5)
+    extensions["job_queue"] = None
+
+    db.session.expire_all()
+    assert db.session.get(Job, job.id).status == "done"
+    assert db.session.get(Project, project.id).status == "ready"
+
+
+def test_sync_assignments(test_client, init_database, mturk_factory, fake_mturk):
+    """
+    GIVEN a Flask application, a stand-in of MTurk and a project on MTurk whose first HIT is submitted once
+    WHEN turkers submit assignments with right and wrong keywords and command 'flask sync-assignments' is run
+    THEN check if:
+            1. the assignment with the right keyword is approved
+            2. a further assignment with the right keyword but without annotations and
+            an assignment with a wrong keyword are rejected
+            3. the assignments are saved with their status
+    """
+    upload(test_client, "synced project", items=[f"item {i}" for i in range(60)], **MTURK_OPTIONS)
+    project = Project.query.filter_by(name="synced project").first()
+    first, second = project.batches[:2]
+    submit_hit(test_client, project, first)
+
+    approved = fake_mturk.submit(first.mturk_hit_id, first.keyword)
+    unsubmitted = fake_mturk.submit(first.mturk_hit_id, first.keyword)
+    wrong = fake_mturk.submit(second.mturk_hit_id, "wrong keyword")
+
+    result = test_client.application.test_cli_runner().invoke(args=["sync-assignments", project.p_name])
+
+    # 1.
+    assert result.exit_code == 0
+    assert f"{project.p_name}: 3 new, 1 approved, 2 rejected" in result.output
+    assert fake_mturk.assignments[approved]["AssignmentStatus"] == "Approved"
+    # 2.
+    assert fake_mturk.assignments[unsubmitted]["AssignmentStatus"] == "Rejected"
+    assert fake_mturk.assignments[wrong]["AssignmentStatus"] == "Rejected"
+    # 3.
+    assert {(a.id, a.batch_id, a.status) for a in Assignment.query} == {
+        (approved, first.id, "Approved"),
+        (unsubmitted, first.id, "Rejected"),
+        (wrong, second.id, "Rejected"),
+    }
+    assert project.jobs[-1].kind == "sync_assignments"
+    assert project.jobs[-1].payload == {"listed": 3, "approved": 1, "rejected": 2}
+
+
+def test_sync_new_assignments(test_client, init_database, mturk_factory, fake_mturk):
+    """
+    GIVEN a Flask application, a stand-in of MTurk and a project on MTurk with synchronized assignments
+    WHEN the assignments are synchronized again in pages of 1 assignment
+    THEN check if:
+            1. only the new assignments are approved or rejected
+            2. the cursor of each HIT is saved
+            3. a further run lists each HIT from its cursor, no assignment is listed twice
+    """
+    project = Project.query.filter_by(name="synced project").first()
+    first, second = project.batches[:2]
+    # the assignments synchronized before
+    for assignment in Assignment.query:
+        fake_mturk.assignments[assignment.id] = dict(
+            AssignmentId=assignment.id,
+            HITId=assignment.batch.mturk_hit_id,
+            AssignmentStatus=assignment.status,
+            Answer=fake_mturk.ANSWER % assignment.keyword,
+        )
+    submit_hit(test_client, project, second)
+    approved = fake_mturk.submit(second.mturk_hit_id, second.keyword)
+
+    counts = sync_assignments(project, fake_mturk, page_size=1)
+
+    # 1.
+    assert counts == {"listed": 1, "approved": 1, "rejected": 0}
+    assert fake_mturk.assignments[approved]["AssignmentStatus"] == "Approved"
+    # 2.
+    assert first.mturk_next_token == "2"
+    assert second.mturk_next_token == "2"
+    assert all(batch.mturk_next_token is None for batch in project.batches[2:])
+    # 3.
+    fake_mturk.listed.clear()
+    assert sync_assignments(project, fake_mturk, page_size=1) == {"listed": 0, "approved": 0, "rejected": 0}
+    assert sorted(fake_mturk.listed) == sorted(
+        (batch.mturk_hit_id, batch.mturk_next_token) for batch in project.batches
+    )
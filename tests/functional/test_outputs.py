@@ -0,0 +1,219 @@
+#########################################################
+# Functional Tests to download the outputs of a project #
+#########################################################
+
+import pytest
+from project import db, result_cache
+from project.cache import ResultCache
+from project.models import ItemScore, Project
+from project.scores import UPSERTS, bump_data_version, insert_ignore
+from project.user.helpers import generate_report
+
+
+def test_download_scores(test_client, init_database):
+    """
+    GIVEN a Flask application
+    WHEN an annotator has submitted batch 1 of project 'test' and the logged-in user
+    requests the scores, e.g. '/user/jung/test/scores.txt' page is requested (GET)
+    THEN check if the scores are calculated from the submitted annotation:
+            1. the response is valid and is a text file
+            2. every item of the tuple is scored, from best to worst
+    """
+    test_client.post("/annotator", data=dict(keyword="ax7832ljf", name="jung"), follow_redirects=True)
+    test_client.post(
+        "/annotator/test/batch-1",
+        data={"action": "submit", "question-1-best_item": "1", "question-1-worst_item": "3"},
+        follow_redirects=True,
+    )
+    test_client.post("/user/login", data=dict(username="jung", password="12345678"), follow_redirects=True)
+
+    response = test_client.get("/user/jung/test/scores.txt")
+
+    # 1.
+    assert response.status_code == 200
+    assert response.mimetype == "text/plain"
+    # 2.
+    assert response.data == b"A\t1.0\nB\t0.0\nD\t0.0\nC\t-1.0"
+
+
+def test_item_scores(test_client, init_database):
+    """
+    GIVEN a Flask application
+    WHEN an annotator has submitted batch 1 of project 'test'
+    THEN check if the counts of each item are updated in table 'item_scores':
+            1. every item of the tuple appears once
+            2. item 'A' is counted as best, item 'C' as worst
+    """
+    scores = {score.item.item: score for score in ItemScore.query.order_by(ItemScore.item_id)}
+
+    # 1.
+    assert {item: score.appearances for item, score in scores.items()} == {"A": 1, "B": 1, "C": 1, "D": 1}
+    # 2.
+    assert {item: (score.best, score.worst) for item, score in scores.items()} == {
+        "A": (1, 0),
+        "B": (0, 0),
+        "C": (0, 1),
+        "D": (0, 0),
+    }
+
+
+@pytest.mark.parametrize("upsert", [True, False])
+def test_insert_ignore(test_client, init_database, mocker, upsert):
+    """
+    GIVEN a Flask application, counts of the items of project 'test' and a database with or without upsert
+    WHEN the rows of the counts are inserted again, as by a concurrent first submission, and a missing one
+    THEN check if:
+            1. the existing rows are kept as they are, without any error
+            2. the missing row is inserted
+    """
+    if not upsert:
+        mocker.patch.dict(UPSERTS, clear=True)
+    counts = [(s.item_id, s.appearances, s.best, s.worst) for s in ItemScore.query.order_by(ItemScore.item_id)]
+    db.session.delete(db.session.get(ItemScore, (1, 4)))
+    db.session.commit()
+
+    insert_ignore(
+        ItemScore.__table__,
+        [{"project_id": 1, "item_id": 1}, {"project_id": 1, "item_id": 3}, {"project_id": 1, "item_id": 4}],
+        appearances=0,
+        best=0,
+        worst=0,
+    )
+    db.session.commit()
+
+    db.session.expire_all()
+    scores = [(s.item_id, s.appearances, s.best, s.worst) for s in ItemScore.query.order_by(ItemScore.item_id)]
+    # 1.
+    assert scores[:3] == counts[:3]
+    # 2.
+    assert scores[3] == (4, 0, 0, 0)
+
+    # restore the counts for the following tests
+    db.session.get(ItemScore, (1, 4)).appearances = counts[3][1]
+    db.session.commit()
+
+
+def test_rebuild_scores(test_client, init_database):
+    """
+    GIVEN a Flask application
+    WHEN the counts in table 'item_scores' drift from the annotations
+    and command 'flask rebuild-scores test' is run
+    THEN check if:
+            1. the command recounts the 4 items of project 'test'
+            2. the counts are the same as before the drift
+            3. an unknown project name is an error
+    """
+    runner = test_client.application.test_cli_runner()
+    db.session.get(ItemScore, (1, 1)).best = 10
+    db.session.get(ItemScore, (1, 2)).appearances = 0
+    db.session.commit()
+
+    result = runner.invoke(args=["rebuild-scores", "test"])
+
+    # 1.
+    assert result.exit_code == 0
+    assert "test: 4 items" in result.output
+    # 2.
+    db.session.expire_all()
+    assert [(s.appearances, s.best, s.worst) for s in ItemScore.query.order_by(ItemScore.item_id)] == [
+        (1, 1, 0),
+        (1, 0, 0),
+        (1, 0, 1),
+        (1, 0, 0),
+    ]
+    assert test_client.get("/user/jung/test/scores.txt").data == b"A\t1.0\nB\t0.0\nD\t0.0\nC\t-1.0"
+    # 3.
+    assert runner.invoke(args=["rebuild-scores", "unknown"]).exit_code != 0
+
+
+def test_count_missing_scores(test_client, init_database):
+    """
+    GIVEN a Flask application
+    WHEN project 'test' has annotations but no counts in table 'item_scores',
+    e.g. as they were submitted before the counts were kept, and the scores are requested
+    THEN check if the scores are counted from the annotations and their counts are stored
+    """
+    ItemScore.query.filter_by(project_id=1).delete()
+    # no cached scores
+    bump_data_version(db.session.get(Project, 1))
+    db.session.commit()
+
+    assert test_client.get("/user/jung/test/scores.txt").data == b"A\t1.0\nB\t0.0\nD\t0.0\nC\t-1.0"
+    assert [(s.appearances, s.best, s.worst) for s in ItemScore.query.order_by(ItemScore.item_id)] == [
+        (1, 1, 0),
+        (1, 0, 0),
+        (1, 0, 1),
+        (1, 0, 0),
+    ]
+
+
+def test_download_report(test_client, init_database):
+    """
+    GIVEN a Flask application
+    WHEN the logged-in user requests the report of project 'test',
+    e.g. '/user/jung/test/report.txt' page is requested (GET)
+    THEN check if the report lists the submitted annotation:
+            1. the response is valid and is a text file
+            2. the report contains the annotation of annotator 'jung' for tuple 1 of batch 1
+            3. the report is generated in chunks, the header and one chunk for each batch
+            4. the same version of the report returns '304 Not Modified'
+    """
+    response = test_client.get("/user/jung/test/report.txt")
+
+    # 1.
+    assert response.status_code == 200
+    assert response.mimetype == "text/plain"
+    # 2.
+    assert response.data == (
+        b'*********************************************      \tProject: "TEST"\t       '
+        b"*********************************************\n\n"
+        b"Batch 1\n"
+        b"\tTuple 1:\tA, B, C, D\n"
+        b"\t\tAnnotator 2 - 'jung': \n"
+        b"\t\t\tbest - A\n"
+        b"\t\t\tworst - C\n\n" + b"#" * 100
+    )
+    # 3.
+    project = Project.query.filter_by(p_name="test").first()
+    chunks = list(generate_report(project))
+    assert len(chunks) == 2
+    assert "".join(chunks).encode() == response.data
+    # 4.
+    response = test_client.get("/user/jung/test/report.txt", headers={"If-None-Match": response.headers["ETag"]})
+    assert response.status_code == 304
+
+
+def test_cached_download(test_client, init_database):
+    """
+    GIVEN a Flask application with downloaded scores of project 'test'
+    WHEN the scores are requested again, before and after another annotator submits batch 1
+    THEN check if:
+            1. the scores are cached and tagged with an ETag that clients revalidate
+            2. the same version returns '304 Not Modified' without body
+            3. a new submission invalidates the cached scores and changes the ETag
+    """
+    response = test_client.get("/user/jung/test/scores.txt")
+    etag = response.get_etag()[0]
+
+    # 1.
+    assert response.status_code == 200
+    assert "no-cache" in response.headers["Cache-Control"]
+    project = Project.query.filter_by(p_name="test").first()
+    assert result_cache.backend.get(ResultCache.key("scores", project)) == response.get_data(as_text=True)
+    # 2.
+    response = test_client.get("/user/jung/test/scores.txt", headers={"If-None-Match": f'"{etag}"'})
+    assert response.status_code == 304
+    assert response.data == b""
+    # 3.
+    test_client.post("/annotator", data=dict(keyword="kjd8f9s879", name="sanaz"), follow_redirects=True)
+    test_client.post(
+        "/annotator/test/batch-1",
+        data={"action": "submit", "question-1-best_item": "1", "question-1-worst_item": "4"},
+        follow_redirects=True,
+    )
+    test_client.post("/user/login", data=dict(username="jung", password="12345678"), follow_redirects=True)
+
+    response = test_client.get("/user/jung/test/scores.txt", headers={"If-None-Match": f'"{etag}"'})
+    assert response.status_code == 200
+    assert response.get_etag()[0] != etag
+    assert response.data == b"A\t1.0\nB\t0.0\nC\t-0.5\nD\t-0.5"
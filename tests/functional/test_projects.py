@@ -1,4 +1,5 @@
 from config import basedir
+from project.models import Item, Project
 import os
 
 ####################################################
@@ -260,3 +261,41 @@ def test_upload_valid_project(test_client, init_database):
     assert response.status_code == 200
     # 2.
     assert b"JUNG" in response.data
+
+
+def test_stored_project(test_client, init_database):
+    """
+    GIVEN a Flask application
+    WHEN a valid project is uploaded (see test_upload_valid_project()) and the same items are uploaded again
+    THEN check if the project is stored in the database:
+            1. the project with its annotators of the local system
+            2. every uploaded item appears in the tuples of the batches, each tuple has 4 items
+            3. items uploaded again are not stored twice
+    """
+    project = Project.query.filter_by(name="first 10 characters").first()
+    tuples = [tuple_ for batch in project.batches for tuple_ in batch.tuples]
+    items = {item.item for tuple_ in tuples for item in tuple_.items}
+
+    # 1.
+    assert project.n_items == 10
+    assert len(project.annotators) == 5
+    assert all(annotator.keyword for annotator in project.annotators)
+    # 2.
+    assert sum(batch.size for batch in project.batches) == len(tuples)
+    assert all(len(tuple_.items) == 4 for tuple_ in tuples)
+    assert len(items) == 10
+    # 3.
+    test_client.post(
+        "/user/upload-project",
+        data=dict(
+            upload=[open(os.path.join(basedir, "examples/first_10_characters_examples.txt"), "rb")],
+            name="first 10 characters again",
+            description="this is a test about the first 10 characters",
+            anno_number=2,
+            best_def="the best character",
+            worst_def="the worst character",
+        ),
+        follow_redirects=True,
+    )
+    assert Project.query.filter_by(name="first 10 characters again").first()
+    assert Item.query.filter(Item.item.in_(items)).count() == 10
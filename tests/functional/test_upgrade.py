@@ -0,0 +1,141 @@
+import pytest
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import IntegrityError
+from project import create_app, db
+from project.models import Annotator, Batch, Data, Item, Project, Tuple, User
+from project.scores import load_counts
+from project.upgrade import upgrade_database
+from config import config
+
+###############################################################
+# Functional Tests to upgrade the database of an old version #
+###############################################################
+
+# the tables and columns that an old version of the database does not have
+NEW_TABLES = ["assignments", "item_scores", "jobs"]
+NEW_COLUMNS = {
+    "projects": ["data_version", "status"],
+    "batches": ["mturk_hit_id", "mturk_next_token", "submissions"],
+}
+
+
+@pytest.fixture
+def old_app(tmp_path):
+    """
+    Application with a database of an old version: a local project whose batch is submitted by
+    an annotator, who answered its tuple twice, as there was no unique constraint yet, and
+    a project on MTurk whose batch of 2 tuples is submitted 3 times.
+    """
+    settings = type("OldConfig", (config["testing"],), {"SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path}/old.db"})
+    app = create_app(settings)
+
+    with app.app_context():
+        db.create_all()
+        user = User(username="jung", email="abc@abc.de", password="12345678")
+        project = Project(
+            name="old",
+            description="this is an old project",
+            anno_number=2,
+            best_def="best",
+            worst_def="worst",
+            n_items=4,
+            p_name="old",
+            mturk=False,
+            user=user,
+        )
+        batch = Batch(size=1, project=project)
+        tuple_ = Tuple(batch=batch)
+        tuple_.items = [Item(item=item) for item in "ABCD"]
+        annotator = Annotator(keyword="old-keyword", name="jung", project=project)
+        annotator.batches.append(batch)
+
+        mturk_project = Project(
+            name="old mturk",
+            description="this is an old project on MTurk",
+            anno_number=5,
+            best_def="best",
+            worst_def="worst",
+            n_items=4,
+            p_name="old-mturk",
+            mturk=True,
+            user=user,
+        )
+        mturk_batch = Batch(size=2, project=mturk_project, keyword="old-hit", hit_id="old-hit")
+        mturk_tuples = [Tuple(batch=mturk_batch), Tuple(batch=mturk_batch)]
+        for mturk_tuple in mturk_tuples:
+            mturk_tuple.items = tuple_.items
+        mturk_datas = [Data(best_id=1, worst_id=2, tuple_=mturk_tuple) for mturk_tuple in mturk_tuples * 3]
+
+        db.session.add_all([user, project, batch, tuple_, annotator, mturk_project, mturk_batch])
+        db.session.add_all(mturk_tuples + mturk_datas)
+        db.session.commit()
+
+        for table in NEW_TABLES:
+            db.session.execute(text(f"DROP TABLE {table}"))
+        for table, columns in NEW_COLUMNS.items():
+            for column in columns:
+                db.session.execute(text(f"ALTER TABLE {table} DROP COLUMN {column}"))
+        db.session.execute(
+            text(
+                "CREATE TABLE old_datas (id INTEGER PRIMARY KEY, best_id INTEGER, worst_id INTEGER, "
+                "anno_id INTEGER, tuple_id INTEGER NOT NULL)"
+            )
+        )
+        db.session.execute(text("INSERT INTO old_datas SELECT id, best_id, worst_id, anno_id, tuple_id FROM datas"))
+        db.session.execute(text("DROP TABLE datas"))
+        db.session.execute(text("ALTER TABLE old_datas RENAME TO datas"))
+        db.session.execute(
+            text("INSERT INTO datas VALUES (101, 2, 1, :anno_id, :tuple_id), (102, 1, 3, :anno_id, :tuple_id)"),
+            {"anno_id": annotator.id, "tuple_id": tuple_.id},
+        )
+        db.session.commit()
+
+    yield app
+
+    with app.app_context():
+        db.drop_all()
+
+
+def test_upgrade_database(old_app):
+    """
+    GIVEN a Flask application with a database of an old version
+    WHEN the database is upgraded
+    THEN check if:
+            1. the new tables and columns are added, existing rows get the defaults
+            2. the submissions of the batches are counted from the annotations
+            3. only the latest answer of the annotator to the tuple is kept, and
+            the unique constraint of the answers is added
+            4. the counts of the scores of both projects are filled from the kept annotations
+            5. nothing is left to upgrade in a further run
+    """
+    with old_app.app_context():
+        steps = upgrade_database()
+        inspector = inspect(db.engine)
+
+        # 1.
+        for table, columns in NEW_COLUMNS.items():
+            assert {f"added column {table}.{column}" for column in columns} <= set(steps)
+            assert set(columns) <= {column["name"] for column in inspector.get_columns(table)}
+        assert set(NEW_TABLES) <= set(inspector.get_table_names())
+        project = Project.query.filter_by(p_name="old").first()
+        assert (project.status, project.data_version) == ("ready", 0)
+        # 2.
+        assert "counted the submissions of the batches" in steps
+        assert {batch.project.p_name: batch.submissions for batch in Batch.query} == {"old": 1, "old-mturk": 3}
+        # 3.
+        answers = Data.query.filter(Data.anno_id.is_not(None))
+        assert [(data.best_id, data.worst_id) for data in answers] == [(1, 3)]
+        assert Data.query.count() == 7
+        data = answers.first()
+        db.session.add(Data(best_id=1, worst_id=2, annotator=data.annotator, tuple_=data.tuple_))
+        with pytest.raises(IntegrityError):
+            db.session.commit()
+        db.session.rollback()
+        # 4.
+        assert {"counted the scores of project old", "counted the scores of project old-mturk"} <= set(steps)
+        assert load_counts(project) == [(1, "A", 1, 1, 0), (2, "B", 1, 0, 0), (3, "C", 1, 0, 1), (4, "D", 1, 0, 0)]
+
+    # 5.
+    result = old_app.test_cli_runner().invoke(args=["upgrade-db"])
+    assert result.exit_code == 0
+    assert result.output == "nothing to upgrade\n"
@@ -0,0 +1,62 @@
+import json
+from benchmarks.bench_generator import run, compare, main
+
+###############################################
+# Unit Tests for benchmarks/bench_generator.py #
+###############################################
+
+
+def test_benchmark_run():
+    """
+    GIVEN the benchmark suite of the generators
+    WHEN it runs on a small synthetic item set
+    THEN check:
+            1. if every step is measured with wall time and peak memory
+            2. if the quality of the design is reported
+            3. if a run has no regression against itself but against a faster baseline
+    """
+    report = run(sizes=[20], num_iter=2)
+    steps = report["results"]["20"]
+
+    ### 1.
+    assert {"generate_items", "generate_tuples", "generate_batches", "scoring"} <= set(steps)
+    assert all(step["time"] >= 0 and step["peak_memory"] > 0 for step in steps.values())
+
+    ### 2.
+    assert steps["generate_tuples"]["pair_stdev"] >= 0
+    assert steps["generate_tuples"]["item_frequency_spread"] >= 0
+
+    ### 3.
+    assert compare(report, report) == []
+
+    faster = {"results": {"20": {"scoring": {"time": steps["scoring"]["time"] / 10, "peak_memory": None}}}}
+    assert [regression[:3] for regression in compare(report, faster)] == [("20", "scoring", "time")]
+
+
+def test_benchmark_baseline(tmp_path, mocker, capsys):
+    """
+    GIVEN the command line of the benchmark suite, with the measures of each run injected
+    WHEN the results are saved as baseline and later runs are compared against it
+    THEN check:
+            1. if the baseline is written as it is measured, without tracing memory
+            2. if the same measures have no regression
+            3. if slower measures are reported as regressions with exit code 1
+    """
+    baseline = tmp_path / "baseline.json"
+    report = {"results": {"10": {"scoring": {"time": 0.5, "peak_memory": None}}}}
+    slower = {"results": {"10": {"scoring": {"time": 1.0, "peak_memory": None}}}}
+    bench = mocker.patch("benchmarks.bench_generator.run", side_effect=[report, report, slower])
+    args = ["--sizes", "10", "--num-iter", "1", "--engine", "python", "--no-memory"]
+
+    ### 1.
+    assert main(args + ["--save", str(baseline)]) == 0
+    assert json.loads(baseline.read_text()) == report
+    bench.assert_called_with([10], "python", 1, 0, memory=False)
+
+    ### 2.
+    assert main(args + ["--compare", str(baseline)]) == 0
+
+    ### 3.
+    capsys.readouterr()
+    assert main(args + ["--compare", str(baseline)]) == 1
+    assert "REGRESSION 10 items, scoring, time: 0.5 -> 1" in capsys.readouterr().out
@@ -0,0 +1,155 @@
+"""
+Unit Tests for cache.py
+"""
+
+import pytest
+from project.cache import BACKENDS, FileSystemBackend, MemoryBackend, RedisBackend, create_backend
+
+
+class FakeRedis(object):
+    """
+    Stand-in for a client of a Redis server, keeps values as bytes like the server.
+    """
+
+    def __init__(self):
+        self.values = {}
+        self.expires = {}
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def set(self, key, value, ex=None):
+        self.values[key] = value
+        self.expires[key] = ex
+
+
+def test_memory_backend():
+    """
+    GIVEN a MemoryBackend with at most 2 outputs
+    WHEN 3 outputs are cached
+    THEN check
+            1. if a cached output is returned as it is, a missing one as None
+            2. if the least recently used output is removed
+    """
+    backend = MemoryBackend(max_entries=2)
+    backend.set("scores:1:0", "A\t1.0")
+    backend.set("scores:1:1", "A\t0.5")
+
+    ### 1.
+    assert backend.get("scores:1:0") == "A\t1.0"
+    assert backend.get("report:1:0") is None
+
+    ### 2.
+    backend.set("scores:1:2", "A\t0.0")
+    assert backend.get("scores:1:1") is None
+    assert backend.get("scores:1:0") == "A\t1.0"
+    assert backend.get("scores:1:2") == "A\t0.0"
+
+
+def test_memory_backend_events():
+    """
+    GIVEN a MemoryBackend with at most 1 fragment and a metrics hook
+    WHEN fragments are cached and requested
+    THEN check
+            1. if each hit, miss and eviction is counted in stats
+            2. if each event is passed to the hook with its key
+    """
+    events = []
+    backend = MemoryBackend(max_entries=1, on_event=lambda name, key: events.append((name, key)))
+    backend.get("questions:1:")
+    backend.set("questions:1:", ["<ol>"])
+    backend.get("questions:1:")
+    backend.set("questions:2:", ["<ol>"])
+
+    ### 1.
+    assert backend.stats == {"miss": 1, "hit": 1, "evict": 1}
+
+    ### 2.
+    assert events == [("miss", "questions:1:"), ("hit", "questions:1:"), ("evict", "questions:1:")]
+
+
+def test_filesystem_backend(tmp_path):
+    """
+    GIVEN a FileSystemBackend with at most 2 outputs
+    WHEN 3 outputs are cached
+    THEN check
+            1. if an output is returned exactly as it is cached, a missing one as None
+            2. if only 2 outputs are kept on disk
+            3. if another backend on the same directory (e.g. another process) shares the outputs
+    """
+    backend = FileSystemBackend(str(tmp_path), max_entries=2)
+    backend.set("report:1:0", "Batch 1\r\n\tTuple 1:\tä, ß")
+
+    ### 1.
+    assert backend.get("report:1:0") == "Batch 1\r\n\tTuple 1:\tä, ß"
+    assert backend.get("report:1:1") is None
+
+    ### 2.
+    backend.set("report:1:1", "Batch 1")
+    backend.set("report:1:2", "Batch 2")
+    assert len(list(tmp_path.iterdir())) == 2
+    assert backend.get("report:1:2") == "Batch 2"
+
+    ### 3.
+    assert FileSystemBackend(str(tmp_path)).get("report:1:2") == "Batch 2"
+
+
+def test_redis_backend():
+    """
+    GIVEN a RedisBackend with a stand-in client
+    WHEN an output is cached
+    THEN check
+            1. if the output is stored with prefixed key and expiry on the server
+            2. if the output is returned as string
+    """
+    client = FakeRedis()
+    backend = RedisBackend(client, ttl=60)
+    backend.set("scores:1:0", "A\t1.0")
+
+    ### 1.
+    assert client.values == {"bws:scores:1:0": b"A\t1.0"}
+    assert client.expires == {"bws:scores:1:0": 60}
+
+    ### 2.
+    assert backend.get("scores:1:0") == "A\t1.0"
+    assert backend.get("scores:1:1") is None
+
+
+def test_redis_backend_from_url():
+    """
+    GIVEN redis-py is installed
+    WHEN a RedisBackend is created from the URL of a server
+    THEN check if it uses a client of redis-py connecting to this server, with the given options
+    """
+    redis = pytest.importorskip("redis")
+
+    backend = RedisBackend.from_url("redis://cache.example:6380/2", ttl=60)
+
+    assert isinstance(backend.client, redis.Redis)
+    assert backend.client.connection_pool.connection_kwargs["host"] == "cache.example"
+    assert backend.client.connection_pool.connection_kwargs["db"] == 2
+    assert backend.ttl == 60
+
+
+def test_create_backend(tmp_path):
+    """
+    GIVEN configurations of the result cache
+    WHEN the backend is created
+    THEN check
+            1. if each configured backend is created with its options
+            2. if no backend is created without configuration
+            3. if an unknown backend is not accepted
+    """
+    ### 1.
+    assert "redis" in BACKENDS
+    memory = create_backend({"RESULT_CACHE": "memory", "RESULT_CACHE_SIZE": 3})
+    assert isinstance(memory, MemoryBackend) and memory.max_entries == 3
+    filesystem = create_backend({"RESULT_CACHE": "filesystem", "RESULT_CACHE_DIR": str(tmp_path)})
+    assert isinstance(filesystem, FileSystemBackend) and filesystem.directory == str(tmp_path)
+
+    ### 2.
+    assert create_backend({"RESULT_CACHE": None}) is None
+
+    ### 3.
+    with pytest.raises(ValueError):
+        create_backend({"RESULT_CACHE": "memcached"})
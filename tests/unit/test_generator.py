@@ -1,7 +1,20 @@
-from project.generator import DataGenerator
+import pytest
+from project.generator import (
+    DataGenerator,
+    DesignCache,
+    PairBalance,
+    ScoreGenerator,
+    python_design,
+    numpy_score,
+    numpy_scoring,
+    refine_design,
+)
 from config import basedir
 import os
-from itertools import chain
+from io import BytesIO
+from random import Random
+from statistics import stdev
+from itertools import chain, combinations
 from collections import Counter
 
 ###############################
@@ -73,3 +86,283 @@ def test_generator():
                 n_batches_size.pop(i)
                 assert all([n_ == data.batch_size for n_ in n_batches_size])
                 break
+
+
+def test_generator_numpy_engine():
+    """
+    GIVEN a test-file
+    WHEN the tuples are generated with the 'numpy' engine
+    THEN check:
+            1. if every item is divided in at least one tuple
+            2. if the expected number of unique tuples is generated
+            3. if no two items within a tuple are identical
+            4. if items are relatively equally divided in tuples
+    """
+    pytest.importorskip("numpy")
+
+    data = DataGenerator(engine="numpy")
+
+    with open(os.path.join(basedir, "examples/first_10_characters_examples.txt"), "rb") as test_file:
+        data.generate_items(test_file)
+
+    data.generate_tuples()
+
+    ### 1.
+    assert set(chain(*data.tuples)) == data.items
+
+    ### 2.
+    assert len(data.tuples) == int(0.5 + data.factor * len(data.items))
+    assert len(set(frozenset(tuple_) for tuple_ in data.tuples)) == len(data.tuples)
+
+    ### 3.
+    assert all(len(set(tuple_)) == data.tuple_size for tuple_ in data.tuples)
+
+    ### 4.
+    freq = data.get_frequency(data.tuples).values()
+    avg = sum(freq) // len(freq)
+    assert max(freq) in range(avg, avg + 6)
+    assert min(freq) in range(avg - 5, avg + 1)
+
+
+def test_generator_unknown_engine():
+    """
+    GIVEN the object DataGenerator
+    WHEN it is created with an unknown engine
+    THEN check if a ValueError is raised
+    """
+    with pytest.raises(ValueError):
+        DataGenerator(engine="fortran")
+
+
+def test_generator_parallel_workers():
+    """
+    GIVEN two objects DataGenerator with the same seed
+    WHEN the tuples are generated once in this process and once with 2 worker processes
+    THEN check if both give the same tuples
+    """
+    items = set("item %d" % i for i in range(50))
+
+    serial = DataGenerator(num_iter=6, seed=42)
+    serial.items = items
+    serial.generate_tuples()
+
+    parallel = DataGenerator(num_iter=6, seed=42, workers=2)
+    parallel.items = items
+    parallel.generate_tuples()
+
+    assert serial.tuples == parallel.tuples
+
+
+def test_generator_convergence_policy():
+    """
+    GIVEN an object DataGenerator with a convergence policy
+    WHEN the tuples are generated
+    THEN check:
+            1. if the iterations stop as soon as the target score is reached
+            2. if the iterations stop after the given number of iterations without improvement
+            3. if at least one iteration runs even without any time left
+    """
+    items = set("item %d" % i for i in range(30))
+
+    ### 1.
+    data = DataGenerator(num_iter=50, seed=1, target_score=float("inf"))
+    data.items = items
+    data.generate_tuples()
+    assert data.iterations_run == 1
+    assert data.best_score is not None
+
+    ### 2.
+    data = DataGenerator(num_iter=50, seed=1, patience=3)
+    data.items = items
+    data.generate_tuples()
+    assert 4 <= data.iterations_run <= 50
+
+    ### 3.
+    data = DataGenerator(num_iter=50, seed=1, time_budget=0)
+    data.items = items
+    data.generate_tuples()
+    assert data.iterations_run == 1
+    assert len(data.tuples) == int(0.5 + data.factor * len(items))
+
+
+def test_pair_balance():
+    """
+    GIVEN a random design of item ids
+    WHEN its tuples are added to a PairBalance one by one
+    THEN check:
+            1. if the running standard deviation equals the one over all pair frequencies
+            2. if removing tuples gives the same result as never adding them
+    """
+    n_items = 40
+    design, score = python_design(n_items, 4, 80, Random(3))
+    pairs = Counter(tuple(sorted(pair)) for tuple_ in design for pair in combinations(tuple_, 2))
+
+    ### 1.
+    balance = PairBalance(n_items)
+    for tuple_ in design:
+        balance.add(tuple_)
+    assert balance.stdev == pytest.approx(stdev(pairs.values()))
+    assert score == pytest.approx(balance.stdev)
+
+    ### 2.
+    half = PairBalance(n_items)
+    for tuple_ in design[:40]:
+        half.add(tuple_)
+    for tuple_ in design[40:]:
+        balance.remove(tuple_)
+    assert balance.counts == half.counts
+    assert balance.stdev == pytest.approx(half.stdev)
+
+
+def test_pair_balance_numpy_score():
+    """
+    GIVEN a random design of item ids
+    WHEN it is scored with PairBalance and with the vectorized score of the 'numpy' engine
+    THEN check if both scores are the same
+    """
+    np = pytest.importorskip("numpy")
+
+    design, score = python_design(40, 4, 80, Random(3))
+    assert numpy_score(np.array(design), 40) == pytest.approx(score)
+
+
+def test_refine_design():
+    """
+    GIVEN a random design of item ids
+    WHEN it is refined by swapping items between tuples
+    THEN check:
+            1. if the score is not worse than before
+            2. if every item keeps its frequency
+            3. if there are still no duplicates within a tuple or between tuples
+    """
+    design, score = python_design(40, 4, 80, Random(5))
+    refined, refined_score = refine_design(design, 40, 2000, Random(6))
+
+    ### 1.
+    assert refined_score <= score
+
+    ### 2.
+    assert Counter(chain(*refined)) == Counter(chain(*design))
+
+    ### 3.
+    assert all(len(set(tuple_)) == 4 for tuple_ in refined)
+    assert len(set(frozenset(tuple_) for tuple_ in refined)) == len(refined)
+
+
+def test_design_cache(tmp_path):
+    """
+    GIVEN a DesignCache in a temporary directory
+    WHEN designs are saved and loaded
+    THEN check:
+            1. if a saved design is loaded unchanged and an unknown design is not found
+            2. if the least recently used design is removed once the cache is too large
+            3. if DataGenerator reuses a cached design without running any iteration
+            4. if a design is not reused by a search with other options, e.g. more iterations or refinement
+    """
+    cache = DesignCache(str(tmp_path), max_size=100)
+
+    ### 1.
+    design = [[0, 1, 2, 3], [1, 2, 4, 0]]
+    cache.put(design, n_items=5, tuple_size=4, factor=2)
+    assert cache.get(n_items=5, tuple_size=4, factor=2) == design
+    assert cache.get(n_items=5, tuple_size=4, factor=2, seed=1) is None
+
+    ### 2.
+    old_design = [[0, 1, 2, 3]] * 3
+    cache.put(old_design, n_items=6, tuple_size=4, factor=2)
+    os.utime(cache.path(6, 4, 2), (0, 0))
+    cache.put(old_design, n_items=7, tuple_size=4, factor=2)
+    assert cache.get(n_items=6, tuple_size=4, factor=2) is None
+    assert cache.get(n_items=7, tuple_size=4, factor=2) == old_design
+
+    ### 3.
+    items = set("item %d" % i for i in range(30))
+    first = DataGenerator(num_iter=5, seed=3, cache=DesignCache(str(tmp_path / "designs")))
+    first.items = items
+    first.generate_tuples()
+    assert first.iterations_run == 5
+
+    second = DataGenerator(num_iter=5, seed=3, cache=DesignCache(str(tmp_path / "designs")))
+    second.items = items
+    second.generate_tuples()
+    assert second.iterations_run == 0
+    assert second.tuples == first.tuples
+    assert second.best_score == pytest.approx(first.best_score)
+
+    ### 4.
+    for options in [dict(num_iter=20), dict(num_iter=5, refine_steps=50)]:
+        other = DataGenerator(seed=3, cache=DesignCache(str(tmp_path / "designs")), **options)
+        other.items = items
+        other.generate_tuples()
+        assert other.iterations_run > 0
+
+
+def test_generate_items_in_chunks():
+    """
+    GIVEN a file with non-ASCII items
+    WHEN it is read in chunks smaller than a character
+    THEN check if every item is decoded correctly, without empty lines and surrounding whitespace
+    """
+    content = "Grüße\r\n\n  naïve \nÅngström\n日本語".encode("utf-8")
+
+    data = DataGenerator()
+    data.generate_items(BytesIO(content), chunk_size=1)
+
+    assert data.items == {"Grüße", "naïve", "Ångström", "日本語"}
+
+
+def test_generate_batches():
+    """
+    GIVEN 203 tuples and a batch size of 20
+    WHEN the tuples are split into batches
+    THEN check:
+            1. if the 3 rest tuples are spread over 3 different batches
+            2. if the same seed gives the same batches
+            3. if balanced batches differ by at most one tuple in size
+    """
+    tuples = [["item %d" % i] for i in range(203)]
+
+    ### 1.
+    data = DataGenerator(seed=4)
+    data.tuples = list(tuples)
+    data.generate_batches()
+    sizes = [len(batch) for batch in data.batches.values()]
+    assert len(sizes) == 10
+    assert sorted(sizes) == [20] * 7 + [21] * 3
+    assert sorted(chain(*data.batches.values())) == sorted(tuples)
+
+    ### 2.
+    again = DataGenerator(seed=4)
+    again.tuples = list(tuples)
+    again.generate_batches()
+    assert again.batches == data.batches
+
+    ### 3.
+    data = DataGenerator(balanced_batches=True)
+    data.tuples = list(tuples)
+    data.generate_batches()
+    sizes = [len(batch) for batch in data.batches.values()]
+    assert len(sizes) == 10
+    assert max(sizes) - min(sizes) <= 1
+    assert sum(sizes) == 203
+
+
+def test_numpy_scoring():
+    """
+    GIVEN random annotations of tuples of item ids, with many equal scores
+    WHEN the scores are calculated with the vectorized path and with the Counter path
+    THEN check if both give exactly the same sorted list of (item, score)
+    """
+    pytest.importorskip("numpy")
+
+    rng = Random(8)
+    tuples = [rng.sample(range(100, 130), 4) for _ in range(200)]
+    answers = [rng.sample(tuple_, 2) for tuple_ in tuples]
+    best, worst = [answer[0] for answer in answers], [answer[1] for answer in answers]
+
+    assert numpy_scoring(tuples, best, worst) == ScoreGenerator(tuples, best, worst).scoring()
+    assert ScoreGenerator.score(tuples, best, worst) == ScoreGenerator(tuples, best, worst).scoring()
+
+    # ties only, items keep the order of their first appearance
+    tuples = [[5, 3, 9, 1]]
+    assert numpy_scoring(tuples, [], []) == ScoreGenerator(tuples, [], []).scoring()
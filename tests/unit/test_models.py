@@ -2,6 +2,8 @@
 Unit Tests for models.py
 """
 
+from project.models import Assignment, ItemScore
+
 
 def test_new_user(new_user):
     """
@@ -125,3 +127,41 @@ def test_new_project_mturk(new_project_mturk, new_batch_mturk):
     assert new_batch_mturk.size == 1
     assert new_batch_mturk.keyword == "ax7832ljf"
     assert new_batch_mturk.hit_id == "AID12897679"
+
+
+def test_new_item_score():
+    """
+    GIVEN an existing Project and Item
+    WHEN the first batch with this Item is submitted and a new ItemScore is created
+    THEN check
+            1. if project and item are stored correctly
+            2. if all counts start at 0
+    """
+    item_score = ItemScore(project_id=1, item_id=2)
+
+    ### 1.
+    assert item_score.project_id == 1
+    assert item_score.item_id == 2
+
+    ### 2.
+    assert (item_score.appearances, item_score.best, item_score.worst) == (0, 0, 0)
+
+
+def test_new_assignment(new_batch_mturk):
+    """
+    GIVEN an existing Batch on MTurk
+    WHEN an assignment of its HIT is listed and a new Assignment is created
+    THEN check
+            1. if id, worker, keyword and batch are stored correctly
+            2. if the assignment is submitted but not reviewed yet
+    """
+    assignment = Assignment("ASSIGNMENT0001", batch=new_batch_mturk, worker_id="WORKER", keyword="ax7832ljf")
+
+    ### 1.
+    assert assignment.id == "ASSIGNMENT0001"
+    assert assignment.worker_id == "WORKER"
+    assert assignment.keyword == "ax7832ljf"
+    assert assignment.batch == new_batch_mturk
+
+    ### 2.
+    assert assignment.status == "Submitted"
@@ -0,0 +1,194 @@
+"""
+Unit Tests for mturk.py
+"""
+
+import pytest
+from botocore.exceptions import ClientError
+from project import create_app, mturk_clients
+from project.mturk import (
+    HIT_URL,
+    ClientRegistry,
+    answer_keyword,
+    create_hits,
+    find_hit,
+    find_hits,
+    list_assignments,
+    question,
+    retry,
+)
+from config import config
+
+
+def test_retry(fake_mturk):
+    """
+    GIVEN a stand-in of MTurk that throttles the first calls
+    WHEN a HIT is created with retries
+    THEN check
+            1. if throttled calls are retried after an exponentially growing random delay
+            2. if other errors and calls throttled more often than retries are raised at once
+    """
+    delays = []
+    fake_mturk.errors = ["Throttling", "ThrottlingException", "ServiceUnavailable"]
+
+    ### 1.
+    response = retry(fake_mturk.create_hit, retries=5, backoff=0.5, sleep=delays.append, Title="A")
+    assert response == {"HIT": {"HITId": "HIT0001"}}
+    assert fake_mturk.calls == 4
+    assert len(delays) == 3
+    assert all(0 <= delay <= 0.5 * 2**attempt for attempt, delay in enumerate(delays))
+
+    ### 2.
+    fake_mturk.errors = ["RequestError"]
+    with pytest.raises(ClientError):
+        retry(fake_mturk.create_hit, sleep=delays.append, Title="B")
+    fake_mturk.errors = ["Throttling"] * 3
+    with pytest.raises(ClientError):
+        retry(fake_mturk.create_hit, retries=2, sleep=delays.append, Title="B")
+    assert len(delays) == 5
+
+
+def test_create_hits(fake_mturk):
+    """
+    GIVEN a stand-in of MTurk
+    WHEN 20 HITs are created on a pool of 4 threads
+    THEN check
+            1. if every HIT is created once and passed to on_created, with its token as annotation
+            2. if HITs created before but not recorded are not created twice, their HITId is passed
+               to on_created, whether it is in the error of MTurk or found by the token
+            3. if other errors are raised after the other HITs are created
+    """
+    hits = {i: {"Title": f"batch {i}", "UniqueRequestToken": f"bws-{i}"} for i in range(20)}
+    created = {}
+
+    ### 1.
+    result = create_hits(fake_mturk, hits, workers=4, on_created=created.__setitem__)
+    assert result == created
+    assert sorted(created) == list(range(20))
+    assert len(fake_mturk.hits) == len(set(created.values())) == 20
+    assert fake_mturk.hits[created[3]]["RequesterAnnotation"] == "bws-3"
+
+    ### 2.
+    recorded = dict(created)
+    hits[20] = {"Title": "batch 20", "UniqueRequestToken": "bws-20"}
+    for hide_hit_id in [False, True]:
+        fake_mturk.hide_hit_id = hide_hit_id
+        created = {}
+        result = create_hits(
+            fake_mturk, {0: hits[0], 5: hits[5], 20: hits[20]}, workers=2, on_created=created.__setitem__
+        )
+        assert result == created
+        assert created[0] == recorded[0] and created[5] == recorded[5]
+    assert created[20] == fake_mturk.hits[created[20]]["HITId"]
+    assert len(fake_mturk.hits) == 21
+    assert find_hit(fake_mturk, "bws-7") == recorded[7]
+    assert find_hit(fake_mturk, "bws-unknown") is None
+    assert find_hits(fake_mturk, ["bws-1", "bws-20", "bws-unknown"]) == {"bws-1": recorded[1], "bws-20": created[20]}
+
+    ### 3.
+    created = {}
+    fake_mturk.errors = ["RequestError"]
+    new_hits = {i: {"Title": f"batch {i}", "UniqueRequestToken": f"bws-{i}"} for i in (21, 22)}
+    with pytest.raises(ClientError):
+        create_hits(fake_mturk, new_hits, workers=2, on_created=created.__setitem__)
+    assert len(created) == 1 and len(fake_mturk.hits) == 22
+
+
+def test_list_assignments(fake_mturk):
+    """
+    GIVEN a stand-in of MTurk with 5 assignments of a HIT, listed in pages of 2
+    WHEN the assignments are listed, throttled once
+    THEN check
+            1. if all assignments are listed page by page, the cursor is the token of the last page
+            2. if listing from the cursor returns only the assignments submitted since
+    """
+    ids = [fake_mturk.submit("HIT0001", "keyword") for _ in range(5)]
+    fake_mturk.submit("HIT0002", "keyword")
+    fake_mturk.errors = ["Throttling"]
+
+    ### 1.
+    assignments, cursor = list_assignments(fake_mturk, "HIT0001", page_size=2, sleep=lambda delay: None)
+    assert [assignment["AssignmentId"] for assignment in assignments] == ids
+    assert cursor == "4"
+    assert fake_mturk.calls == 4
+    assert fake_mturk.listed == [("HIT0001", None), ("HIT0001", "2"), ("HIT0001", "4")]
+
+    ### 2.
+    ids.append(fake_mturk.submit("HIT0001", "keyword"))
+    ids.append(fake_mturk.submit("HIT0001", "keyword"))
+    assignments, cursor = list_assignments(fake_mturk, "HIT0001", next_token=cursor, page_size=2)
+    assert [assignment["AssignmentId"] for assignment in assignments] == ids[4:]
+    assert cursor == "6"
+
+
+def test_answer_keyword(fake_mturk):
+    """
+    GIVEN the answers of assignments
+    WHEN the keyword is read from an answer
+    THEN check if the keyword is found, missing or invalid answers have no keyword
+    """
+    assert answer_keyword(fake_mturk.ANSWER % " abc123 ") == "abc123"
+    assert answer_keyword(fake_mturk.ANSWER.replace("keyword", "other") % "abc123") is None
+    assert answer_keyword("<QuestionFormAnswers") is None
+    assert answer_keyword(None) is None
+
+
+def test_question():
+    """
+    GIVEN the question of a HIT rendered once with a placeholder
+    WHEN the url of a batch is filled in
+    THEN check if the url is escaped for the XML of the question
+    """
+    template = f"<a href='{HIT_URL}'> here </a>"
+    assert question(template, "http://localhost/mturk/test/abc12?a=1&b=2") == (
+        "<a href='http://localhost/mturk/test/abc12?a=1&amp;b=2'> here </a>"
+    )
+
+
+def test_client_registry(mocker):
+    """
+    GIVEN a registry of MTurk clients with a TTL of 60 seconds
+    WHEN clients are requested for several credentials over time
+    THEN check
+            1. if a client is built once and reused for the same credentials and endpoint
+            2. if other credentials or endpoints get their own client
+            3. if clients unused for longer than the TTL are built again
+    """
+    now = [0]
+    factory = mocker.Mock(side_effect=lambda **kwargs: object())
+    registry = ClientRegistry("config", ttl=60, factory=factory, clock=lambda: now[0])
+
+    ### 1.
+    client = registry.get("key", "secret", endpoint_url="https://sandbox")
+    now[0] = 50
+    assert registry.get("key", "secret", endpoint_url="https://sandbox") is client
+    assert factory.call_count == 1
+    assert factory.call_args.kwargs["config"] == "config"
+    assert factory.call_args.kwargs["service_name"] == "mturk"
+
+    ### 2.
+    assert registry.get("key", "other secret", endpoint_url="https://sandbox") is not client
+    assert registry.get("key", "secret") is not client
+    assert factory.call_count == 3
+
+    ### 3.
+    now[0] = 100
+    assert registry.get("key", "secret", endpoint_url="https://sandbox") is client
+    now[0] = 200
+    assert registry.get("key", "secret", endpoint_url="https://sandbox") is not client
+    assert len(registry.clients) == 1
+
+
+def test_client_registry_config():
+    """
+    GIVEN a Flask application
+    WHEN its MTurk client is requested
+    THEN check if the client uses the configured pool and timeouts, without retries of its own
+    """
+    app = create_app(config["testing"])
+    with app.app_context():
+        client = mturk_clients.client("key", "secret")
+        assert mturk_clients.client("key", "secret") is client
+        assert client.meta.config.max_pool_connections == app.config["MTURK_POOL_SIZE"]
+        assert client.meta.config.connect_timeout == app.config["MTURK_CONNECT_TIMEOUT"]
+        assert client.meta.config.read_timeout == app.config["MTURK_READ_TIMEOUT"]
+        assert client.meta.config.retries == {"mode": "standard", "total_max_attempts": 1}